@@ -0,0 +1,128 @@
+"""
+Alarm Checkpoint - Periodic on-disk copy of the alarm engine's per-machine
+state, restored when the monitor starts
+
+Without it every restart begins from "all cleared": alarms still raised are
+reported again as new RAISED events, and alarms that cleared while the
+monitor was down are never closed. With the restored masks, each machine's
+first message after the restart is compared with what was reported before
+it, so only real transitions (including the CLEARED of anything that ended
+during the downtime) are emitted.
+
+maybe_save() is called on the MQTT thread after each message. At most once
+per `interval` seconds, and only when the state changed, it copies the
+masks (a few arrays and the machine list) and hands the copy to a
+background thread that writes it atomically as JSON.
+
+The checkpoint also records the sequence number of the last alarm event it
+includes, so events journaled after it (up to `interval` seconds before a
+crash) can be replayed onto the restored state.
+"""
+import json
+import os
+import threading
+import time
+
+
+class AlarmCheckpoint:
+    """Engine state checkpoint: load at startup, periodic background saves, final save on close"""
+
+    VERSION = 1
+
+    def __init__(self, engine, path, interval=5.0, sequence=lambda: 0):
+        self.engine = engine
+        self.sequence = sequence  # sequence() -> seq of the last event recorded
+        self.path = path
+        self.interval = interval
+        self._pending = None  # Latest state copy waiting to be written
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._copied_at = 0.0
+        self._version = None
+
+        self.saved = 0
+        self.saved_at = None  # time.time() of the last checkpoint written
+        self.failures = 0
+
+    def _state_version(self):
+        engine = self.engine
+        return engine.raw_transitions, engine.transitions, len(engine)
+
+    def load(self):
+        """Restore the engine from the checkpoint file
+
+        Returns (machines restored, seq of the last event included, age in
+        seconds), or None when there is no usable checkpoint.
+        """
+        try:
+            with open(self.path) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable alarm checkpoint {self.path}: {e}")
+            return None
+        if checkpoint.get("version") != self.VERSION:
+            print(f"⚠️  Ignoring alarm checkpoint {self.path} with version {checkpoint.get('version')}")
+            return None
+        machines = self.engine.restore(checkpoint["types"])
+        self._version = self._state_version()
+        return machines, checkpoint.get("seq", 0), time.time() - checkpoint.get("saved_at", time.time())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._writer_loop, name="alarm-checkpoint", daemon=True)
+        self._thread.start()
+        return self
+
+    def maybe_save(self, now=None):
+        """Queue a copy of the state if it changed and the interval has passed (call on the MQTT thread)"""
+        now = time.monotonic() if now is None else now
+        if now - self._copied_at < self.interval:
+            return
+        version = self._state_version()
+        if version == self._version:
+            return
+        self._copied_at = now
+        self._version = version
+        with self._lock:
+            self._pending = (self.engine.state(), self.sequence())
+        self._wake.set()
+
+    def _write(self, state, seq):
+        checkpoint = {"version": self.VERSION, "saved_at": time.time(), "seq": seq, "types": state}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.saved += 1
+        self.saved_at = checkpoint["saved_at"]
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        try:
+            self._write(*pending)
+        except OSError as e:
+            self.failures += 1
+            print(f"⚠️  Failed to write alarm checkpoint {self.path}: {e}")
+
+    def _writer_loop(self):
+        while not self._stop.is_set():
+            if self._wake.wait(1.0):
+                self._wake.clear()
+                self._flush()
+
+    def close(self):
+        """Write the final state (once updates have stopped) and stop the writer thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._state_version() != self._version:
+            with self._lock:
+                self._pending = (self.engine.state(), self.sequence())
+            self._version = self._state_version()
+        self._flush()
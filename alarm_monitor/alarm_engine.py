@@ -0,0 +1,401 @@
+"""
+Alarm Engine - Bitmask alarm transition detection driven by a registry of
+alarm types per machine type
+
+Each machine type's alarms get one bit each, in registry order. A payload is
+encoded into an integer bitmask once, and the transitions of a message are
+the set bits of (previous mask XOR new mask): no per-alarm dict lookups or
+state dict copies, and a message without transitions costs one comparison.
+
+Per-machine state is a compact array of masks (one unsigned 64-bit slot per
+machine, array('Q')) with a machine_id -> slot index, kept separately per
+machine type. Alarms missing from a payload count as cleared, as before; a
+payload with none of the type's alarms is ignored.
+
+Event dicts and WebSocket messages are built from per-alarm prefixes
+computed once from the registry, and only for the alarms that changed.
+
+Optionally the reported state is filtered (payload time in seconds, `now`):
+  debounce  - a change is only reported once the alarm has held its new value
+              for the alarm's minimum on (raise) or off (clear) time; shorter
+              pulses are never reported. The event keeps the time of the change.
+  flapping  - an alarm that changed `flap_transitions` times within
+              `flap_window` seconds is reported once as RAISED with
+              "flapping": true, and its changes are suppressed until it has
+              been stable for `flap_quiet` seconds. It is then cleared if it
+              settled off, and stays raised otherwise.
+Holds are checked when the machine's next message arrives. Only alarms with a
+change in progress have a timer; the rest cost the same XOR as without
+filtering.
+
+state() / restore() copy the masks in and out (alarm_checkpoint.py keeps them
+on disk), so a restarted monitor compares each machine's first message with
+what was reported before the restart instead of with "all cleared".
+"""
+import collections
+import json
+import time
+from array import array
+
+# machine type -> ((MQTT alarm name, alarm type shown in the UI), ...) in bit order
+ALARM_REGISTRY = {
+    "bottlefiller": (
+        ("Overfill", "AlarmOverfill"),
+        ("Underfill", "AlarmUnderfill"),
+        ("LowProductLevel", "AlarmLowProductLevel"),
+        ("CapMissing", "AlarmCapMissing"),
+    ),
+    "lathe": (
+        ("spindle_overload", "AlarmSpindleOverload"),
+        ("chuck_not_clamped", "AlarmChuckNotClamped"),
+        ("door_open", "AlarmDoorOpen"),
+        ("tool_wear", "AlarmToolWear"),
+        ("coolant_low", "AlarmCoolantLow"),
+    ),
+}
+
+MAX_ALARMS = 64  # Bits in one array('Q') slot
+STATES = ("CLEARED", "RAISED")
+
+# flaps > 0 marks the start of a flapping episode (the changes counted within the window)
+Transition = collections.namedtuple("Transition", "alarm raised timestamp flaps")
+
+
+def parse_debounce(spec):
+    """Parse "CapMissing=4,lathe.door_open=10" into {alarm name or machine_type.name: seconds}"""
+    durations = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        key, _, value = item.partition("=")
+        try:
+            seconds = float(value)
+        except ValueError:
+            seconds = -1.0
+        if not key.strip() or seconds < 0:
+            raise ValueError(f"Invalid alarm debounce '{item}' (use e.g. CapMissing=4,lathe.door_open=10)")
+        durations[key.strip()] = seconds
+    return durations
+
+
+def _remap(mask, remap):
+    """Move the bits of a saved mask to their current positions ((old bit, new bit) pairs)"""
+    converted = 0
+    for old, new in remap:
+        if mask & old:
+            converted |= new
+    return converted
+
+
+class AlarmDef:
+    """One registered alarm: its bit and the constant parts of its events and messages"""
+
+    __slots__ = ("machine_type", "name", "alarm_type", "bit", "mask", "min_on", "min_off", "_fields")
+
+    def __init__(self, machine_type, name, alarm_type, bit):
+        self.machine_type = machine_type
+        self.name = name  # MQTT name, e.g. "Overfill"
+        self.alarm_type = alarm_type  # UI name, e.g. "AlarmOverfill"
+        self.bit = bit
+        self.mask = 1 << bit
+        self.min_on = 0.0  # Seconds an alarm must stay raised before RAISED is reported
+        self.min_off = 0.0  # Seconds it must stay cleared before CLEARED is reported
+        # json.dumps() output of the message fields after machine_id, per state (index 0/1 = CLEARED/RAISED)
+        self._fields = tuple(
+            f', "alarm_name": {json.dumps(name)}, "alarm_type": {json.dumps(alarm_type)}, "state": "{state}", '
+            for state in STATES)
+
+    def event(self, machine_id, timestamp, raised, flaps=0):
+        """The event recorded in the journal and InfluxDB"""
+        event = {
+            "timestamp": timestamp,
+            "machine_id": machine_id,
+            "alarm_name": self.name,  # Original name from MQTT
+            "alarm_type": self.alarm_type,  # Mapped name for UI
+            "alarm_label": self.name,
+            "state": STATES[raised],
+            "value": raised,
+            "machine_type": self.machine_type,
+        }
+        if flaps:
+            event["flapping"] = True
+            event["flap_count"] = flaps
+        return event
+
+    def message(self, machine_id_json, timestamp_json, raised, flaps=0):
+        """The WebSocket message, byte for byte what json.dumps() gives for the same fields
+
+        machine_id_json and timestamp_json are already JSON encoded (once per
+        payload rather than once per alarm).
+        """
+        if flaps:
+            return (f'{{"machine_id": {machine_id_json}{self._fields[raised]}"timestamp": {timestamp_json}, '
+                    f'"flapping": true}}')
+        return f'{{"machine_id": {machine_id_json}{self._fields[raised]}"timestamp": {timestamp_json}}}'
+
+
+class AlarmTimer:
+    """Change in progress of one alarm of one machine (debounce hold and recent changes)"""
+
+    __slots__ = ("changed_at", "timestamp", "history")
+
+    def __init__(self):
+        self.changed_at = 0.0  # Payload time of the last change, seconds
+        self.timestamp = None  # Its timestamp as given to update(), used for the event
+        self.history = collections.deque()  # Payload times of the changes within the flap window
+
+
+class MachineTypeAlarms:
+    """Alarm bits and per-machine masks of one machine type"""
+
+    def __init__(self, machine_type, alarms):
+        if len(alarms) > MAX_ALARMS:
+            raise ValueError(f"{machine_type}: {len(alarms)} alarms registered, at most {MAX_ALARMS} fit a mask")
+        self.machine_type = machine_type
+        self.alarms = tuple(AlarmDef(machine_type, name, alarm_type, bit)
+                            for bit, (name, alarm_type) in enumerate(alarms))
+        self._encode = tuple((alarm.name, alarm.mask) for alarm in self.alarms)
+        self.slots = {}  # machine_id -> index into masks
+        self.masks = array("Q")  # Reported state
+        self.filtered = False  # Set by the engine when debounce or flap detection is on
+        self.raw = array("Q")  # Last payload, when filtering
+        self.flapping = array("Q")  # Alarms in a flapping episode, when filtering
+        self.timers = {}  # slot -> {alarm mask: AlarmTimer} for alarms with a change in progress
+
+    def encode(self, payload):
+        """Bitmask of the raised alarms in a payload, or None when it has none of this type's alarms"""
+        mask = 0
+        seen = False
+        for name, bit in self._encode:
+            if name in payload:
+                seen = True
+                if payload[name]:
+                    mask |= bit
+        return mask if seen else None
+
+    def slot(self, machine_id):
+        slot = self.slots.get(machine_id)
+        if slot is None:
+            slot = self.slots[machine_id] = len(self.masks)
+            self.masks.append(0)
+            if self.filtered:
+                self.raw.append(0)
+                self.flapping.append(0)
+        return slot
+
+    def get(self, machine_id):
+        slot = self.slots.get(machine_id)
+        return 0 if slot is None else self.masks[slot]
+
+    def decode(self, changed):
+        """AlarmDefs of the set bits, lowest bit (registry order) first"""
+        alarms = self.alarms
+        result = []
+        while changed:
+            low = changed & -changed
+            result.append(alarms[low.bit_length() - 1])
+            changed ^= low
+        return result
+
+
+class AlarmEngine:
+    """Registry-driven alarm state for every machine, one XOR per message
+
+    min_on / min_off are the default debounce times in seconds, overridden per
+    alarm by min_on_alarms / min_off_alarms ({"CapMissing": 4,
+    "lathe.door_open": 10}). flap_transitions=0 disables flap detection;
+    flap_quiet defaults to flap_window.
+    """
+
+    def __init__(self, registry=None, min_on=0.0, min_off=0.0, min_on_alarms=None, min_off_alarms=None,
+                 flap_transitions=0, flap_window=60.0, flap_quiet=None):
+        min_on_alarms = min_on_alarms or {}
+        min_off_alarms = min_off_alarms or {}
+        self.flap_transitions = flap_transitions
+        self.flap_window = flap_window
+        self.flap_quiet = flap_window if flap_quiet is None else flap_quiet
+        self.types = {}
+        for machine_type, alarms in (registry or ALARM_REGISTRY).items():
+            self.types[machine_type] = type_alarms = MachineTypeAlarms(machine_type, alarms)
+            for alarm in type_alarms.alarms:
+                key = f"{machine_type}.{alarm.name}"
+                alarm.min_on = float(min_on_alarms.get(key, min_on_alarms.get(alarm.name, min_on)))
+                alarm.min_off = float(min_off_alarms.get(key, min_off_alarms.get(alarm.name, min_off)))
+        self.filtered = flap_transitions > 0 or any(
+            alarm.min_on > 0 or alarm.min_off > 0 for alarms in self.types.values() for alarm in alarms.alarms)
+        for alarms in self.types.values():
+            alarms.filtered = self.filtered
+
+        self.messages = 0
+        self.raw_transitions = 0  # Changes seen in payloads
+        self.transitions = 0  # Transitions reported
+        self.flap_episodes = 0
+
+    def __getitem__(self, machine_type):
+        return self.types[machine_type]
+
+    def __len__(self):
+        return sum(len(alarms.slots) for alarms in self.types.values())
+
+    def update(self, machine_type, machine_id, payload, timestamp=None, now=None):
+        """Store a payload's alarms and return the Transitions to report, in registry order
+
+        timestamp is passed through to the Transitions; now is the payload time
+        in seconds (only used when filtering, default time.time()). Payloads
+        with none of the type's alarms leave the state as it was.
+        """
+        alarms = self.types[machine_type]
+        mask = alarms.encode(payload)
+        if mask is None:
+            return ()
+        self.messages += 1
+        slot = alarms.slot(machine_id)
+        if self.filtered:
+            return self._filter(alarms, slot, mask, timestamp, time.time() if now is None else now)
+        changed = alarms.masks[slot] ^ mask
+        if not changed:
+            return ()
+        alarms.masks[slot] = mask
+        count = bin(changed).count("1")
+        self.raw_transitions += count
+        self.transitions += count
+        return [Transition(alarm, bool(mask & alarm.mask), timestamp, 0) for alarm in alarms.decode(changed)]
+
+    def _filter(self, alarms, slot, mask, timestamp, now):
+        changed = alarms.raw[slot] ^ mask
+        timers = alarms.timers.get(slot)
+        if not changed and timers is None:
+            return ()
+        alarms.raw[slot] = mask
+        if timers is None:
+            timers = alarms.timers[slot] = {}
+        self.raw_transitions += bin(changed).count("1")
+
+        watched = changed
+        for bit in timers:
+            watched |= bit
+        reported = alarms.masks[slot]
+        flapping = alarms.flapping[slot]
+        flap_transitions = self.flap_transitions
+        horizon = now - self.flap_window
+        result = []
+        for alarm in alarms.decode(watched):
+            bit = alarm.mask
+            timer = timers.get(bit)
+            if changed & bit:
+                if timer is None:
+                    timer = timers[bit] = AlarmTimer()
+                timer.changed_at = now
+                timer.timestamp = timestamp
+                if flap_transitions:
+                    timer.history.append(now)
+            history = timer.history
+            while history and history[0] <= horizon:
+                history.popleft()
+            raised = bool(mask & bit)
+
+            if flapping & bit:
+                if now - timer.changed_at >= self.flap_quiet:
+                    # Stable again: the episode ends, clearing the alarm if it settled off
+                    flapping &= ~bit
+                    history.clear()
+                    if not raised:
+                        reported &= ~bit
+                        result.append(Transition(alarm, False, timer.timestamp, 0))
+            elif flap_transitions and len(history) >= flap_transitions:
+                flapping |= bit
+                reported |= bit
+                self.flap_episodes += 1
+                result.append(Transition(alarm, True, timestamp, len(history)))
+            elif (reported ^ mask) & bit and now - timer.changed_at >= (alarm.min_on if raised else alarm.min_off):
+                reported ^= bit
+                result.append(Transition(alarm, raised, timer.timestamp, 0))
+
+            if not (flapping & bit or (reported ^ mask) & bit or history):
+                del timers[bit]
+
+        if not timers:
+            del alarms.timers[slot]
+        alarms.masks[slot] = reported
+        alarms.flapping[slot] = flapping
+        self.transitions += len(result)
+        return result
+
+    def state(self):
+        """Copy of every machine's state for a checkpoint (call on the thread that runs update())
+
+        Timers of changes in progress are not included: after a restore a
+        pending debounce starts over with the next message.
+        """
+        state = {}
+        for machine_type, alarms in self.types.items():
+            state[machine_type] = {
+                "alarms": [alarm.name for alarm in alarms.alarms],
+                "machines": list(alarms.slots),  # In slot order
+                "masks": alarms.masks.tolist(),
+            }
+            if alarms.filtered:
+                state[machine_type]["raw"] = alarms.raw.tolist()
+                state[machine_type]["flapping"] = alarms.flapping.tolist()
+        return state
+
+    def restore(self, state):
+        """Load a state() copy before the first update, returning the number of machines restored
+
+        Bits are matched by alarm name, so alarms added to or removed from the
+        registry since the checkpoint are handled; unknown machine types are
+        skipped. Without raw masks (saved unfiltered) the reported state is
+        used for both.
+        """
+        restored = 0
+        for machine_type, saved in state.items():
+            alarms = self.types.get(machine_type)
+            if alarms is None:
+                continue
+            bits = {alarm.name: alarm.mask for alarm in alarms.alarms}
+            remap = [(1 << index, bits[name]) for index, name in enumerate(saved["alarms"]) if name in bits]
+
+            masks = saved["masks"]
+            raw = saved.get("raw", masks)
+            flapping = saved.get("flapping", [0] * len(masks))
+            for index, machine_id in enumerate(saved["machines"]):
+                slot = alarms.slot(machine_id)
+                alarms.masks[slot] = _remap(masks[index], remap)
+                if alarms.filtered:
+                    alarms.raw[slot] = _remap(raw[index], remap)
+                    alarms.flapping[slot] = _remap(flapping[index], remap)
+                restored += 1
+        return restored
+
+    def apply(self, machine_type, machine_id, name, raised, flapping=False):
+        """Set one alarm's reported state from a recorded event (replaying events newer than a checkpoint)"""
+        alarms = self.types.get(machine_type)
+        alarm = next((alarm for alarm in (alarms.alarms if alarms else ()) if alarm.name == name), None)
+        if alarm is None:
+            return
+        slot = alarms.slot(machine_id)
+        bit = alarm.mask
+        alarms.masks[slot] = alarms.masks[slot] | bit if raised else alarms.masks[slot] & ~bit
+        if alarms.filtered:
+            alarms.raw[slot] = alarms.raw[slot] | bit if raised else alarms.raw[slot] & ~bit
+            alarms.flapping[slot] = alarms.flapping[slot] | bit if flapping else alarms.flapping[slot] & ~bit
+
+    def active(self):
+        """(machine_id, AlarmDef) of every alarm currently reported raised"""
+        for alarms in self.types.values():
+            masks = alarms.masks
+            for machine_id, slot in alarms.slots.items():
+                if masks[slot]:
+                    for alarm in alarms.decode(masks[slot]):
+                        yield machine_id, alarm
+
+    def tracked(self, machine_type):
+        return [alarm.name for alarm in self.types[machine_type].alarms]
+
+    def stats(self):
+        return {
+            "machines": len(self),
+            "messages": self.messages,
+            "raw_transitions": self.raw_transitions,
+            "transitions": self.transitions,
+            "flap_episodes": self.flap_episodes,
+            "pending": sum(len(timers) for alarms in self.types.values() for timers in alarms.timers.values()),
+        }
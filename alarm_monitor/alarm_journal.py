@@ -0,0 +1,175 @@
+"""
+Alarm Journal - Append-only JSONL log of alarm events with an in-memory ring
+of the last N events
+
+append() writes one line to the journal and adds the event to the ring: O(1)
+per event instead of re-reading and re-writing the whole history. The journal
+is compacted to the last N events once it holds twice that many lines, and on
+startup only the journal is read back (one json.loads per line).
+
+The JSON array file the frontend and tools read (/tmp/alarm_events.json) is
+still produced, as a snapshot of the ring written by a background thread at
+most once per `snapshot_interval` seconds and only when something changed.
+When there is no journal yet (first start after upgrading) the existing
+snapshot is imported; backfill_alarm_events.py writes both files.
+"""
+import collections
+import json
+import os
+import threading
+
+
+def _write_atomic(path, write):
+    """Write a file through a temporary file so readers never see half of it"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def write_journal(path, events):
+    """Replace a journal file with the given events (one JSON object per line)"""
+    def write(f):
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+    _write_atomic(path, write)
+
+
+def read_journal(path):
+    """Events of a journal file, oldest first (empty when there is none), and the number of lines read"""
+    events = []
+    lines = 0
+    if not os.path.exists(path):
+        return events, lines
+    with open(path) as f:
+        for line in f:
+            lines += 1
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue  # Torn last line after a crash
+    return events, lines
+
+
+def _truncate_torn_line(path, block=4096):
+    """Cut a journal back to the end of its last complete line (a crash can leave half a line)"""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        keep = end
+        while keep > 0:
+            start = max(0, keep - block)
+            f.seek(start)
+            chunk = f.read(keep - start)
+            if keep == end and chunk.endswith(b"\n"):
+                return
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                keep = start + newline + 1
+                break
+            keep = start
+        f.truncate(keep)
+
+
+class AlarmJournal:
+    """Alarm event history: JSONL journal, ring buffer and periodic JSON snapshot"""
+
+    def __init__(self, journal_path, snapshot_path=None, max_events=1000, snapshot_interval=1.0):
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.max_events = max_events
+        self.snapshot_interval = snapshot_interval
+        self._events = collections.deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._file = None
+        self._lines = 0
+
+        self.appended = 0
+        self.compactions = 0
+        self.snapshots = 0
+
+    def open(self):
+        """Load history, open the journal for appending and start the snapshot thread"""
+        self._load()
+        self._file = open(self.journal_path, "a")
+        if self.snapshot_path:
+            self._dirty.set()
+            threading.Thread(target=self._snapshot_loop, name="alarm-snapshot", daemon=True).start()
+        return self
+
+    def _load(self):
+        if not os.path.exists(self.journal_path):
+            if self.snapshot_path and os.path.exists(self.snapshot_path):
+                # History written before the journal existed
+                try:
+                    with open(self.snapshot_path) as f:
+                        self._events.extend(json.load(f))
+                except (OSError, ValueError):
+                    pass
+                self._rewrite_journal()
+            return
+
+        _truncate_torn_line(self.journal_path)  # so the next append starts on a line of its own
+        events, self._lines = read_journal(self.journal_path)
+        self._events.extend(events)
+
+    def _rewrite_journal(self):
+        """Replace the journal with the events in the ring (caller holds the lock or is starting up)"""
+        write_journal(self.journal_path, self._events)
+        self._lines = len(self._events)
+
+    def append(self, event):
+        """Record one event: one journal line plus the ring, the snapshot follows asynchronously"""
+        if self._file is None:
+            self.open()
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            self._events.append(event)
+            self._file.write(line)
+            self._file.flush()
+            self._lines += 1
+            self.appended += 1
+            if self._lines >= 2 * self.max_events:
+                self._compact()
+        self._dirty.set()
+
+    def _compact(self):
+        self._file.close()
+        self._rewrite_journal()
+        self._file = open(self.journal_path, "a")
+        self.compactions += 1
+
+    def events(self):
+        """The last max_events events, oldest first"""
+        with self._lock:
+            return list(self._events)
+
+    def __len__(self):
+        return len(self._events)
+
+    def write_snapshot(self):
+        self._dirty.clear()
+        events = self.events()
+        _write_atomic(self.snapshot_path, lambda f: json.dump(events, f, indent=2))
+        self.snapshots += 1
+
+    def _snapshot_loop(self):
+        while not self._stop.is_set():
+            if self._dirty.wait(1.0) and not self._stop.is_set():
+                try:
+                    self.write_snapshot()
+                except OSError as e:
+                    print(f"⚠️  Failed to write alarm snapshot {self.snapshot_path}: {e}")
+                self._stop.wait(self.snapshot_interval)
+
+    def close(self):
+        """Write a final snapshot and close the journal"""
+        self._stop.set()
+        if self.snapshot_path and self._dirty.is_set():
+            self.write_snapshot()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
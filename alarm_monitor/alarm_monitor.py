@@ -4,12 +4,16 @@ Alarm Monitor - Subscribes to MQTT and tracks alarm state transitions
 Stores alarm events with timestamps for real-time display
 Broadcasts alarm changes via WebSocket for real-time UI notifications
 Saves alarm events to InfluxDB for persistent storage
+Serves the last 24h of alarm events from an in-memory index over HTTP
 """
 import asyncio
 import paho.mqtt.client as mqtt
 import json
+import logging
 import os
 import ssl
+import sys
+import time
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
@@ -18,11 +22,29 @@ from threading import Thread
 from influxdb_client import InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
 
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.log import Sampler, Throughput, get_logger
+from common.metrics import Registry, start_server
+from influxdb_writer.batch_writer import BatchWriter
+from influxdb_writer.spool import Spool
+from influxdb_writer.timestamps import TimestampParser
+from alarm_checkpoint import AlarmCheckpoint
+from alarm_engine import AlarmEngine, parse_debounce
+from alarm_journal import AlarmJournal
+from alarm_store import AlarmEventStore, start_api
+from ws_fanout import Fanout, Subscription
+
 # MQTT Configuration
 MQTT_BROKER = os.getenv("MQTT_BROKER_HOST", "localhost")
 MQTT_PORT = int(os.getenv("MQTT_BROKER_PORT", "8883"))
-MQTT_TOPIC_BOTTLEFILLER = os.getenv("MQTT_TOPIC_BOTTLEFILLER", "plc/+/bottlefiller/alarms")
-MQTT_TOPIC_LATHE = os.getenv("MQTT_TOPIC_LATHE", "plc/+/lathe/alarms")
+# Alarm source: "alarms" (the alarms sub-topics, timestamped on arrival) or "data" (the alarms object of the
+# full data payloads, timestamped by the producer; lets producers run with PUBLISH_SUBTOPICS=false)
+ALARM_SOURCE = os.getenv("ALARM_SOURCE", "alarms").lower()
+if ALARM_SOURCE not in ("alarms", "data"):
+    raise ValueError(f"Unknown ALARM_SOURCE '{ALARM_SOURCE}' (use alarms or data)")
+MQTT_TOPIC_BOTTLEFILLER = os.getenv("MQTT_TOPIC_BOTTLEFILLER", f"plc/+/bottlefiller/{ALARM_SOURCE}")
+MQTT_TOPIC_LATHE = os.getenv("MQTT_TOPIC_LATHE", f"plc/+/lathe/{ALARM_SOURCE}")
 MQTT_USERNAME = os.getenv("MQTT_USERNAME", "influxdb_writer")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", "influxdb_writer_pass")
 MQTT_TLS_ENABLED = os.getenv("MQTT_TLS_ENABLED", "true").lower() == "true"
@@ -32,10 +54,14 @@ MQTT_TLS_CHECK_HOSTNAME = os.getenv("MQTT_TLS_CHECK_HOSTNAME", "false").lower()
 # WebSocket Configuration
 WS_HOST = os.getenv("WS_HOST", "0.0.0.0")
 WS_PORT = int(os.getenv("WS_PORT", "8765"))
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "256"))  # messages buffered per client
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest").lower()  # drop_oldest | disconnect
 
-# Alarm event storage (for debugging/verification)
+# Alarm event storage: append-only journal, plus the JSON array snapshot read by the frontend
 ALARM_EVENTS_FILE = os.getenv("ALARM_EVENTS_FILE", "/tmp/alarm_events.json")
-MAX_EVENTS = 1000  # Keep last 1000 events
+ALARM_JOURNAL_FILE = os.getenv("ALARM_JOURNAL_FILE", "/tmp/alarm_events.jsonl")
+ALARM_SNAPSHOT_INTERVAL = float(os.getenv("ALARM_SNAPSHOT_INTERVAL", "1.0"))  # seconds between snapshot rewrites
+MAX_EVENTS = int(os.getenv("ALARM_MAX_EVENTS", "1000"))  # Keep last 1000 events
 
 # InfluxDB Configuration for alarm events
 INFLUXDB_URL = os.getenv("INFLUXDB_URL", "http://localhost:8086")
@@ -43,11 +69,100 @@ INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN", "my-super-secret-auth-token")
 INFLUXDB_ORG = os.getenv("INFLUXDB_ORG", "myorg")
 INFLUXDB_BUCKET_ALARMS = os.getenv("INFLUXDB_BUCKET_ALARMS", "alarm_events")  # Separate bucket for alarms
 
-# Track previous alarm states per machine
-previous_alarms = {}
+# Alarm events are written in batches from a background thread, never from the MQTT callback
+ALARM_WRITE_BATCH_SIZE = int(os.getenv("ALARM_WRITE_BATCH_SIZE", "200"))  # events per flush
+ALARM_WRITE_FLUSH_INTERVAL = float(os.getenv("ALARM_WRITE_FLUSH_INTERVAL", "0.5"))  # seconds
+ALARM_WRITE_QUEUE_SIZE = int(os.getenv("ALARM_WRITE_QUEUE_SIZE", "10000"))  # events buffered before dropping
+# Batches InfluxDB rejects are spooled here and retried every ALARM_SPOOL_RETRY_INTERVAL seconds ("" disables)
+ALARM_SPOOL_DIR = os.getenv("ALARM_SPOOL_DIR", "/tmp/alarm_monitor_spool")
+ALARM_SPOOL_RETRY_INTERVAL = float(os.getenv("ALARM_SPOOL_RETRY_INTERVAL", "5"))
+
+# Debounce: an alarm must hold its new value this many seconds before RAISED / CLEARED is reported,
+# per alarm as "CapMissing=4,lathe.door_open=10" (0 reports every change, as before)
+ALARM_MIN_ON = float(os.getenv("ALARM_MIN_ON", "0"))
+ALARM_MIN_OFF = float(os.getenv("ALARM_MIN_OFF", "0"))
+ALARM_MIN_ON_ALARMS = parse_debounce(os.getenv("ALARM_MIN_ON_ALARMS", ""))
+ALARM_MIN_OFF_ALARMS = parse_debounce(os.getenv("ALARM_MIN_OFF_ALARMS", ""))
+# Flapping: ALARM_FLAP_TRANSITIONS changes within ALARM_FLAP_WINDOW seconds become one flapping event,
+# until the alarm is stable for ALARM_FLAP_QUIET seconds (default: the window). 0 disables
+ALARM_FLAP_TRANSITIONS = int(os.getenv("ALARM_FLAP_TRANSITIONS", "0"))
+ALARM_FLAP_WINDOW = float(os.getenv("ALARM_FLAP_WINDOW", "60"))
+ALARM_FLAP_QUIET = float(os.getenv("ALARM_FLAP_QUIET") or ALARM_FLAP_WINDOW)
+
+# Per-machine alarm state checkpoint, restored at startup so restarts only emit real transitions ("" disables)
+ALARM_CHECKPOINT_FILE = os.getenv("ALARM_CHECKPOINT_FILE", "/tmp/alarm_state.json")
+ALARM_CHECKPOINT_INTERVAL = float(os.getenv("ALARM_CHECKPOINT_INTERVAL", "5"))  # seconds
+
+# Recent alarm events indexed in memory and served over HTTP, so dashboards don't query InfluxDB for them
+ALARM_STORE_RETENTION = float(os.getenv("ALARM_STORE_RETENTION", "86400"))  # seconds (24h)
+ALARM_STORE_MAX_EVENTS = int(os.getenv("ALARM_STORE_MAX_EVENTS", "1000000"))
+ALARM_STORE_WARMUP = os.getenv("ALARM_STORE_WARMUP", "true").lower() == "true"  # Load the retention from InfluxDB
+ALARM_API_PORT = int(os.getenv("ALARM_API_PORT", "8766"))  # 0 disables
+ALARM_API_HOST = os.getenv("ALARM_API_HOST", "0.0.0.0")
+
+# Prometheus metrics on http://<host>:<port>/metrics (0 disables)
+METRICS_PORT = int(os.getenv("ALARM_METRICS_PORT", "9109"))
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+
+# Leveled logging: alarm transitions at INFO, per-message detail at DEBUG, plus a throughput summary
+log = get_logger("alarm_monitor")
+sampler = Sampler(log)
+throughput = Throughput(log, "Alarm Monitor", counters=("messages", "transitions", "errors"),
+                        extra=lambda: f"{len(fanout)} WebSocket clients")
+
+metrics = Registry(service="alarm_monitor")
+messages_received = metrics.counter("alarm_monitor_messages_total", "MQTT alarm messages received")
+message_errors = metrics.counter("alarm_monitor_errors_total", "Alarm messages that could not be processed")
+transitions_total = metrics.counter("alarm_monitor_transitions_total", "Alarm state transitions", ("state",))
+parse_latency = metrics.histogram("alarm_monitor_parse_seconds", "Time to parse an alarm message and check transitions")
+influx_latency = metrics.histogram("alarm_monitor_influxdb_batch_write_seconds", "InfluxDB write latency per batch")
+influx_failures = metrics.counter("alarm_monitor_influxdb_write_failures_total",
+                                  "Alarm events lost: queue full, or rejected with no spool")
+influx_queue = metrics.gauge("alarm_monitor_influxdb_queue_depth", "Alarm events waiting to be written")
+ws_hellos = metrics.counter("alarm_monitor_websocket_hellos_total", "WebSocket hello/resume requests by reply",
+                            ("reply",))
+metrics.counter("alarm_monitor_raw_transitions_total", "Alarm changes seen in payloads, before debounce and "
+                "flap suppression").set_function(lambda: engine.raw_transitions)
+metrics.counter("alarm_monitor_flap_episodes_total", "Alarms reported as flapping").set_function(
+    lambda: engine.flap_episodes)
+metrics.gauge("alarm_monitor_store_events", "Alarm events held in the in-memory query store").set_function(
+    lambda: len(store))
+metrics.counter("alarm_monitor_store_queries_total", "Queries answered by the alarm event API").set_function(
+    lambda: store.queries)
+metrics.counter("alarm_monitor_checkpoints_total", "Alarm state checkpoints written").set_function(
+    lambda: checkpoint.saved if checkpoint is not None else 0)
+mqtt_reconnects = metrics.counter("alarm_monitor_mqtt_reconnects_total", "MQTT reconnections after the first connect")
+metrics.counter("alarm_monitor_broadcast_failures_total", "WebSocket sends that failed").set_function(
+    lambda: fanout.send_failures)
+metrics.counter("alarm_monitor_broadcast_dropped_total", "Messages dropped for slow WebSocket clients").set_function(
+    lambda: fanout.dropped)
+metrics.counter("alarm_monitor_slow_client_disconnects_total", "WebSocket clients disconnected for being too slow"
+                ).set_function(lambda: fanout.disconnected)
+metrics.gauge("alarm_monitor_websocket_queued", "Messages queued for WebSocket clients").set_function(
+    lambda: fanout.stats()["queued"])
+metrics.gauge("alarm_monitor_websocket_clients", "Connected WebSocket clients").set_function(lambda: len(fanout))
+metrics.gauge("alarm_monitor_websocket_subscribed_clients", "WebSocket clients with a subscription filter"
+              ).set_function(lambda: fanout.stats()["subscribed"])
 
-# WebSocket connected clients
-connected_clients = set()
+journal = AlarmJournal(ALARM_JOURNAL_FILE, ALARM_EVENTS_FILE, MAX_EVENTS, ALARM_SNAPSHOT_INTERVAL)
+store = AlarmEventStore(ALARM_STORE_RETENTION, ALARM_STORE_MAX_EVENTS)
+
+# Previous alarm states per machine, as bitmasks
+engine = AlarmEngine(min_on=ALARM_MIN_ON, min_off=ALARM_MIN_OFF, min_on_alarms=ALARM_MIN_ON_ALARMS,
+                     min_off_alarms=ALARM_MIN_OFF_ALARMS, flap_transitions=ALARM_FLAP_TRANSITIONS,
+                     flap_window=ALARM_FLAP_WINDOW, flap_quiet=ALARM_FLAP_QUIET)
+_mqtt_connects = 0
+timestamps = TimestampParser()
+alarm_seq = 0  # Sequence number of the last recorded alarm event (continues from the journal)
+checkpoint = (AlarmCheckpoint(engine, ALARM_CHECKPOINT_FILE, ALARM_CHECKPOINT_INTERVAL, lambda: alarm_seq)
+              if ALARM_CHECKPOINT_FILE else None)
+
+# WebSocket connected clients, each with its own bounded queue and sender task
+def log_broadcast_error(e):
+    if sampler.enabled("broadcast_error", logging.WARNING):
+        log.warning("⚠️  Error broadcasting to client: %s", e)
+
+fanout = Fanout(WS_CLIENT_QUEUE_SIZE, WS_SLOW_CLIENT_POLICY, on_error=log_broadcast_error, history=MAX_EVENTS)
 
 # Global event loop for WebSocket (will be set in main)
 ws_loop = None
@@ -55,22 +170,33 @@ ws_loop = None
 # InfluxDB client for alarm events (will be initialized in main)
 _influx_client = None
 _influx_write_api = None
+_alarm_writer = None
 
 def load_alarm_events():
-    """Load alarm events from file"""
-    if os.path.exists(ALARM_EVENTS_FILE):
-        try:
-            with open(ALARM_EVENTS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
+    """Last MAX_EVENTS alarm events, oldest first (from the in-memory ring)"""
+    return journal.events()
+
+def create_alarm_writer():
+    """Background batch writer (with spool and retry) for the alarm events bucket"""
+    spool = Spool(os.path.join(ALARM_SPOOL_DIR, INFLUXDB_BUCKET_ALARMS)) if ALARM_SPOOL_DIR else None
+    writer = BatchWriter(
+        lambda records, precision: _influx_write_api.write(
+            bucket=INFLUXDB_BUCKET_ALARMS, record=records, write_precision=precision),
+        batch_size=ALARM_WRITE_BATCH_SIZE,
+        flush_interval=ALARM_WRITE_FLUSH_INTERVAL,
+        max_queue=ALARM_WRITE_QUEUE_SIZE,
+        max_block=0,  # Never hold up transition detection and broadcasts
+        name=INFLUXDB_BUCKET_ALARMS,
+        spool=spool,
+        retry_interval=ALARM_SPOOL_RETRY_INTERVAL,
+        on_flush=lambda points, seconds: influx_latency.observe(seconds),
+    ).start()
+    influx_queue.set_function(lambda: writer.queue_depth)
+    return writer
 
 def save_alarm_to_influxdb(event):
-    """Save alarm event to InfluxDB for persistent storage"""
-    global _influx_write_api
-    
-    if _influx_write_api is None:
+    """Queue alarm event for InfluxDB (written in batches by a background thread)"""
+    if _alarm_writer is None:
         return  # InfluxDB not initialized, skip silently
     
     try:
@@ -86,210 +212,259 @@ def save_alarm_to_influxdb(event):
             .field("value", event["value"]) \
             .field("alarm_label", event.get("alarm_label", event["alarm_type"])) \
             .time(timestamp)
+        if event.get("flapping"):
+            point.field("flapping", True).field("flap_count", event["flap_count"])
         
-        # Write to InfluxDB
-        _influx_write_api.write(bucket=INFLUXDB_BUCKET_ALARMS, record=point)
-        print(f"💾 Saved alarm event to InfluxDB: {event['machine_id']} - {event['alarm_type']} ({event['state']})")
+        if not _alarm_writer.submit(point):
+            influx_failures.inc()
+            if sampler.enabled("influx_dropped", logging.WARNING):
+                log.warning("⚠️  Alarm write queue full (%d events), dropping event", _alarm_writer.max_queue)
+            return
+        log.debug("💾 Queued alarm event for InfluxDB: %s - %s (%s)",
+                  event['machine_id'], event['alarm_type'], event['state'])
     except Exception as e:
-        print(f"⚠️  Error saving alarm to InfluxDB: {e}")
+        influx_failures.inc()
+        log.warning("⚠️  Error saving alarm to InfluxDB: %s", e)
 
 def save_alarm_event(event):
-    """Save alarm event to file (append) - for debugging/verification"""
-    events = load_alarm_events()
-    events.append(event)
-    
-    # Keep only last MAX_EVENTS
-    if len(events) > MAX_EVENTS:
-        events = events[-MAX_EVENTS:]
-    
-    with open(ALARM_EVENTS_FILE, 'w') as f:
-        json.dump(events, f, indent=2)
+    """Number the alarm event and append it to the journal (the JSON snapshot is refreshed in the background)"""
+    global alarm_seq
+    alarm_seq += 1
+    event["seq"] = alarm_seq
+    journal.append(event)
+    store.add(event)
     
     # Also save to InfluxDB for persistent storage
     save_alarm_to_influxdb(event)
 
-async def broadcast_alarm(message):
-    """Broadcast alarm event to all connected WebSocket clients"""
-    if connected_clients:
-        # Create tasks for all clients
-        disconnected = set()
-        for client in connected_clients:
-            try:
-                await client.send(message)
-            except websockets.exceptions.ConnectionClosed:
-                disconnected.add(client)
-            except Exception as e:
-                print(f"⚠️  Error broadcasting to client: {e}")
-                disconnected.add(client)
-        
-        # Remove disconnected clients
-        connected_clients.difference_update(disconnected)
+def warm_alarm_store():
+    """Load the store's retention window from the alarm events bucket (runs in a background thread)
 
-def check_alarm_transitions(machine_id, alarms, timestamp, machine_type="bottlefiller"):
-    """Check for alarm state transitions and record events"""
-    global previous_alarms
-    
-    # Map alarm names from MQTT to display names based on machine type
-    if machine_type == "lathe":
-        alarm_map = {
-            "spindle_overload": "AlarmSpindleOverload",
-            "chuck_not_clamped": "AlarmChuckNotClamped",
-            "door_open": "AlarmDoorOpen",
-            "tool_wear": "AlarmToolWear",
-            "coolant_low": "AlarmCoolantLow",
-        }
-    else:  # bottlefiller
-        alarm_map = {
-            "Overfill": "AlarmOverfill",
-            "Underfill": "AlarmUnderfill",
-            "LowProductLevel": "AlarmLowProductLevel",
-            "CapMissing": "AlarmCapMissing",
-        }
-    
-    # Get previous state for this machine
-    prev = previous_alarms.get(machine_id, {})
-    
-    # Check each alarm for transitions
-    for alarm_key, alarm_name in alarm_map.items():
-        current_value = alarms.get(alarm_key, False)
-        prev_value = prev.get(alarm_key, False)
-        
-        # Detect transition: false -> true (alarm raised)
-        if not prev_value and current_value:
-            event = {
-                "timestamp": timestamp,
-                "machine_id": machine_id,
-                "alarm_name": alarm_key,  # Original name from MQTT
-                "alarm_type": alarm_name,  # Mapped name for UI
-                "alarm_label": alarm_key,
-                "state": "RAISED",
-                "value": True
-            }
-            save_alarm_event(event)  # Keep for debugging
-            
-            # Broadcast via WebSocket
-            ws_message = json.dumps({
-                "machine_id": machine_id,
-                "alarm_name": alarm_key,
-                "alarm_type": alarm_name,
-                "state": "RAISED",
-                "timestamp": timestamp
-            })
-            if ws_loop is not None:
-                asyncio.run_coroutine_threadsafe(broadcast_alarm(ws_message), ws_loop)
-            
-            print(f"🚨 ALARM RAISED: {machine_id} - {alarm_name} at {timestamp}")
-        
-        # Detect transition: true -> false (alarm cleared)
-        elif prev_value and not current_value:
+    Until it finishes the store only covers the journal, and queries for
+    older ranges report "complete": false so the frontend asks InfluxDB.
+    """
+    started = time.time() - store.retention
+    query = f'''
+from(bucket: "{INFLUXDB_BUCKET_ALARMS}")
+  |> range(start: -{int(store.retention)}s)
+  |> filter(fn: (r) => r["_measurement"] == "alarm_events")
+  |> pivot(rowKey: ["_time", "machine_id", "alarm_type", "alarm_name", "state"],
+           columnKey: ["_field"], valueColumn: "_value")
+  |> keep(columns: ["_time", "machine_id", "alarm_type", "alarm_name", "state", "value", "alarm_label",
+                    "flapping", "flap_count"])
+'''
+    try:
+        loaded = 0
+        for record in _influx_client.query_api().query_stream(query, org=INFLUXDB_ORG):
+            values = record.values
             event = {
-                "timestamp": timestamp,
-                "machine_id": machine_id,
-                "alarm_name": alarm_key,
-                "alarm_type": alarm_name,
-                "alarm_label": alarm_key,
-                "state": "CLEARED",
-                "value": False
+                "timestamp": values["_time"].astimezone(timezone.utc).replace(tzinfo=None).isoformat() + "Z",
+                "machine_id": values.get("machine_id"),
+                "alarm_name": values.get("alarm_name"),
+                "alarm_type": values.get("alarm_type"),
+                "alarm_label": values.get("alarm_label") or values.get("alarm_name"),
+                "state": values.get("state"),
+                "value": values.get("value"),
             }
-            save_alarm_event(event)  # Keep for debugging
-            
-            # Broadcast via WebSocket
-            ws_message = json.dumps({
-                "machine_id": machine_id,
-                "alarm_name": alarm_key,
-                "alarm_type": alarm_name,
-                "state": "CLEARED",
-                "timestamp": timestamp
-            })
-            if ws_loop is not None:
-                asyncio.run_coroutine_threadsafe(broadcast_alarm(ws_message), ws_loop)
-            
-            print(f"✅ ALARM CLEARED: {machine_id} - {alarm_name} at {timestamp}")
+            if values.get("flapping"):
+                event["flapping"] = True
+                event["flap_count"] = values.get("flap_count")
+            loaded += store.add(event)
+    except Exception as e:
+        log.warning("⚠️  Alarm store warm-up from InfluxDB failed, serving the journal window only: %s", e)
+        return
+    store.complete_since = min(store.complete_since, started)
+    log.info("🗂️  Alarm store warmed up with %s events from %s (%s held)", loaded, INFLUXDB_BUCKET_ALARMS, len(store))
+
+def broadcast_alarm(message, event):
+    """Queue a serialized alarm message for the WebSocket clients subscribed to it (callable from any thread)"""
+    if ws_loop is not None:
+        fanout.publish_threadsafe(ws_loop, message, event)
+
+def restore_alarm_state(events):
+    """Load the state checkpoint, replay the journaled events it missed, and return the raised alarms
+
+    The raised alarms are the journal's latest RAISED event of each, so the
+    WebSocket snapshot includes alarms that are not raised again after the
+    restart (the engine no longer reports them as new).
+    """
+    restored = checkpoint.load() if checkpoint is not None else None
+    if restored is None:
+        return []
+    machines, seq, age = restored
+    replayed = 0
+    latest = {}
+    for event in events:
+        key = (event.get("machine_id"), event.get("alarm_name"))
+        latest[key] = event
+        if (event.get("seq") or 0) > seq and event.get("machine_type") in engine.types:
+            engine.apply(event["machine_type"], event["machine_id"], event["alarm_name"],
+                         event.get("state") == "RAISED", bool(event.get("flapping")))
+            replayed += 1
+    active = []
+    for machine_id, alarm in engine.active():
+        event = latest.get((machine_id, alarm.name))
+        active.append(event if event is not None and event.get("state") == "RAISED"
+                      else alarm.event(machine_id, None, True))
+    print(f"♻️  Restored alarm state of {machines} machines from {ALARM_CHECKPOINT_FILE} ({age:.0f}s old, "
+          f"{replayed} newer events replayed): {len(active)} alarms raised")
+    return active
+
+def check_alarm_transitions(machine_id, payload, timestamp, machine_type="bottlefiller", now=None):
+    """Check for alarm state transitions and record events (one XOR against the machine's previous mask)"""
+    transitions = engine.update(machine_type, machine_id, payload, timestamp, now)
+    if not transitions:
+        return
     
-    # Update previous state
-    previous_alarms[machine_id] = alarms.copy()
+    # Encoded once per message, shared by every transition's WebSocket message
+    machine_id_json = json.dumps(machine_id)
+    timestamp_json = json.dumps(timestamp)
+    for alarm, raised, changed_at, flaps in transitions:
+        # Debounced transitions keep the time the alarm changed
+        event = alarm.event(machine_id, changed_at, raised, flaps)
+        save_alarm_event(event)
+        broadcast_alarm(alarm.message(machine_id_json, timestamp_json if changed_at is timestamp
+                                      else json.dumps(changed_at), raised, flaps), event)
+        
+        throughput.add("transitions")
+        transitions_total.labels(event["state"]).inc()
+        if flaps:
+            log.info("🔁 ALARM FLAPPING: %s - %s (%s changes in %gs) at %s",
+                     machine_id, alarm.alarm_type, flaps, ALARM_FLAP_WINDOW, changed_at)
+        elif raised:
+            log.info("🚨 ALARM RAISED: %s - %s at %s", machine_id, alarm.alarm_type, changed_at)
+        else:
+            log.info("✅ ALARM CLEARED: %s - %s at %s", machine_id, alarm.alarm_type, changed_at)
+
+def producer_timestamp(value, producer):
+    """Event timestamp ("...Z", like the alarms topic ones) and epoch seconds of a payload timestamp
+
+    Missing or unparseable timestamps fall back to the current time.
+    """
+    micros = timestamps.parse(value, producer, "us")
+    if isinstance(value, str) and value.endswith("+00:00") and len(value) > 19:
+        return value[:-6] + "Z", micros / 1_000_000  # mock_plc_agent and lathe_sim
+    if isinstance(value, str) and value.endswith("Z") and len(value) > 19:
+        return value, micros / 1_000_000
+    utc = datetime.fromtimestamp(micros / 1_000_000, timezone.utc)
+    return utc.replace(tzinfo=None).isoformat() + "Z", micros / 1_000_000
 
 def on_connect(client, userdata, flags, rc):
+    global _mqtt_connects
     if rc == 0:
-        print(f"✅ Connected to MQTT broker")
+        if _mqtt_connects:
+            mqtt_reconnects.inc()
+        _mqtt_connects += 1
+        log.info("✅ Connected to MQTT broker")
         client.subscribe(MQTT_TOPIC_BOTTLEFILLER)
         client.subscribe(MQTT_TOPIC_LATHE)
-        print(f"📡 Subscribed to: {MQTT_TOPIC_BOTTLEFILLER} (bottlefiller)")
-        print(f"📡 Subscribed to: {MQTT_TOPIC_LATHE} (lathe)\n")
+        log.info("📡 Subscribed to: %s (bottlefiller)", MQTT_TOPIC_BOTTLEFILLER)
+        log.info("📡 Subscribed to: %s (lathe)\n", MQTT_TOPIC_LATHE)
     else:
-        print(f"❌ Failed to connect, return code {rc}")
+        log.error("❌ Failed to connect, return code %s", rc)
 
 def on_message(client, userdata, msg):
+    started = time.perf_counter()
+    throughput.add("messages")
+    messages_received.inc()
     try:
         payload = json.loads(msg.payload.decode())
         topic = msg.topic
+        log.debug("📨 Received alarms on topic: %s", topic)
         
         # Determine machine type from topic
-        machine_type = "lathe" if "/lathe/alarms" in topic else "bottlefiller"
+        machine_type = "lathe" if "/lathe/" in topic else "bottlefiller"
         
-        # Extract machine_id from topic: plc/{machine_id}/bottlefiller/alarms or plc/{machine_id}/lathe/alarms
+        # Extract machine_id from topic: plc/{machine_id}/bottlefiller/alarms or plc/{machine_id}/lathe/data
         parts = topic.split('/')
         if len(parts) >= 2:
             machine_id = parts[1]
         else:
             machine_id = "unknown"
         
-        # Get timestamp (alarms topic doesn't have timestamp, use current time)
-        # Use ISO format with Z suffix (UTC timezone indicator)
-        # Remove timezone info before adding Z to avoid +00:00Z (invalid format)
-        utc_now = datetime.now(timezone.utc)
-        timestamp = utc_now.replace(tzinfo=None).isoformat() + "Z"
-        
-        # Payload from alarms topic is directly the alarms object
-        alarms = {}
-        
-        if machine_type == "lathe":
-            # Map lathe alarm names from MQTT to our tracking format
-            if "spindle_overload" in payload:
-                alarms["spindle_overload"] = payload["spindle_overload"]
-            if "chuck_not_clamped" in payload:
-                alarms["chuck_not_clamped"] = payload["chuck_not_clamped"]
-            if "door_open" in payload:
-                alarms["door_open"] = payload["door_open"]
-            if "tool_wear" in payload:
-                alarms["tool_wear"] = payload["tool_wear"]
-            if "coolant_low" in payload:
-                alarms["coolant_low"] = payload["coolant_low"]
-        else:  # bottlefiller
-            # Map alarm names from MQTT to our tracking format
-            if "LowProductLevel" in payload:
-                alarms["LowProductLevel"] = payload["LowProductLevel"]
-            if "Overfill" in payload:
-                alarms["Overfill"] = payload["Overfill"]
-            if "Underfill" in payload:
-                alarms["Underfill"] = payload["Underfill"]
-            if "CapMissing" in payload:
-                alarms["CapMissing"] = payload["CapMissing"]
-        # NoBottle is in MQTT but we don't track it
+        if topic.endswith("/data"):
+            # Full data payload: the alarms are nested, and the producer timestamped it
+            alarms = payload.get("alarms") if isinstance(payload, dict) else None
+            if not alarms:
+                return  # e.g. edge gateway data, which carries no alarms
+            timestamp, now = producer_timestamp(payload.get("timestamp"), machine_type)
+            payload = alarms
+        else:
+            # Get timestamp (alarms topic doesn't have timestamp, use current time)
+            # Use ISO format with Z suffix (UTC timezone indicator)
+            # Remove timezone info before adding Z to avoid +00:00Z (invalid format)
+            utc_now = datetime.now(timezone.utc)
+            timestamp = utc_now.replace(tzinfo=None).isoformat() + "Z"
+            now = utc_now.timestamp()
         
-        # Check for alarm transitions
-        if alarms:
-            check_alarm_transitions(machine_id, alarms, timestamp, machine_type)
+        # The engine reads the registered alarms of this machine type from the alarms object
+        # (NoBottle is in MQTT but not tracked)
+        check_alarm_transitions(machine_id, payload, timestamp, machine_type, now)
+        if checkpoint is not None:
+            checkpoint.maybe_save()
+        parse_latency.observe(time.perf_counter() - started)
             
     except json.JSONDecodeError:
-        pass
+        throughput.add("errors")
+        message_errors.inc()
     except Exception as e:
-        print(f"❌ Error processing message: {e}")
+        throughput.add("errors")
+        message_errors.inc()
+        if sampler.enabled("errors", logging.ERROR):
+            log.error("❌ Error processing message: %s", e)
 
 # WebSocket server handler
+def handle_client_message(websocket, raw):
+    """Apply a message sent by a WebSocket client
+
+    {"type": "subscribe", "machine_ids": [...], "machine_types": [...], "alarm_types": [...], "states": [...]}
+    narrows the alarms this client receives (omitted fields match anything);
+    {"type": "unsubscribe"} goes back to receiving every alarm.
+    {"type": "hello"} switches to sequenced alarms and sends the raised alarms;
+    with "last_seq": N (or as {"type": "resume", "last_seq": N}) it sends the
+    alarms after N instead (or the raised alarms when N is too old). Both
+    accept the subscribe fields too.
+    """
+    try:
+        message = json.loads(raw)
+        if not isinstance(message, dict):
+            raise ValueError("expected a JSON object")
+        kind = message.get("type")
+        if kind == "subscribe":
+            subscription = Subscription.from_message(message)
+            fanout.subscribe(websocket, subscription)
+            log.info("🔎 WebSocket client subscribed: %s", subscription.to_dict())
+        elif kind == "unsubscribe":
+            fanout.subscribe(websocket, None)
+        elif kind in ("hello", "resume"):
+            last_seq = message.get("last_seq")
+            if last_seq is not None and (not isinstance(last_seq, int) or isinstance(last_seq, bool)):
+                raise ValueError("'last_seq' must be an integer")
+            if any(field in message for field in Subscription.FIELDS):
+                fanout.subscribe(websocket, Subscription.from_message(message))
+            reply = fanout.hello(websocket, last_seq)
+            ws_hellos.labels(reply).inc()
+            log.info("👋 WebSocket client %s (last_seq %s): sent %s up to seq %s", kind, last_seq, reply, fanout.seq)
+        else:
+            raise ValueError(f"unknown message type {kind!r}")
+    except ValueError as e:
+        if sampler.enabled("client_message", logging.WARNING):
+            log.warning("⚠️  Ignoring WebSocket client message: %s", e)
+
 async def websocket_handler(websocket, path=None):
     """Handle new WebSocket connection"""
-    connected_clients.add(websocket)
-    print(f"🔌 WebSocket client connected. Total clients: {len(connected_clients)}")
+    fanout.register(websocket)
+    log.info("🔌 WebSocket client connected. Total clients: %s", len(fanout))
     
     try:
-        # Keep connection alive
-        await websocket.wait_closed()
+        # Every client receives all alarms until it subscribes
+        async for raw in websocket:
+            handle_client_message(websocket, raw)
     except websockets.exceptions.ConnectionClosed:
         pass
     finally:
-        connected_clients.remove(websocket)
-        print(f"🔌 WebSocket client disconnected. Total clients: {len(connected_clients)}")
+        fanout.unregister(websocket)
+        log.info("🔌 WebSocket client disconnected. Total clients: %s", len(fanout))
 
 async def start_websocket_server():
     """Start WebSocket server"""
@@ -327,10 +502,17 @@ if MQTT_TLS_ENABLED:
 if __name__ == "__main__":
     print("🚨 Alarm Monitor starting...")
     print(f"🔗 Connecting to {MQTT_BROKER}:{MQTT_PORT}")
-    print(f"📡 Topics: {MQTT_TOPIC_BOTTLEFILLER} and {MQTT_TOPIC_LATHE}")
-    print(f"💾 Events file: {ALARM_EVENTS_FILE} (for debugging)")
+    print(f"📡 Topics: {MQTT_TOPIC_BOTTLEFILLER} and {MQTT_TOPIC_LATHE} (source: {ALARM_SOURCE})")
+    print(f"💾 Events file: {ALARM_EVENTS_FILE} (snapshot, journal: {ALARM_JOURNAL_FILE})")
     print(f"🌐 WebSocket: ws://{WS_HOST}:{WS_PORT}")
-    print(f"⚠️  Tracking: Overfill, Underfill, LowProductLevel, CapMissing\n")
+    for machine_type in engine.types:
+        print(f"⚠️  Tracking ({machine_type}): {', '.join(engine.tracked(machine_type))}")
+    if engine.filtered:
+        print(f"⏱️  Debounce: on {ALARM_MIN_ON:g}s / off {ALARM_MIN_OFF:g}s "
+              f"({len(ALARM_MIN_ON_ALARMS) + len(ALARM_MIN_OFF_ALARMS)} overrides), flapping: "
+              + (f"{ALARM_FLAP_TRANSITIONS} changes in {ALARM_FLAP_WINDOW:g}s, quiet {ALARM_FLAP_QUIET:g}s"
+                 if ALARM_FLAP_TRANSITIONS else "off"))
+    print()
     
     # Initialize InfluxDB client for alarm events
     print(f"🔗 Connecting to InfluxDB for alarm storage...")
@@ -341,28 +523,63 @@ if __name__ == "__main__":
             org=INFLUXDB_ORG
         )
         _influx_write_api = _influx_client.write_api(write_options=SYNCHRONOUS)
+        _alarm_writer = create_alarm_writer()
         print(f"✅ Connected to InfluxDB")
-        print(f"   Bucket: {INFLUXDB_BUCKET_ALARMS}\n")
+        print(f"   Bucket: {INFLUXDB_BUCKET_ALARMS} (batches of {ALARM_WRITE_BATCH_SIZE} or every "
+              f"{ALARM_WRITE_FLUSH_INTERVAL}s, spool: {ALARM_SPOOL_DIR or 'disabled'})\n")
     except Exception as e:
         print(f"⚠️  InfluxDB connection error (alarms will still be saved to file): {e}")
         print(f"   Continuing without InfluxDB storage...\n")
         _influx_client = None
         _influx_write_api = None
+        _alarm_writer = None
+    
+    journal.open()
+    events = journal.events()
+    alarm_seq = max((event.get("seq") or 0 for event in events), default=0)
+    print(f"📒 Loaded {len(journal)} alarm events from the journal (last seq {alarm_seq})")
+    fanout.restore(events, restore_alarm_state(events))
+    store.seed(events)
+    if checkpoint is not None:
+        checkpoint.start()
+    print()
     
     # Start WebSocket server in a separate thread
     ws_thread = Thread(target=run_websocket_server, daemon=True)
     ws_thread.start()
     
     # Give WebSocket server time to start
-    import time
     time.sleep(1)
     
+    throughput.start()
+    if METRICS_PORT:
+        try:
+            start_server(metrics, METRICS_PORT, METRICS_HOST)
+            print(f"📈 Metrics: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️  Metrics endpoint on port {METRICS_PORT} unavailable: {e}")
+    if ALARM_API_PORT:
+        try:
+            start_api(store, ALARM_API_PORT, ALARM_API_HOST)
+            print(f"🔎 Alarm event API: http://{ALARM_API_HOST}:{ALARM_API_PORT}/events "
+                  f"({ALARM_STORE_RETENTION / 3600:g}h retention)")
+        except OSError as e:
+            print(f"⚠️  Alarm event API on port {ALARM_API_PORT} unavailable: {e}")
+    if ALARM_STORE_WARMUP and _influx_client is not None:
+        Thread(target=warm_alarm_store, name="alarm-store-warmup", daemon=True).start()
+    
     try:
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
         client.loop_forever()
     except KeyboardInterrupt:
         print("\n🛑 Stopping alarm monitor...")
         client.disconnect()
+        journal.close()
+        if checkpoint is not None:
+            checkpoint.close()
+        if _alarm_writer is not None:
+            print(f"⏳ Flushing {_alarm_writer.queue_depth} queued alarm events...")
+            _alarm_writer.close()
     except Exception as e:
         print(f"❌ Error: {e}")
         exit(1)
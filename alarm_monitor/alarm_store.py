@@ -0,0 +1,368 @@
+"""
+Alarm Event Store - Time-ordered in-memory index of recent alarm events with a
+small HTTP query API
+
+Every recorded event is kept for `retention` seconds (24h by default) in
+time-sorted arrays: one for all events, one per machine, one per alarm type
+and one per (machine, alarm type). A query picks the most selective index,
+finds the range with two binary searches and only then applies the state
+filter, offset and limit, so recent-history queries never touch InfluxDB.
+
+The store only knows what the monitor saw: it is seeded from the journal at
+startup (and optionally warmed up from the alarm events bucket), and
+`complete_since` is the time from which it has every event. Responses say
+whether the requested range is covered ("complete"), so callers fall back
+to InfluxDB for older ranges.
+
+HTTP API (GET, JSON):
+  /events     start, end, machine_id, alarm_type, state, limit, offset, order
+              -> {"events": [...], "total", "offset", "limit", "complete", "complete_since"}
+  /durations  start, end, machine_id, alarm_type
+              -> {"durations": [{"machine_id", "alarm_type", "episodes", "active_seconds",
+                                 "active", "active_since"}, ...], "complete", "complete_since"}
+  /stats      -> event counts, index sizes, coverage
+start / end are ISO 8601 or relative ("-24h", "-30m", "-7d"); machine_id,
+alarm_type (type or MQTT name) and state may be repeated or comma separated.
+"""
+import bisect
+import heapq
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+RELATIVE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+MAX_LIMIT = 10000
+
+
+def event_time(timestamp):
+    """Epoch seconds of an event timestamp ("2024-01-01T12:00:00.123456Z"), None if it has none"""
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except (ValueError, AttributeError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def iso(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def parse_time(value, now=None):
+    """Epoch seconds of an ISO 8601 time or a relative one ("-24h"), raising ValueError"""
+    value = value.strip()
+    if value.lower() in ("now", "now()"):
+        return time.time() if now is None else now
+    if value.startswith("-") and value[-1:] in RELATIVE_UNITS:
+        return (time.time() if now is None else now) - float(value[1:-1]) * RELATIVE_UNITS[value[-1]]
+    seconds = event_time(value)
+    if seconds is None:
+        raise ValueError(f"invalid time '{value}'")
+    return seconds
+
+
+class TimeIndex:
+    """Events sorted by time; expired ones are dropped from the front"""
+
+    __slots__ = ("times", "events", "start")
+
+    def __init__(self):
+        self.times = []
+        self.events = []
+        self.start = 0  # Index of the first live entry (compacted once half the list is expired)
+
+    def __len__(self):
+        return len(self.times) - self.start
+
+    def add(self, seconds, event):
+        times = self.times
+        if not times or seconds >= times[-1]:
+            times.append(seconds)
+            self.events.append(event)
+        else:
+            # Debounced or warmed-up events can arrive out of order
+            index = bisect.bisect_right(times, seconds, self.start)
+            times.insert(index, seconds)
+            self.events.insert(index, event)
+
+    def expire(self, before):
+        start = bisect.bisect_left(self.times, before, self.start)
+        if start > self.start:
+            self.start = start
+            if start > len(self.times) // 2:
+                del self.times[:start]
+                del self.events[:start]
+                self.start = 0
+
+    def bounds(self, start=None, end=None):
+        lo = self.start if start is None else bisect.bisect_left(self.times, start, self.start)
+        hi = len(self.times) if end is None else bisect.bisect_right(self.times, end, lo)
+        return lo, hi
+
+    def before(self, seconds):
+        """The last event strictly before a time, or None"""
+        index = bisect.bisect_left(self.times, seconds, self.start)
+        return self.events[index - 1] if index > self.start else None
+
+
+class AlarmEventStore:
+    """Recent alarm events indexed by time, machine and alarm type"""
+
+    def __init__(self, retention=86400.0, max_events=1_000_000):
+        self.retention = retention
+        self.max_events = max_events
+        self.complete_since = time.time()  # Every event after this is in the store
+        self._all = TimeIndex()
+        self._by_machine = {}
+        self._by_alarm = {}
+        self._by_machine_alarm = {}
+        self._alarm_types = {}  # alarm_name -> alarm_type, so either can be queried
+        self._keys = set()  # (machine_id, alarm_name, state, time) of stored events, to skip duplicates
+        self._lock = threading.Lock()
+
+        self.added = 0
+        self.queries = 0
+
+    def __len__(self):
+        return len(self._all)
+
+    def add(self, event, now=None):
+        """Index one event (events without a valid timestamp are skipped)"""
+        seconds = event_time(event.get("timestamp"))
+        if seconds is None:
+            return False
+        machine_id = event.get("machine_id")
+        alarm_type = event.get("alarm_type")
+        key = (machine_id, event.get("alarm_name"), event.get("state"), round(seconds, 6))
+        with self._lock:
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+            if event.get("alarm_name"):
+                self._alarm_types[event["alarm_name"]] = alarm_type
+            self._all.add(seconds, event)
+            for index, index_key in ((self._by_machine, machine_id), (self._by_alarm, alarm_type),
+                                     (self._by_machine_alarm, (machine_id, alarm_type))):
+                entries = index.get(index_key)
+                if entries is None:
+                    entries = index[index_key] = TimeIndex()
+                entries.add(seconds, event)
+            self.added += 1
+            if len(self._all) > self.max_events or self.added % 1000 == 0:
+                self._expire(time.time() if now is None else now)
+        return True
+
+    def seed(self, events):
+        """Index the journal's events at startup: the store is complete from the oldest one on"""
+        for event in events:
+            self.add(event)
+        if len(self._all):
+            self.complete_since = min(self.complete_since, self._all.times[self._all.start])
+
+    def _expire(self, now):
+        """Drop events older than the retention, or the oldest beyond max_events (caller holds the lock)"""
+        before = now - self.retention
+        if len(self._all) > self.max_events:
+            before = max(before, self._all.times[self._all.start + len(self._all) - self.max_events])
+            self.complete_since = max(self.complete_since, before)
+        expired = bisect.bisect_left(self._all.times, before, self._all.start)
+        for i in range(self._all.start, expired):
+            event = self._all.events[i]
+            self._keys.discard((event.get("machine_id"), event.get("alarm_name"), event.get("state"),
+                                round(self._all.times[i], 6)))
+        self._all.expire(before)
+        for index in (self._by_machine, self._by_alarm, self._by_machine_alarm):
+            for key in list(index):
+                index[key].expire(before)
+                if not index[key]:
+                    del index[key]
+
+    def covers(self, start, now=None):
+        """Whether every event from `start` on is in the store"""
+        now = time.time() if now is None else now
+        return start is not None and start >= max(self.complete_since, now - self.retention)
+
+    def _alarm_type(self, value):
+        return self._alarm_types.get(value, value)
+
+    def _indexes(self, machine_ids, alarm_types):
+        """The smallest set of TimeIndexes that holds every event matching the filters"""
+        if machine_ids and alarm_types:
+            return [self._by_machine_alarm[key] for key in
+                    ((machine_id, alarm_type) for machine_id in machine_ids for alarm_type in alarm_types)
+                    if key in self._by_machine_alarm]
+        if machine_ids:
+            return [self._by_machine[key] for key in machine_ids if key in self._by_machine]
+        if alarm_types:
+            return [self._by_alarm[key] for key in alarm_types if key in self._by_alarm]
+        return [self._all]
+
+    def query(self, start=None, end=None, machine_ids=(), alarm_types=(), states=(), limit=100, offset=0,
+              descending=True, now=None):
+        """Events in [start, end] matching the filters, newest first by default: (events, total)"""
+        alarm_types = {self._alarm_type(alarm_type) for alarm_type in alarm_types}
+        states = {state.upper() for state in states}
+        with self._lock:
+            self.queries += 1
+            ranges = []
+            for index in self._indexes(set(machine_ids), alarm_types):
+                lo, hi = index.bounds(start, end)
+                if hi > lo:
+                    ranges.append((index, lo, hi))
+            if not states:
+                total = sum(hi - lo for _, lo, hi in ranges)
+                if len(ranges) == 1:
+                    # One index: slice the page directly
+                    index, lo, hi = ranges[0]
+                    if descending:
+                        page = index.events[max(lo, hi - offset - limit):max(lo, hi - offset)][::-1]
+                    else:
+                        page = index.events[lo + offset:min(hi, lo + offset + limit)]
+                    return page, total
+            else:
+                total = None
+            merged = heapq.merge(*(self._iterate(index, lo, hi, descending) for index, lo, hi in ranges),
+                                 key=lambda entry: entry[0], reverse=descending)
+            page = []
+            matched = 0
+            for _, event in merged:
+                if states and event.get("state") not in states:
+                    continue
+                if offset <= matched < offset + limit:
+                    page.append(event)
+                matched += 1
+                if total is not None and matched >= offset + limit:
+                    break
+            return page, matched if total is None else total
+
+    @staticmethod
+    def _iterate(index, lo, hi, descending):
+        times, events = index.times, index.events
+        positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        return ((times[i], events[i]) for i in positions)
+
+    def durations(self, start, end, machine_ids=(), alarm_types=(), now=None):
+        """Active time per (machine, alarm type) within [start, end]: RAISED (or flapping) until CLEARED"""
+        now = time.time() if now is None else now
+        end = now if end is None else min(end, now)
+        start = now - self.retention if start is None else start
+        machine_ids = set(machine_ids)
+        alarm_types = {self._alarm_type(alarm_type) for alarm_type in alarm_types}
+        result = []
+        with self._lock:
+            if machine_ids:
+                keys = [(machine_id, alarm_type) for machine_id in machine_ids
+                        for alarm_type in (alarm_types or self._by_alarm)]
+            else:
+                keys = [key for key in self._by_machine_alarm if not alarm_types or key[1] in alarm_types]
+            for machine_id, alarm_type in keys:
+                index = self._by_machine_alarm.get((machine_id, alarm_type))
+                if index is None:
+                    continue
+                previous = index.before(start)
+                raised_at = start if previous is not None and previous.get("state") == "RAISED" else None
+                episodes = 1 if raised_at is not None else 0
+                active_seconds = 0.0
+                lo, hi = index.bounds(start, end)
+                for i in range(lo, hi):
+                    seconds, state = index.times[i], index.events[i].get("state")
+                    if state == "RAISED" and raised_at is None:
+                        raised_at = seconds
+                        episodes += 1
+                    elif state == "CLEARED" and raised_at is not None:
+                        active_seconds += seconds - raised_at
+                        raised_at = None
+                if raised_at is not None:
+                    active_seconds += end - raised_at
+                if not episodes:
+                    continue
+                sample = index.events[hi - 1] if hi > lo else previous
+                result.append({
+                    "machine_id": machine_id,
+                    "machine_type": sample.get("machine_type"),
+                    "alarm_type": alarm_type,
+                    "alarm_name": sample.get("alarm_name"),
+                    "episodes": episodes,
+                    "active_seconds": round(active_seconds, 3),
+                    "active": raised_at is not None,
+                    "active_since": iso(raised_at) if raised_at is not None else None,
+                })
+        result.sort(key=lambda entry: (-entry["active_seconds"], entry["machine_id"], entry["alarm_type"]))
+        return result
+
+    def stats(self):
+        return {
+            "events": len(self._all),
+            "machines": len(self._by_machine),
+            "alarm_types": len(self._by_alarm),
+            "added": self.added,
+            "queries": self.queries,
+            "retention_seconds": self.retention,
+            "complete_since": iso(max(self.complete_since, time.time() - self.retention)),
+        }
+
+
+def _values(params, name):
+    return [value for item in params.get(name, ()) for value in item.split(",") if value]
+
+
+def handle_query(store, path, params, now=None):
+    """(status, body dict) of one API request"""
+    now = time.time() if now is None else now
+    start = parse_time(params["start"][0], now) if params.get("start") else None
+    end = parse_time(params["end"][0], now) if params.get("end") else None
+    coverage = {
+        "complete": store.covers(start if start is not None else now - store.retention, now),
+        "complete_since": iso(max(store.complete_since, now - store.retention)),
+    }
+    if path == "/events":
+        limit = min(int(params.get("limit", ["100"])[0]), MAX_LIMIT)
+        offset = int(params.get("offset", ["0"])[0])
+        if limit < 0 or offset < 0:
+            raise ValueError("limit and offset must not be negative")
+        order = params.get("order", ["desc"])[0].lower()
+        if order not in ("asc", "desc"):
+            raise ValueError("order must be asc or desc")
+        events, total = store.query(start, end, _values(params, "machine_id"), _values(params, "alarm_type"),
+                                    _values(params, "state"), limit, offset, order == "desc", now)
+        return 200, {"events": events, "total": total, "offset": offset, "limit": limit, **coverage}
+    if path == "/durations":
+        durations = store.durations(start, end, _values(params, "machine_id"), _values(params, "alarm_type"), now)
+        return 200, {"durations": durations, **coverage}
+    if path in ("/stats", "/"):
+        return 200, store.stats()
+    return 404, {"error": f"unknown endpoint {path}"}
+
+
+def start_api(store, port, host="0.0.0.0"):
+    """Serve the query API from a background thread; returns the server, or None when port is 0"""
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            try:
+                status, body = handle_query(store, url.path.rstrip("/") or "/", parse_qs(url.query))
+            except ValueError as e:
+                status, body = 400, {"error": str(e)}
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # Dashboards poll every few seconds
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"alarm-api-{port}", daemon=True).start()
+    return server
@@ -2,11 +2,55 @@
 """
 Backfill Alarm Events - Query InfluxDB to find past alarm transitions
 and populate the alarm events file
+
+One Flux query covers every alarm field of every requested machine. Rows are
+consumed with query_stream() as they arrive and fed to the alarm engine (the
+same transition detection as the live monitor), so memory stays constant
+however long the range is: only the last values of each machine and the
+transitions found are kept.
+
+BACKFILL_MODE picks what the query returns:
+  server  (default) InfluxDB keeps only the samples whose value differs from
+          the previous one of the same field (difference() on the value as
+          0/1), so only transitions cross the wire
+  client  every sample, pivoted to one row per timestamp, scanned here as
+          CSV columns with common.bool_series (NumPy, in requirements.txt;
+          without it, row by row through the alarm engine, much slower)
+
+The fleet is backfilled incrementally: machine IDs are discovered from the
+bucket (unless given), each machine runs as its own query in a pool of
+--workers threads, and BACKFILL_CHECKPOINT_FILE records per machine how far
+it was backfilled (its high-water mark) and its alarm values there. A rerun
+only queries each machine's data after its mark, starting from those values,
+and merges the new events into the existing journal and events file (an
+event the journal already has, within BACKFILL_MERGE_TOLERANCE seconds, is
+skipped: the monitor stamps alarms on arrival, InfluxDB with the writer's
+time). Relative TIME_RANGE_STOP values are resolved to absolute times before
+they are saved as marks. Run it while the alarm monitor is stopped, as it
+rewrites the journal.
+
+Usage: python alarm_monitor/backfill_alarm_events.py [machine_id ...] [--workers 4] [--reset]
+       (no machine IDs, or "all": every machine in the bucket; --reset ignores the checkpoint)
 """
+import argparse
+import bisect
 import json
 import os
-from influxdb_client import InfluxDBClient
-from datetime import datetime, timezone
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import itemgetter
+from influxdb_client import Dialect, InfluxDBClient
+from influxdb_client.client.util.date_utils import get_date_helper
+from datetime import timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import bool_series
+from common.bool_series import np
+from alarm_engine import ALARM_REGISTRY, AlarmEngine
+from alarm_journal import read_journal, write_journal
+from alarm_store import event_time, iso, parse_time
 
 # Configuration
 INFLUXDB_URL = os.getenv("INFLUXDB_URL", "http://localhost:8086")
@@ -14,121 +58,378 @@ INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN", "my-super-secret-auth-token")
 INFLUXDB_ORG = os.getenv("INFLUXDB_ORG", "myorg")
 INFLUXDB_BUCKET = os.getenv("INFLUXDB_BUCKET", "plc_data_new")
 ALARM_EVENTS_FILE = os.getenv("ALARM_EVENTS_FILE", "/tmp/alarm_events.json")
+ALARM_JOURNAL_FILE = os.getenv("ALARM_JOURNAL_FILE", "/tmp/alarm_events.jsonl")
 TIME_RANGE = os.getenv("TIME_RANGE", "-24h")  # How far back to look
+TIME_RANGE_STOP = os.getenv("TIME_RANGE_STOP", "now()")
+BACKFILL_MODE = os.getenv("BACKFILL_MODE", "server").lower()  # server | client
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))  # machines queried concurrently
+BACKFILL_CHECKPOINT_FILE = os.getenv("BACKFILL_CHECKPOINT_FILE", "/tmp/alarm_backfill_state.json")
+BACKFILL_CHUNK = int(os.getenv("BACKFILL_CHUNK", "100000"))  # rows per vectorized batch in client mode
+BACKFILL_SETTLE = float(os.getenv("BACKFILL_SETTLE", "60"))  # seconds before now left for writes still in flight
+# Backfilled and journal events this many seconds apart are the same transition (the monitor timestamps
+# alarms on arrival by default, InfluxDB has the writer's time)
+BACKFILL_MERGE_TOLERANCE = float(os.getenv("BACKFILL_MERGE_TOLERANCE", "5"))
+
+# Alarms to backfill: the monitor's registry, plus the bottle filler's AlarmFault field
+BACKFILL_REGISTRY = {
+    "bottlefiller": (("Fault", "AlarmFault"),) + ALARM_REGISTRY["bottlefiller"],
+    "lathe": ALARM_REGISTRY["lathe"],
+}
+
+# InfluxDB field -> (machine type, alarm name in the payload)
+ALARM_FIELDS = {alarm_type: (machine_type, name)
+                for machine_type, alarms in BACKFILL_REGISTRY.items() for name, alarm_type in alarms}
+
+# AlarmDefs (event builders, in registry order) per machine type
+ALARM_DEFS = {machine_type: alarms.alarms for machine_type, alarms in AlarmEngine(BACKFILL_REGISTRY).types.items()}
+
+
+def _any_equal(column, values):
+    # An or-chain of equalities is pushed down to storage, contains() is not
+    return " or ".join(f'r["{column}"] == "{value}"' for value in values)
+
+
+def build_discovery_query(start=TIME_RANGE, stop=TIME_RANGE_STOP, bucket=INFLUXDB_BUCKET):
+    """Flux query for the machine IDs with alarm fields in the range"""
+    return f'''
+import "influxdata/influxdb/schema"
+schema.tagValues(bucket: "{bucket}", tag: "machine_id",
+                 predicate: (r) => {_any_equal('_field', ALARM_FIELDS)}, start: {start}, stop: {stop})
+'''
+
+
+def _select(machine_ids, start, stop, bucket):
+    machine_filter = f"\n  |> filter(fn: (r) => {_any_equal('machine_id', machine_ids)})" if machine_ids else ""
+    return f'''
+from(bucket: "{bucket}")
+  |> range(start: {start}, stop: {stop})
+  |> filter(fn: (r) => {_any_equal('_field', ALARM_FIELDS)}){machine_filter}'''
+
+
+def build_query(machine_ids=None, start=TIME_RANGE, stop=TIME_RANGE_STOP, bucket=INFLUXDB_BUCKET):
+    """One Flux query for all alarm fields of the machines (all machines when None), one row per sample"""
+    return _select(machine_ids, start, stop, bucket) + f'''
+  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+  |> keep(columns: ["_time", "machine_id", "machine_type", {", ".join(f'"{field}"' for field in ALARM_FIELDS)}])
+'''
+
+
+def build_transitions_query(machine_ids=None, start=TIME_RANGE, stop=TIME_RANGE_STOP, bucket=INFLUXDB_BUCKET):
+    """One Flux query returning only the samples where an alarm field changed, plus the first of each series
+
+    Each row is one field: _field, and its new value as 0/1 in "state".
+    """
+    return _select(machine_ids, start, stop, bucket) + '''
+  |> toInt()
+  |> duplicate(column: "_value", as: "state")
+  |> difference(keepFirst: true)
+  |> filter(fn: (r) => not exists r._value or r._value != 0)
+  |> keep(columns: ["_time", "machine_id", "machine_type", "_field", "state"])
+'''
+
+
+def field_rows(rows):
+    """Server-side transition rows as the one-field rows detect_transitions() takes
+
+    Rows arrive one (machine, field) table after another rather than in time
+    order per machine. That is fine: the alarms of a machine are independent
+    bits, and a row only carries its own field.
+    """
+    for values in rows:
+        yield {"_time": values["_time"], "machine_id": values.get("machine_id"),
+               "machine_type": values.get("machine_type"), values["_field"]: bool(values["state"])}
+
+
+def machine_type_of(values):
+    """machine_type tag, or the type whose alarm fields the row has"""
+    machine_type = values.get("machine_type")
+    if machine_type in BACKFILL_REGISTRY:
+        return machine_type
+    for field, (field_type, _) in ALARM_FIELDS.items():
+        if values.get(field) is not None:
+            return field_type
+    return None
+
+
+def detect_transitions(rows, engine=None, last=None):
+    """Alarm events from pivoted rows (dicts with _time, machine_id and alarm fields), in stream order
+
+    Rows must be time ordered per machine and field (as each table is). A
+    missing or null field keeps its previous value, so rows written with a
+    deadband (only changed fields) are handled. last ({(machine_type,
+    machine_id): {alarm name: value}}) holds the values carried between rows
+    and is updated in place.
+    """
+    engine = engine or AlarmEngine(BACKFILL_REGISTRY)
+    last = {} if last is None else last
+    for values in rows:
+        machine_type = machine_type_of(values)
+        if machine_type is None:
+            continue
+        machine_id = values.get("machine_id")
+        payload = last.get((machine_type, machine_id))
+        if payload is None:
+            payload = last[(machine_type, machine_id)] = {}
+        for name, field in BACKFILL_REGISTRY[machine_type]:
+            value = values.get(field)
+            if value is not None:
+                payload[name] = bool(value)
+        transitions = engine.update(machine_type, machine_id, payload)
+        if transitions:
+            timestamp = _iso(values["_time"])
+            for alarm, raised, _, _ in transitions:
+                yield alarm.event(machine_id, timestamp, raised)
+
+
+def csv_batches(rows, chunk=BACKFILL_CHUNK):
+    """(header, rows) batches of a Flux query's plain CSV (query_csv() without annotations)
+
+    A header row (",result,table,...") starts a new batch, as do `chunk` rows.
+    """
+    header = None
+    batch = []
+    for row in rows:
+        if len(row) < 3:
+            continue  # Blank line between tables
+        if row[1] == "result":
+            if batch:
+                yield header, batch
+                batch = []
+            header = row
+            continue
+        batch.append(row)
+        if len(batch) >= chunk:
+            yield header, batch
+            batch = []
+    if batch:
+        yield header, batch
+
+
+def detect_transitions_columnar(batches, last=None):
+    """detect_transitions() over CSV batches of pivoted rows, each alarm column scanned with bool_series.edges()
 
-# Alarm fields to check
-ALARM_FIELDS = [
-    "AlarmFault",
-    "AlarmOverfill",
-    "AlarmUnderfill",
-    "AlarmLowProductLevel",
-    "AlarmCapMissing"
-]
-
-def detect_transitions(values):
-    """Detect alarm transitions from a list of (time, value) tuples"""
-    transitions = []
-    prev_value = None
-    prev_time = None
-    
-    for time, value in values:
-        if prev_value is not None:
-            if prev_value == False and value == True:
-                transitions.append({
-                    "state": "RAISED",
-                    "timestamp": prev_time.isoformat() if prev_time else time.isoformat(),
-                    "value": True
-                })
-            elif prev_value == True and value == False:
-                transitions.append({
-                    "state": "CLEARED",
-                    "timestamp": time.isoformat(),
-                    "value": False
-                })
-        prev_value = value
-        prev_time = time
-    
-    return transitions
-
-def backfill_alarm_events(machine_id="machine-01"):
-    """Backfill alarm events from InfluxDB"""
-    client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
+    Needs NumPy. Gives the same events in the same order; memory is bounded
+    by the batch. Only the timestamps of changes are parsed.
+    """
+    last = {} if last is None else last
+    date_helper = get_date_helper()
+    for header, rows in batches:
+        position = {column: i for i, column in enumerate(header)}
+
+        def column(name, lo=0, hi=len(rows)):
+            return np.array(list(map(itemgetter(position[name]), rows[lo:hi])), dtype=object)
+
+        tables = column("table")
+        # Rows of one table (one series: one machine) are contiguous
+        bounds = np.concatenate(([0], np.flatnonzero(tables[1:] != tables[:-1]) + 1, [len(rows)])).tolist()
+        found = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            cells = {name: column(name, lo, hi) for name in ALARM_FIELDS if name in position}
+            tags = {name: rows[lo][position[name]] for name in ("machine_id", "machine_type") if name in position}
+            machine_type = machine_type_of(
+                dict(tags, **{name: True for name, values in cells.items() if (values != "").any()}))
+            if machine_type is None:
+                continue
+            machine_id = tags.get("machine_id")
+            payload = last.setdefault((machine_type, machine_id), {})
+            for alarm in ALARM_DEFS[machine_type]:
+                values = cells.get(alarm.alarm_type)
+                if values is None:
+                    continue
+                initial = payload.get(alarm.name, False)
+                values = bool_series.as_bool(values == "true", initial, present=values != "")
+                index, rising = bool_series.edges(values, initial)
+                payload[alarm.name] = bool(values[-1])
+                found.extend((lo + i, alarm.bit, alarm, machine_id, raised)
+                             for i, raised in zip(index.tolist(), rising.tolist()))
+        # Row order, then registry order within a row, as the engine reports them
+        found.sort(key=lambda change: change[:2])
+        for row, _, alarm, machine_id, raised in found:
+            yield alarm.event(machine_id, _iso(date_helper.parse_date(rows[row][position["_time"]])), raised)
+
+
+def _iso(time):
+    return time.astimezone(timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def load_checkpoint(path=BACKFILL_CHECKPOINT_FILE):
+    """{machine_id: {"until": RFC3339 time, "alarms": {machine_type: {alarm name: value}}}}"""
+    try:
+        with open(path) as f:
+            return json.load(f).get("machines", {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable backfill checkpoint {path}: {e}")
+        return {}
+
+
+def save_checkpoint(machines, path=BACKFILL_CHECKPOINT_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"bucket": INFLUXDB_BUCKET, "machines": machines}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def discover_machines(query_api, start=TIME_RANGE, stop=TIME_RANGE_STOP):
+    query = build_discovery_query(start, stop)
+    return sorted(record.get_value() for record in query_api.query_stream(query, org=INFLUXDB_ORG))
+
+
+def backfill_machine(query_api, machine_id, start, stop, mark=None):
+    """Events of one machine in [start, stop), carrying on from its checkpoint entry
+
+    Returns (events, new checkpoint entry, rows read).
+    """
+    engine = AlarmEngine(BACKFILL_REGISTRY)
+    last = {}
+    for machine_type, alarms in (mark or {}).get("alarms", {}).items():
+        if machine_type in engine.types:
+            last[(machine_type, machine_id)] = dict(alarms)
+            for name, raised in alarms.items():
+                engine.apply(machine_type, machine_id, name, raised)
+    rows = 0
+
+    def stream(query):
+        nonlocal rows
+        for record in query_api.query_stream(query, org=INFLUXDB_ORG):
+            rows += 1
+            yield record.values
+
+    if BACKFILL_MODE == "client" and np is not None:
+        csv = query_api.query_csv(build_query([machine_id], start, stop), org=INFLUXDB_ORG,
+                                  dialect=Dialect(header=True, annotations=[]))
+
+        def counted(batches):
+            nonlocal rows
+            for header, batch in batches:
+                rows += len(batch)
+                yield header, batch
+
+        events = list(detect_transitions_columnar(counted(csv_batches(csv)), last))
+    elif BACKFILL_MODE == "client":
+        events = list(detect_transitions(stream(build_query([machine_id], start, stop)), engine, last))
+    else:
+        source = field_rows(stream(build_transitions_query([machine_id], start, stop)))
+        events = list(detect_transitions(source, engine, last))
+    alarms = {machine_type: payload for (machine_type, _), payload in last.items()}
+    return events, {"until": stop, "alarms": alarms or (mark or {}).get("alarms", {})}, rows
+
+
+def merge_events(existing, new, tolerance=BACKFILL_MERGE_TOLERANCE):
+    """existing + the new events it does not already have, in time order
+
+    A new event is already there when an existing event of the same machine,
+    alarm and state lies within `tolerance` seconds of it; each existing event
+    matches at most one new event (the nearest), so quick repeats are kept.
+    """
+    key = lambda event: (event.get("machine_id"), event.get("alarm_type"), event.get("state"))
+    seen = {}
+    for event in existing:
+        seconds = event_time(event.get("timestamp"))
+        if seconds is not None:
+            seen.setdefault(key(event), []).append(seconds)
+    for times in seen.values():
+        times.sort()
+    added = []
+    for event in new:
+        times = seen.get(key(event))
+        seconds = event_time(event.get("timestamp"))
+        if times and seconds is not None:
+            i = bisect.bisect_left(times, seconds)
+            nearest = min((j for j in (i - 1, i) if 0 <= j < len(times)), key=lambda j: abs(times[j] - seconds))
+            if abs(times[nearest] - seconds) <= tolerance:
+                del times[nearest]
+                continue
+        added.append(event)
+    merged = list(existing) + added
+    merged.sort(key=lambda x: x["timestamp"])
+    return merged, len(added)
+
+
+def backfill_alarm_events(machine_ids=None, workers=BACKFILL_WORKERS, reset=False):
+    """Backfill alarm events from InfluxDB (all machines when machine_ids is empty)"""
+    client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG,
+                            connection_pool_maxsize=max(workers, 1))
     query_api = client.query_api()
-    
-    all_events = []
-    
-    print(f"🔍 Backfilling alarm events for {machine_id}...")
-    print(f"📅 Time range: {TIME_RANGE}")
+
+    # One stop for every machine, a little before now so late writes are picked up by the next run
+    # Relative stops ("-1h") are resolved here: the checkpoint stores an absolute time
+    now = time.time()
+    stop_seconds = now - BACKFILL_SETTLE if TIME_RANGE_STOP == "now()" else parse_time(TIME_RANGE_STOP, now)
+    stop = iso(stop_seconds)
+    checkpoint = {} if reset else load_checkpoint()
+
+    try:
+        if not machine_ids:
+            machine_ids = discover_machines(query_api, TIME_RANGE, stop)
+    except Exception as e:
+        print(f"❌ Machine discovery failed: {e}")
+        client.close()
+        return None
+
+    print(f"🔍 Backfilling alarm events for {len(machine_ids)} machines with {workers} workers...")
+    print(f"📅 Time range: {TIME_RANGE} to {stop} ({BACKFILL_MODE}-side transition detection, "
+          f"{sum(machine_id in checkpoint for machine_id in machine_ids)} machines resume from "
+          f"{BACKFILL_CHECKPOINT_FILE})")
+    if BACKFILL_MODE == "client" and np is None:
+        print("⚠️  NumPy is not installed (pip install -r requirements.txt): scanning rows one by one")
     print("=" * 60)
-    
-    for alarm_field in ALARM_FIELDS:
-        # Map InfluxDB field name to alarm label
-        alarm_label_map = {
-            "AlarmFault": "Fault",
-            "AlarmOverfill": "Overfill",
-            "AlarmUnderfill": "Underfill",
-            "AlarmLowProductLevel": "LowProductLevel",
-            "AlarmCapMissing": "CapMissing"
-        }
-        
-        alarm_label = alarm_label_map.get(alarm_field, alarm_field)
-        
-        # Query values sorted by time
-        query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-          |> range(start: {TIME_RANGE})
-          |> filter(fn: (r) => r["machine_id"] == "{machine_id}")
-          |> filter(fn: (r) => r["_field"] == "{alarm_field}")
-          |> sort(columns: ["_time"])
-          |> aggregateWindow(every: 1s, fn: last, createEmpty: false)
-        '''
-        
-        try:
-            results = query_api.query(query)
-            values = []
-            
-            for table in results:
-                for record in table.records:
-                    time = record.get_time()
-                    value = record.get_value()
-                    values.append((time, value))
-            
-            if values:
-                transitions = detect_transitions(values)
-                print(f"  {alarm_field}: {len(transitions)} transitions found")
-                
-                for transition in transitions:
-                    event = {
-                        "timestamp": transition["timestamp"],
-                        "machine_id": machine_id,
-                        "alarm_type": alarm_field,
-                        "alarm_label": alarm_label,
-                        "state": transition["state"],
-                        "value": transition["value"]
-                    }
-                    all_events.append(event)
-            else:
-                print(f"  {alarm_field}: No data found")
-                
-        except Exception as e:
-            print(f"  {alarm_field}: Error - {e}")
-    
-    # Sort all events by timestamp
-    all_events.sort(key=lambda x: x["timestamp"])
-    
-    # Save to file
+
+    started = time.perf_counter()
+    new_events = []
+    rows = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {}
+        for machine_id in machine_ids:
+            mark = checkpoint.get(machine_id)
+            start = mark["until"] if mark else TIME_RANGE
+            until = event_time(start) if mark else None  # None for relative marks saved by older runs
+            if until is not None and until >= stop_seconds:
+                continue  # Already backfilled up to this run's stop
+            futures[pool.submit(backfill_machine, query_api, machine_id, start, stop, mark)] = machine_id
+        for future in as_completed(futures):
+            machine_id = futures[future]
+            try:
+                events, mark, machine_rows = future.result()
+            except Exception as e:
+                failed.append(machine_id)
+                print(f"  {machine_id}: Error - {e}")
+                continue
+            new_events.extend(events)
+            rows += machine_rows
+            checkpoint[machine_id] = mark
+            print(f"  {machine_id}: {len(events)} transitions found ({machine_rows:,} rows)")
+    elapsed = time.perf_counter() - started
+    print(f"  {rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    # Merge into the journal the alarm monitor loads its history from, and the events file;
+    # the checkpoint is saved last so a failed run is simply redone
+    existing, _ = read_journal(ALARM_JOURNAL_FILE)
+    if not existing and os.path.exists(ALARM_EVENTS_FILE):
+        with open(ALARM_EVENTS_FILE) as f:
+            existing = json.load(f)
+    all_events, added = merge_events(existing, new_events)
     with open(ALARM_EVENTS_FILE, 'w') as f:
         json.dump(all_events, f, indent=2)
-    
+    write_journal(ALARM_JOURNAL_FILE, all_events)
+    save_checkpoint(checkpoint)
+
     print("=" * 60)
-    print(f"✅ Backfilled {len(all_events)} alarm events")
-    print(f"💾 Saved to: {ALARM_EVENTS_FILE}")
-    
+    print(f"✅ Backfilled {added} new alarm events ({len(all_events)} in total"
+          + (f", {len(failed)} machines failed: {', '.join(failed)}" if failed else "") + ")")
+    print(f"💾 Saved to: {ALARM_EVENTS_FILE} and {ALARM_JOURNAL_FILE}")
+
     client.close()
     return all_events
 
-if __name__ == "__main__":
-    import sys
-    machine_id = sys.argv[1] if len(sys.argv) > 1 else "machine-01"
-    backfill_alarm_events(machine_id)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill alarm events from InfluxDB")
+    parser.add_argument("machine_ids", nargs="*", help='machines to backfill (none or "all": discover them)')
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="machines queried concurrently")
+    parser.add_argument("--reset", action="store_true", help="ignore the checkpoint and rescan TIME_RANGE")
+    args = parser.parse_args()
+    backfill_alarm_events([machine_id for machine_id in args.machine_ids if machine_id != "all"],
+                          args.workers, args.reset)
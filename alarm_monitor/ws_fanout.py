@@ -0,0 +1,295 @@
+"""
+WebSocket Fan-out - Delivers each alarm message to every connected client
+through a bounded per-client queue and a sender task per client
+
+publish() only appends the (already serialized) message to each client's
+queue, so it never waits on a socket and one slow browser tab cannot delay
+the others. A client whose queue is full is handled by the slow client
+policy:
+  drop_oldest - discard its oldest queued message (counted in `dropped`)
+  disconnect  - close it with code 1013 (try again later); the frontend
+                reconnects and resynchronizes
+
+Clients may narrow what they receive with a subscription (machine IDs,
+machine types, alarm types, states). Subscribed clients are indexed by
+machine ID, so publishing an alarm only visits the clients that can match it:
+the unsubscribed ones (which still get everything), the ones subscribed to
+that machine and the ones subscribed without a machine list.
+
+Alarms carry a sequence number. A client that sends hello opts into
+sequenced delivery: every alarm message it gets includes "seq", and it first
+receives either
+  {"type": "snapshot", "seq": N, "active": [...]}  - the currently raised alarms
+  {"type": "resume", "seq": N, "events": [...]}    - the alarms after its last_seq
+The resume reply is only possible while last_seq is still in the recent
+history; otherwise the client gets a snapshot. Both honour its subscription,
+and both are queued on the event loop thread, so nothing is missed or
+repeated between the reply and the next alarm.
+
+All methods must be called on the WebSocket event loop thread; other threads
+use publish_threadsafe().
+"""
+import asyncio
+import collections
+import functools
+import json
+
+import websockets
+
+POLICIES = ("drop_oldest", "disconnect")
+MESSAGE_FIELDS = ("machine_id", "alarm_name", "alarm_type", "state", "timestamp")
+
+
+class Subscription:
+    """Alarm filter of one client; an empty field matches anything"""
+
+    FIELDS = ("machine_ids", "machine_types", "alarm_types", "states")
+
+    def __init__(self, machine_ids=None, machine_types=None, alarm_types=None, states=None):
+        self.machine_ids = frozenset(machine_ids or ())
+        self.machine_types = frozenset(t.lower() for t in machine_types or ())
+        self.alarm_types = frozenset(alarm_types or ())  # alarm_type ("AlarmOverfill") or alarm_name ("Overfill")
+        self.states = frozenset(s.upper() for s in states or ())
+
+    @classmethod
+    def from_message(cls, message):
+        """Build from a client's subscribe message, raising ValueError if it is malformed"""
+        fields = {}
+        for field in cls.FIELDS:
+            values = message.get(field)
+            if values is None:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                raise ValueError(f"'{field}' must be a list of strings")
+            fields[field] = values
+        return cls(**fields)
+
+    def matches(self, alarm):
+        """Everything but the machine ID, which the Fanout index already checked"""
+        if self.machine_types and alarm.get("machine_type") not in self.machine_types:
+            return False
+        if (self.alarm_types and alarm.get("alarm_name") not in self.alarm_types
+                and alarm.get("alarm_type") not in self.alarm_types):
+            return False
+        return not self.states or alarm.get("state") in self.states
+
+    def to_dict(self):
+        return {field: sorted(getattr(self, field)) for field in self.FIELDS}
+
+
+class FanoutClient:
+    """One connected WebSocket with its outbound queue and sender task"""
+
+    def __init__(self, websocket, max_queue):
+        self.websocket = websocket
+        self.queue = collections.deque()
+        self.max_queue = max_queue
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.task = None
+        self.closing = False
+        self.subscription = None
+        self.sequenced = False  # Sent hello: gets "seq" on alarms
+
+    def wants(self, alarm):
+        subscription = self.subscription
+        if subscription is None:
+            return True
+        if subscription.machine_ids and alarm.get("machine_id") not in subscription.machine_ids:
+            return False
+        return subscription.matches(alarm)
+
+
+class Fanout:
+    """Per-client bounded queues with concurrent senders"""
+
+    def __init__(self, max_queue=256, policy="drop_oldest", on_error=None, history=1000):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow client policy '{policy}' (use {' or '.join(POLICIES)})")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.on_error = on_error  # on_error(exception) for unexpected send errors
+        self.clients = {}  # websocket -> FanoutClient
+        self._unfiltered = set()  # Clients without a subscription: receive everything
+        self._any_machine = set()  # Subscribed without machine IDs
+        self._by_machine = {}  # machine_id -> subscribed clients
+
+        self.seq = 0  # Sequence number of the last alarm
+        self.history = collections.deque(maxlen=history)  # (seq, alarm, sequenced message)
+        self.active = {}  # (machine_id, alarm_name) -> (alarm, sequenced message) of raised alarms
+
+        self.published = 0
+        self.dropped = 0
+        self.disconnected = 0
+        self.send_failures = 0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def register(self, websocket):
+        client = FanoutClient(websocket, self.max_queue)
+        client.task = asyncio.ensure_future(self._sender(client))
+        self.clients[websocket] = client
+        self._unfiltered.add(client)
+        return client
+
+    def unregister(self, websocket):
+        client = self.clients.pop(websocket, None)
+        if client is not None:
+            self._unindex(client)
+            if client.task is not None:
+                client.task.cancel()
+        return client
+
+    def subscribe(self, websocket, subscription):
+        """Replace a client's subscription (None: receive everything again)"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        self._unindex(client)
+        client.subscription = subscription
+        if subscription is None:
+            self._unfiltered.add(client)
+        elif not subscription.machine_ids:
+            self._any_machine.add(client)
+        else:
+            for machine_id in subscription.machine_ids:
+                self._by_machine.setdefault(machine_id, set()).add(client)
+
+    def _unindex(self, client):
+        self._unfiltered.discard(client)
+        self._any_machine.discard(client)
+        if client.subscription is not None:
+            for machine_id in client.subscription.machine_ids:
+                subscribers = self._by_machine.get(machine_id)
+                if subscribers is not None:
+                    subscribers.discard(client)
+                    if not subscribers:
+                        del self._by_machine[machine_id]
+
+    def publish(self, message, alarm=None):
+        """Queue one serialized message for every client whose subscription matches
+
+        alarm is the event behind the message (machine_id, machine_type,
+        alarm_name, alarm_type, state, timestamp, seq); without it the message
+        goes to every client.
+        """
+        self.published += 1
+        if alarm is None:
+            for client in self.clients.values():
+                self.enqueue(client, message)
+            return
+        sequenced = self._record(alarm, message)
+        for client in self._unfiltered:
+            self.enqueue(client, sequenced if client.sequenced else message)
+        for clients in (self._by_machine.get(alarm["machine_id"], ()), self._any_machine):
+            for client in clients:
+                if client.subscription.matches(alarm):
+                    self.enqueue(client, sequenced if client.sequenced else message)
+
+    def publish_threadsafe(self, loop, message, alarm=None):
+        loop.call_soon_threadsafe(functools.partial(self.publish, message, alarm))
+
+    @staticmethod
+    def sequenced_message(alarm):
+        message = {field: alarm.get(field) for field in MESSAGE_FIELDS}
+        if alarm.get("flapping"):
+            message["flapping"] = True
+        message["seq"] = alarm.get("seq")
+        return json.dumps(message)
+
+    def _record(self, alarm, message):
+        """Add an alarm to the history and active set, returning its sequenced message"""
+        if alarm.get("seq") is None:
+            return message
+        sequenced = self.sequenced_message(alarm)
+        self.seq = alarm["seq"]
+        self.history.append((alarm["seq"], alarm, sequenced))
+        key = (alarm["machine_id"], alarm.get("alarm_name"))
+        if alarm.get("state") == "RAISED":
+            self.active[key] = (alarm, sequenced)
+        else:
+            self.active.pop(key, None)
+        return sequenced
+
+    def restore(self, alarms, active=()):
+        """Seed the history from recorded alarms and the active set from the raised ones (before any client connects)
+
+        active comes from the restored alarm state; without it the active set
+        starts empty and fills as raised alarms are detected again.
+        """
+        for alarm in alarms:
+            if alarm.get("seq") is not None:
+                self.seq = alarm["seq"]
+                self.history.append((alarm["seq"], alarm, self.sequenced_message(alarm)))
+        for alarm in active:
+            self.active[(alarm["machine_id"], alarm.get("alarm_name"))] = (alarm, self.sequenced_message(alarm))
+
+    def hello(self, websocket, last_seq=None):
+        """Switch a client to sequenced delivery and queue its snapshot or resume reply"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return None
+        client.sequenced = True
+        oldest = self.history[0][0] if self.history else self.seq + 1
+        if last_seq is not None and oldest - 1 <= last_seq <= self.seq:
+            events = [message for seq, alarm, message in self.history if seq > last_seq and client.wants(alarm)]
+            kind, key = "resume", "events"
+        else:
+            events = [message for alarm, message in self.active.values() if client.wants(alarm)]
+            kind, key = "snapshot", "active"
+        # The messages are already serialized; splice them in rather than re-encoding
+        self.enqueue(client, f'{{"type": "{kind}", "seq": {self.seq}, "{key}": [{", ".join(events)}]}}')
+        return kind
+
+    def enqueue(self, client, message):
+        if client.closing:
+            return
+        if len(client.queue) >= client.max_queue:
+            if self.policy == "disconnect":
+                self._disconnect(client)
+                return
+            client.queue.popleft()
+            client.dropped += 1
+            self.dropped += 1
+        client.queue.append(message)
+        client.ready.set()
+
+    def _disconnect(self, client):
+        client.closing = True
+        client.queue.clear()
+        self.disconnected += 1
+        asyncio.ensure_future(client.websocket.close(code=1013, reason="client too slow"))
+
+    async def _sender(self, client):
+        queue, websocket = client.queue, client.websocket
+        try:
+            while True:
+                await client.ready.wait()
+                while queue:
+                    await websocket.send(queue.popleft())
+                    client.sent += 1
+                client.ready.clear()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.send_failures += 1
+            if self.on_error is not None:
+                self.on_error(e)
+            await websocket.close(code=1011)
+
+    def stats(self):
+        return {
+            "clients": len(self.clients),
+            "subscribed": len(self.clients) - len(self._unfiltered),
+            "published": self.published,
+            "queued": sum(len(client.queue) for client in self.clients.values()),
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+            "send_failures": self.send_failures,
+        }
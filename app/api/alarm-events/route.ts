@@ -1,5 +1,6 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { InfluxDB, Point } from '@influxdata/influxdb-client';
+import { queryAlarmStore } from '@/lib/alarmStore';
 
 export const dynamic = 'force-dynamic';
 export const revalidate = 0;
@@ -12,6 +13,21 @@ export async function GET(request: NextRequest) {
     const startDate = searchParams.get('startDate');
     const endDate = searchParams.get('endDate');
 
+    // Recent ranges (the last 24h) are served from the alarm monitor's in-memory store
+    const stored = await queryAlarmStore({ start: startDate || '-30d', end: endDate, machineId, limit });
+    if (stored) {
+      const alerts = stored.events.map((event) => ({
+        timestamp: event.timestamp,
+        machine_id: event.machine_id,
+        alarm_type: event.alarm_type,
+        alarm_name: event.alarm_name || event.alarm_type,
+        alarm_label: event.alarm_label || event.alarm_type,
+        state: event.state,
+        value: event.value,
+      }));
+      return NextResponse.json({ alerts, total: stored.total, source: 'alarm_monitor' });
+    }
+
     // Use NEXT_PUBLIC_ vars if available, otherwise fallback to defaults (same pattern as other API routes)
     const url = process.env.NEXT_PUBLIC_INFLUXDB_URL || process.env.INFLUXDB_URL || 'https://influxtest.wisermachines.com';
     const token = process.env.NEXT_PUBLIC_INFLUXDB_TOKEN || process.env.INFLUXDB_TOKEN || '1MrRJ8q-zSnlt9HRZMeY5YNhOQZWbi6Xk-oU6pFFTSbJRv4V32cTJutWMJota0r6t_F6N5zXOfE6IXHYmcUk4Q==';
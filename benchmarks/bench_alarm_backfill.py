@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Alarm Backfill Benchmark - Server-side transition extraction against the
+client-side scan of every sample
+
+Generates a synthetic month of 2-second bottle filler samples (alarm episodes
+at --episodes per alarm per day, lasting about --duration seconds) and runs
+both backfill modes over it:
+  client  every sample crosses the wire, pivoted, and is scanned here
+  server  InfluxDB keeps only the samples where a field changed
+          (difference() on the 0/1 value), so only transitions cross the wire
+Both must find the same alarm events. Reports rows returned, bytes on the
+wire and time per mode.
+
+Without --url, InfluxDB is simulated: the rows each query would return are
+built in memory (building them stands in for parsing the response; the
+server-side difference() is computed before timing) and the annotated CSV
+size is estimated. With --url the data is written to --bucket (skipped with
+--no-load) and both queries run end to end with query_stream().
+
+Usage: python benchmarks/bench_alarm_backfill.py [--machines 1] [--days 30] [--episodes 20]
+       [--url http://localhost:8086 --bucket alarm_backfill_benchmark]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "alarm_monitor"))
+from backfill_alarm_events import (BACKFILL_REGISTRY, build_query, build_transitions_query, detect_transitions,
+                                   field_rows)
+
+INTERVAL = 2  # seconds between samples
+FIELDS = [field for _, field in BACKFILL_REGISTRY["bottlefiller"]]
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+# Annotated CSV bytes per row (",result,table,_time,...") as returned by /api/v2/query
+PIVOTED_ROW_BYTES = 40 + 31 + 12 + 13 + 6 * len(FIELDS)
+FIELD_ROW_BYTES = 40 + 31 + 12 + 13 + 20 + 2
+
+
+def alarm_values(days, episodes, duration, seed):
+    """{field: [bool per sample]} for one machine"""
+    rng = random.Random(seed)
+    samples = int(days * 86400 / INTERVAL)
+    values = {}
+    for field in FIELDS:
+        column = [False] * samples
+        for _ in range(int(episodes * days)):
+            start = rng.randrange(samples)
+            length = max(1, int(rng.expovariate(1 / duration) / INTERVAL))
+            column[start:start + length] = [True] * len(column[start:start + length])
+        values[field] = column
+    return values
+
+
+def fleet(args):
+    return [(f"machine-{i:03d}", alarm_values(args.days, args.episodes, args.duration, args.seed + i))
+            for i in range(args.machines)]
+
+
+def simulated_client_rows(machines):
+    for machine_id, values in machines:
+        columns = [values[field] for field in FIELDS]
+        for i, sample in enumerate(zip(*columns)):
+            row = dict(zip(FIELDS, sample))
+            row["_time"] = START + timedelta(seconds=i * INTERVAL)
+            row["machine_id"] = machine_id
+            row["machine_type"] = "bottlefiller"
+            yield row
+
+
+def simulated_server_rows(machines):
+    """What the difference() query returns: the first sample and the changes of each (machine, field)"""
+    for machine_id, values in machines:
+        for field in FIELDS:
+            previous = None
+            for i, value in enumerate(values[field]):
+                if value != previous:
+                    yield {"_time": START + timedelta(seconds=i * INTERVAL), "machine_id": machine_id,
+                           "machine_type": "bottlefiller", "_field": field, "state": int(value)}
+                    previous = value
+
+
+def counted(rows, counter):
+    for row in rows:
+        counter[0] += 1
+        yield row
+
+
+def run_simulated(machines):
+    results = {}
+    server_rows = list(simulated_server_rows(machines))
+    for mode, rows, row_bytes in (("client", lambda: simulated_client_rows(machines), PIVOTED_ROW_BYTES),
+                                  ("server", lambda: field_rows(dict(row) for row in server_rows), FIELD_ROW_BYTES)):
+        counter = [0]
+        started = time.perf_counter()
+        events = list(detect_transitions(counted(rows(), counter)))
+        results[mode] = (events, counter[0], counter[0] * row_bytes, time.perf_counter() - started)
+    return results
+
+
+def load(machines, url, token, org, bucket):
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+    client = InfluxDBClient(url=url, token=token, org=org, timeout=600_000)
+    buckets = client.buckets_api()
+    existing = buckets.find_bucket_by_name(bucket)
+    if existing is not None:
+        buckets.delete_bucket(existing)
+    buckets.create_bucket(bucket_name=bucket, org=org)
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+    base = int(START.timestamp())
+    for machine_id, values in machines:
+        batch = []
+        for i, sample in enumerate(zip(*(values[field] for field in FIELDS))):
+            fields = ",".join(f"{field}={'true' if value else 'false'}" for field, value in zip(FIELDS, sample))
+            batch.append(f"plc_data,machine_id={machine_id},machine_type=bottlefiller {fields} "
+                         f"{base + i * INTERVAL}")
+            if len(batch) == 10000:
+                write_api.write(bucket=bucket, record=batch, write_precision="s")
+                batch = []
+        if batch:
+            write_api.write(bucket=bucket, record=batch, write_precision="s")
+    client.close()
+
+
+def run_influxdb(args):
+    from influxdb_client import InfluxDBClient
+    client = InfluxDBClient(url=args.url, token=args.token, org=args.org, timeout=600_000)
+    query_api = client.query_api()
+    start = START.isoformat().replace("+00:00", "Z")
+    stop = (START + timedelta(days=args.days)).isoformat().replace("+00:00", "Z")
+    results = {}
+    for mode, query, convert in (("client", build_query, lambda rows: rows),
+                                 ("server", build_transitions_query, field_rows)):
+        counter = [0]
+        flux = query(None, start, stop, args.bucket)
+        started = time.perf_counter()
+        records = (record.values for record in query_api.query_stream(flux, org=args.org))
+        events = list(detect_transitions(convert(counted(records, counter))))
+        elapsed = time.perf_counter() - started
+        response = query_api.query_raw(flux, org=args.org) if args.measure_bytes else None
+        wire = len(response.data) if response is not None else 0
+        results[mode] = (events, counter[0], wire, elapsed)
+    client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machines", type=int, default=1)
+    parser.add_argument("--days", type=float, default=30.0)
+    parser.add_argument("--episodes", type=float, default=20.0, help="alarm episodes per alarm per day")
+    parser.add_argument("--duration", type=float, default=120.0, help="mean episode length in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="run against a real InfluxDB instead of the simulation")
+    parser.add_argument("--token", default=os.getenv("INFLUXDB_TOKEN", "my-super-secret-auth-token"))
+    parser.add_argument("--org", default=os.getenv("INFLUXDB_ORG", "myorg"))
+    parser.add_argument("--bucket", default="alarm_backfill_benchmark")
+    parser.add_argument("--no-load", action="store_true", help="reuse the data already in --bucket")
+    parser.add_argument("--measure-bytes", action="store_true", help="re-run each query raw to count its bytes")
+    args = parser.parse_args()
+
+    machines = fleet(args)
+    samples = sum(len(values[FIELDS[0]]) for _, values in machines)
+    print(f"📊 {samples:,} samples x {len(FIELDS)} alarm fields ({args.machines} machines, {args.days:g} days "
+          f"at {INTERVAL}s){'' if args.url else ', InfluxDB simulated'}")
+    if args.url:
+        if not args.no_load:
+            print(f"⏳ Writing to {args.bucket}...")
+            load(machines, args.url, args.token, args.org, args.bucket)
+        results = run_influxdb(args)
+    else:
+        results = run_simulated(machines)
+
+    key = lambda event: (event["timestamp"], event["machine_id"], event["alarm_type"], event["state"])
+    if sorted(results["client"][0], key=key) != sorted(results["server"][0], key=key):
+        print("❌ Server-side extraction found different alarm events than the client-side scan")
+        sys.exit(1)
+    for mode, (events, rows, wire, elapsed) in results.items():
+        print(f"   {mode:<7} {rows:>12,} rows  {wire / 1e6:>9,.1f} MB  {elapsed:>8.2f}s  {len(events):,} events")
+    client, server = results["client"], results["server"]
+    print(f"   server-side: {client[1] / max(server[1], 1):,.0f}x fewer rows, "
+          f"{client[3] / max(server[3], 1e-9):,.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Alarm Debounce Benchmark - Alarm events with and without debounce and flap
+detection, and whether real faults still get through
+
+Runs mock_plc_agent and lathe_sim alarm payloads (one message per machine
+every 2 seconds of simulated time) through the alarm engine unfiltered and
+with the given debounce / flap settings. On top of the generators' random
+toggling, every machine gets a sustained fault (one alarm held raised for
+--fault-min to --fault-max seconds) about every --fault-every seconds. Reports
+events emitted, flapping episodes, and how many sustained faults were
+reported raised while they lasted, with the detection delay.
+
+Usage: python benchmarks/bench_alarm_debounce.py [--machines 100] [--duration 3600]
+       [--min-on 2] [--min-off 2] [--flap-transitions 4] [--flap-window 120]
+       [--fault-every 600] [--fault-min 30] [--fault-max 120] [--seed 1]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "alarm_monitor"))
+from lathe_sim.lathe_sim import LatheState
+from mock_plc_agent.mock_plc_agent import BottleFillerTags
+from alarm_engine import ALARM_REGISTRY, AlarmEngine
+
+PUBLISH_INTERVAL = 2.0  # seconds, mock_plc_agent default
+
+
+def simulate(args):
+    """[(now, machine_type, machine_id, payload)] in time order, plus the injected faults"""
+    rng = random.Random(args.seed)
+    random.seed(args.seed)  # The tag generators use the module-level generator
+    fleet = []
+    for i in range(args.machines):
+        if i % 2:
+            fleet.append(("lathe", f"lathe{i:03d}", LatheState()))
+        else:
+            tags = BottleFillerTags()
+            tags.system_running = True
+            fleet.append(("bottlefiller", f"machine-{i:03d}", tags))
+
+    faults = []  # (machine_id, alarm name, start, end)
+    for machine_type, machine_id, _ in fleet:
+        start = rng.uniform(0, args.fault_every)
+        while start < args.duration:
+            name = rng.choice(ALARM_REGISTRY[machine_type])[0]
+            faults.append((machine_id, name, start, start + rng.uniform(args.fault_min, args.fault_max)))
+            start += rng.uniform(0.5, 1.5) * args.fault_every
+    active = {}
+    for fault in faults:
+        active.setdefault(fault[0], []).append(fault)
+
+    messages = []
+    for tick in range(int(args.duration / PUBLISH_INTERVAL)):
+        now = tick * PUBLISH_INTERVAL
+        for machine_type, machine_id, generator in fleet:
+            payload = json.loads(json.dumps(generator.generate_mock_data()["alarms"]))
+            for _, name, start, end in active.get(machine_id, ()):
+                if start <= now < end:
+                    payload[name] = True
+            messages.append((now, machine_type, machine_id, payload))
+    return messages, faults
+
+
+def run(engine, messages, faults):
+    """Events emitted, and the detection delay of each fault (None when it was never reported raised)"""
+    pending = {}  # machine_id -> faults not yet detected
+    for fault in faults:
+        pending.setdefault(fault[0], []).append(fault)
+    delays = {}
+    events = flapping = 0
+    started = time.perf_counter()
+    for now, machine_type, machine_id, payload in messages:
+        for transition in engine.update(machine_type, machine_id, payload, now, now):
+            events += 1
+            flapping += transition.flaps > 0
+        watching = pending.get(machine_id)
+        if watching:
+            reported = engine[machine_type].get(machine_id)
+            for fault in list(watching):
+                _, name, start, end = fault
+                if now >= end:
+                    watching.remove(fault)
+                elif now >= start and reported & next(a.mask for a in engine[machine_type].alarms if a.name == name):
+                    delays[fault] = now - start
+                    watching.remove(fault)
+    elapsed = time.perf_counter() - started
+    return events, flapping, [delays.get(fault) for fault in faults], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machines", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=3600.0, help="simulated seconds")
+    parser.add_argument("--min-on", type=float, default=2.0)
+    parser.add_argument("--min-off", type=float, default=2.0)
+    parser.add_argument("--flap-transitions", type=int, default=4)
+    parser.add_argument("--flap-window", type=float, default=120.0)
+    parser.add_argument("--fault-every", type=float, default=600.0)
+    parser.add_argument("--fault-min", type=float, default=30.0)
+    parser.add_argument("--fault-max", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    messages, faults = simulate(args)
+    print(f"📊 {len(messages):,} alarm messages ({args.machines} machines, {args.duration:.0f}s), "
+          f"{len(faults):,} sustained faults of {args.fault_min:.0f}-{args.fault_max:.0f}s")
+    baseline = None
+    for name, engine in (("unfiltered", AlarmEngine()),
+                         (f"min on/off {args.min_on:g}/{args.min_off:g}s, flap {args.flap_transitions} "
+                          f"in {args.flap_window:g}s",
+                          AlarmEngine(min_on=args.min_on, min_off=args.min_off,
+                                      flap_transitions=args.flap_transitions, flap_window=args.flap_window))):
+        events, flapping, delays, elapsed = run(engine, messages, faults)
+        baseline = baseline or events
+        detected = sorted(delay for delay in delays if delay is not None)
+        print(f"   {name}")
+        print(f"      events {events:>9,} ({baseline / max(events, 1):.1f}x fewer), {flapping:,} flapping episodes, "
+              f"{events / (args.duration / 3600) / args.machines:,.1f} events/machine/hour")
+        print(f"      faults reported {len(detected):,}/{len(faults):,}, delay p50 "
+              f"{detected[len(detected) // 2] if detected else 0:.0f}s max {detected[-1] if detected else 0:.0f}s, "
+              f"{len(messages) / elapsed:,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Alarm Engine Benchmark - Transition detection throughput of the bitmask
+engine against the previous per-alarm dict comparison
+
+Generates alarm payloads with the real mock_plc_agent and lathe_sim tag
+generators for a fleet of MACHINES publishing at RATE msg/s each (10k x 0.5 Hz
+by default: 5,000 msg/s), runs them through both implementations (transition
+detection plus the event dict and WebSocket message of every transition; the
+journal, InfluxDB and broadcasts are left out) and reports msg/s, the share of
+one core the fleet needs, and the size of the per-machine state. Both must
+produce identical events and messages.
+
+Usage: python benchmarks/bench_alarm_engine.py [--machines 10000] [--lathes 5000]
+       [--rate 0.5] [--ticks 10] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "alarm_monitor"))
+from lathe_sim.lathe_sim import LatheState
+from mock_plc_agent.mock_plc_agent import BottleFillerTags
+from alarm_engine import AlarmEngine
+
+GENERATORS = 100  # Tag generators per machine type, shared round-robin by the fleet
+
+
+def fleet_payloads(machines, lathes, ticks):
+    """[(machine_type, machine_id, decoded alarms payload)] for `ticks` publish cycles of the fleet"""
+    fillers = [BottleFillerTags() for _ in range(GENERATORS)]
+    for tags in fillers:
+        tags.system_running = True
+    lathe_states = [LatheState() for _ in range(GENERATORS)]
+    fleet = [("lathe", f"lathe{i:05d}") if i < lathes else ("bottlefiller", f"machine-{i:05d}")
+             for i in range(machines)]
+    messages = []
+    for _ in range(ticks):
+        for i, (machine_type, machine_id) in enumerate(fleet):
+            generator = (lathe_states if machine_type == "lathe" else fillers)[i % GENERATORS]
+            alarms = generator.generate_mock_data()["alarms"]
+            messages.append((machine_type, machine_id, json.loads(json.dumps(alarms))))
+    return messages
+
+
+class LegacyDetector:
+    """check_alarm_transitions() and the alarms dict built in on_message() before the engine"""
+
+    def __init__(self, sink):
+        self.previous_alarms = {}
+        self.sink = sink
+
+    def on_message(self, machine_type, machine_id, payload, timestamp):
+        alarms = {}
+        if machine_type == "lathe":
+            for key in ("spindle_overload", "chuck_not_clamped", "door_open", "tool_wear", "coolant_low"):
+                if key in payload:
+                    alarms[key] = payload[key]
+        else:
+            for key in ("LowProductLevel", "Overfill", "Underfill", "CapMissing"):
+                if key in payload:
+                    alarms[key] = payload[key]
+        if alarms:
+            self.check_alarm_transitions(machine_id, alarms, timestamp, machine_type)
+
+    def check_alarm_transitions(self, machine_id, alarms, timestamp, machine_type):
+        if machine_type == "lathe":
+            alarm_map = {
+                "spindle_overload": "AlarmSpindleOverload",
+                "chuck_not_clamped": "AlarmChuckNotClamped",
+                "door_open": "AlarmDoorOpen",
+                "tool_wear": "AlarmToolWear",
+                "coolant_low": "AlarmCoolantLow",
+            }
+        else:
+            alarm_map = {
+                "Overfill": "AlarmOverfill",
+                "Underfill": "AlarmUnderfill",
+                "LowProductLevel": "AlarmLowProductLevel",
+                "CapMissing": "AlarmCapMissing",
+            }
+        prev = self.previous_alarms.get(machine_id, {})
+        for alarm_key, alarm_name in alarm_map.items():
+            current_value = alarms.get(alarm_key, False)
+            prev_value = prev.get(alarm_key, False)
+            if not prev_value and current_value:
+                self.record(machine_id, alarm_key, alarm_name, "RAISED", True, timestamp, machine_type)
+            elif prev_value and not current_value:
+                self.record(machine_id, alarm_key, alarm_name, "CLEARED", False, timestamp, machine_type)
+        self.previous_alarms[machine_id] = alarms.copy()
+
+    def record(self, machine_id, alarm_key, alarm_name, state, value, timestamp, machine_type):
+        event = {
+            "timestamp": timestamp,
+            "machine_id": machine_id,
+            "alarm_name": alarm_key,
+            "alarm_type": alarm_name,
+            "alarm_label": alarm_key,
+            "state": state,
+            "value": value,
+            "machine_type": machine_type,
+        }
+        ws_message = json.dumps({
+            "machine_id": machine_id,
+            "alarm_name": alarm_key,
+            "alarm_type": alarm_name,
+            "state": state,
+            "timestamp": timestamp,
+        })
+        self.sink(event, ws_message)
+
+    def state_bytes(self):
+        return sys.getsizeof(self.previous_alarms) + sum(sys.getsizeof(alarms)
+                                                         for alarms in self.previous_alarms.values())
+
+
+class EngineDetector:
+    """alarm_monitor.check_alarm_transitions() on the AlarmEngine"""
+
+    def __init__(self, sink):
+        self.engine = AlarmEngine()
+        self.sink = sink
+
+    def on_message(self, machine_type, machine_id, payload, timestamp):
+        transitions = self.engine.update(machine_type, machine_id, payload, timestamp)
+        if not transitions:
+            return
+        machine_id_json = json.dumps(machine_id)
+        timestamp_json = json.dumps(timestamp)
+        for alarm, raised, changed_at, flaps in transitions:
+            self.sink(alarm.event(machine_id, changed_at, raised, flaps),
+                      alarm.message(machine_id_json, timestamp_json, raised, flaps))
+
+    def state_bytes(self):
+        return sum(sys.getsizeof(alarms.slots) + sys.getsizeof(alarms.masks) for alarms in self.engine.types.values())
+
+
+def run(detector_class, messages, timestamp, record=False):
+    output = []
+    count = [0]
+
+    def sink(event, message):
+        count[0] += 1
+        if record:
+            output.append((event, message))
+
+    detector = detector_class(sink)
+    on_message = detector.on_message
+    started = time.perf_counter()
+    for machine_type, machine_id, payload in messages:
+        on_message(machine_type, machine_id, payload, timestamp)
+    elapsed = time.perf_counter() - started
+    return elapsed, count[0], detector.state_bytes(), output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machines", type=int, default=10000)
+    parser.add_argument("--lathes", type=int, default=5000, help="how many of the machines are lathes")
+    parser.add_argument("--rate", type=float, default=0.5, help="alarm messages per machine per second")
+    parser.add_argument("--ticks", type=int, default=10, help="publish cycles of the whole fleet")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"⏳ Generating {args.machines * args.ticks:,} alarm payloads "
+          f"({args.machines:,} machines, {args.lathes:,} lathes, {args.ticks} cycles)...")
+    messages = fleet_payloads(args.machines, args.lathes, args.ticks)
+    timestamp = "2026-01-01T00:00:00.000000Z"
+
+    _, _, _, legacy_output = run(LegacyDetector, messages, timestamp, record=True)
+    _, _, _, engine_output = run(EngineDetector, messages, timestamp, record=True)
+    if legacy_output != engine_output:
+        print("❌ The engine's events or messages differ from the previous implementation")
+        sys.exit(1)
+
+    required = args.machines * args.rate
+    print(f"📊 {len(messages):,} messages, {len(engine_output):,} transitions "
+          f"(fleet needs {required:,.0f} msg/s)")
+    results = {}
+    for name, detector_class in (("dict walk", LegacyDetector), ("bitmask", EngineDetector)):
+        elapsed, transitions, state_bytes, _ = min((run(detector_class, messages, timestamp)
+                                                    for _ in range(args.repeat)), key=lambda result: result[0])
+        rate = len(messages) / elapsed
+        results[name] = rate
+        print(f"   {name:<10} {rate:>10,.0f} msg/s  {elapsed / len(messages) * 1e6:6.2f} us/msg  "
+              f"{required / rate:6.1%} of a core  state {state_bytes / 1024:8,.0f} KiB")
+    print(f"   speedup {results['bitmask'] / results['dict walk']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
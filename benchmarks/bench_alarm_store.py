@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Alarm Store Benchmark - Query latency of the in-memory alarm event store on a
+full retention window
+
+Fills the store with --hours of alarm events for a fleet (RAISED/CLEARED
+pairs at --rate events per machine per hour, spread over the registered
+alarms) and times the queries the dashboards make: the latest page of
+everything, one machine's last 24h, one machine and alarm type, a state
+filter across machines, a deep page, and the active durations of one machine
+and of the whole fleet. Reports the mean and worst latency of each, plus the
+insert rate.
+
+Usage: python benchmarks/bench_alarm_store.py [--machines 1000] [--hours 24] [--rate 20] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "alarm_monitor"))
+from alarm_engine import AlarmEngine
+from alarm_store import AlarmEventStore, handle_query, iso
+
+
+def fleet_events(machines, hours, rate, now, seed):
+    """Time-ordered alarm events: each alarm episode is a RAISED and, some time later, a CLEARED"""
+    rng = random.Random(seed)
+    engine = AlarmEngine()
+    events = []
+    for i in range(machines):
+        machine_type = "lathe" if i % 2 else "bottlefiller"
+        machine_id = f"lathe{i:04d}" if i % 2 else f"machine-{i:04d}"
+        alarms = engine[machine_type].alarms
+        start = now - hours * 3600
+        for _ in range(int(rate * hours / 2)):
+            alarm = rng.choice(alarms)
+            raised_at = rng.uniform(start, now)
+            events.append((raised_at, alarm.event(machine_id, iso(raised_at), True)))
+            cleared_at = raised_at + rng.expovariate(1 / 120)
+            if cleared_at < now:
+                events.append((cleared_at, alarm.event(machine_id, iso(cleared_at), False)))
+    events.sort(key=lambda entry: entry[0])
+    return [event for _, event in events]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machines", type=int, default=1000)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--rate", type=float, default=20.0, help="alarm events per machine per hour")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    now = time.time()
+    events = fleet_events(args.machines, args.hours, args.rate, now, args.seed)
+    store = AlarmEventStore(retention=args.hours * 3600 + 60, max_events=len(events) + 1)
+    started = time.perf_counter()
+    store.seed(events)
+    elapsed = time.perf_counter() - started
+    store.complete_since = now - store.retention  # As after the warm-up from InfluxDB
+    print(f"📊 {len(store):,} events ({args.machines:,} machines, {args.hours:g}h), "
+          f"inserted at {len(events) / elapsed:,.0f} events/s")
+
+    machine = events[len(events) // 2]["machine_id"]
+    alarm_type = events[len(events) // 2]["alarm_type"]
+    queries = (
+        ("latest 500, all machines", "/events", {"start": ["-24h"], "limit": ["500"]}),
+        ("one machine, 24h", "/events", {"start": ["-24h"], "machine_id": [machine], "limit": ["500"]}),
+        ("one machine + alarm type", "/events", {"start": ["-24h"], "machine_id": [machine],
+                                                 "alarm_type": [alarm_type], "limit": ["500"]}),
+        ("RAISED, 10 machines, 1h", "/events", {"start": ["-1h"], "state": ["RAISED"], "limit": ["100"],
+                                                "machine_id": [",".join(e["machine_id"] for e in events[:10])]}),
+        ("page at offset 10,000", "/events", {"start": ["-24h"], "limit": ["100"], "offset": ["10000"]}),
+        ("durations, one machine", "/durations", {"start": ["-24h"], "machine_id": [machine]}),
+        ("durations, whole fleet", "/durations", {"start": ["-24h"]}),
+    )
+    for name, path, params in queries:
+        timings = []
+        repeat = args.repeat if "fleet" not in name else max(args.repeat // 20, 3)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            status, body = handle_query(store, path, params, now)
+            timings.append(time.perf_counter() - started)
+        rows = len(body.get("events", body.get("durations", [])))
+        print(f"   {name:<28} {rows:>6,} rows  mean {sum(timings) / len(timings) * 1e6:>10,.0f} us  "
+              f"max {max(timings) * 1e6:>10,.0f} us  complete={body['complete']}")
+
+
+if __name__ == "__main__":
+    main()
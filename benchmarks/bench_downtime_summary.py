@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Downtime Summary Benchmark - Per-request downtime over raw samples against
+precomputed daily summaries plus a live tail
+
+Generates --days of 2-second lathe samples (downtime signal episodes at
+--episodes per day) and computes the downtime of the last --range days and
+of the period before it, as the dashboard does:
+  raw      every sample of both periods scanned per request (the per-sample
+           transition loop of the API route)
+  summary  the daily rows of both periods summed, plus the last --tail
+           seconds of raw samples scanned (the job's cost, summarize_day()
+           per day, is reported separately: it runs once per day, not per
+           request)
+Periods here are whole days (the route clips the first day with its
+downtime_period points). Both must find the same downtime. Reports the time
+of each.
+
+Needs NumPy (pip install numpy).
+
+Usage: python benchmarks/bench_downtime_summary.py [--days 14] [--range 7] [--episodes 40] [--tail 300]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "downtime_summary"))
+from common.bool_series import np
+from downtime_summary import DAY, DOWNTIME_SIGNALS, new_state, summarize_day
+
+INTERVAL = 2  # seconds between samples
+START = 1767225600.0  # 2026-01-01
+
+
+def lathe_columns(days, episodes, seed):
+    """read_columns()-style columns of every sample"""
+    rng = np.random.default_rng(seed)
+    samples = int(days * DAY / INTERVAL)
+    columns = {"_time": START + np.arange(samples, dtype=np.float64) * INTERVAL}
+    for field in DOWNTIME_SIGNALS["lathe"]:
+        on = np.zeros(samples + 1, dtype=np.int64)
+        starts = rng.choice(samples, size=int(episodes * days / len(DOWNTIME_SIGNALS["lathe"])), replace=False)
+        np.add.at(on, starts, 1)
+        np.add.at(on, np.minimum(starts + rng.integers(5, 300, len(starts)), samples), -1)
+        columns[field] = np.where(np.cumsum(on[:-1]) > 0, "true", "false").astype(object)
+    parts = np.cumsum(rng.random(samples) < 0.05)
+    columns["PartsCompleted"] = parts.astype(str).astype(object)
+    columns["PartsRejected"] = (parts // 30).astype(str).astype(object)
+    return columns
+
+
+def raw_downtime(rows, start, end, down=False):
+    """The API route's loop: a period from each up->down to the next down->up (down: at start)"""
+    total = 0.0
+    down_since = start if down else None
+    for row in rows:
+        t = row["_time"]
+        if t < start or t >= end:
+            continue
+        is_down = row["Fault"] or row["AlarmChuckNotClamped"] or row["AlarmDoorOpen"]
+        if is_down and down_since is None:
+            down_since = t
+        elif not is_down and down_since is not None:
+            total += t - down_since
+            down_since = None
+    if down_since is not None:
+        total += end - down_since
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--range", type=int, default=7, help="days per dashboard period (two are computed)")
+    parser.add_argument("--episodes", type=float, default=40.0, help="downtime episodes per day")
+    parser.add_argument("--tail", type=float, default=300.0, help="seconds of raw data after the last summary")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if np is None:
+        print("❌ NumPy is not installed (pip install numpy)")
+        sys.exit(1)
+    if args.days < 2 * args.range:
+        parser.error("--days must cover two --range periods")
+
+    columns = lathe_columns(args.days, args.episodes, args.seed)
+    times = columns["_time"]
+    end = START + args.days * DAY
+    until = end - args.tail  # The job's last run
+    print(f"📊 {len(times):,} samples ({args.days} days at {INTERVAL}s), "
+          f"{args.range}d range + previous {args.range}d, {args.tail:g}s live tail")
+
+    # The job: one summarize_day() per day up to its last run, carrying the state
+    started = time.perf_counter()
+    daily = []
+    state = new_state()
+    for day in range(args.days):
+        day_start, day_stop = START + day * DAY, min(START + (day + 1) * DAY, until)
+        lo, hi = np.searchsorted(times, [day_start, day_stop])
+        summary, _, state = summarize_day("lathe", day_start, day_stop,
+                                          {name: values[lo:hi] for name, values in columns.items()}, state, gap=0)
+        daily.append(summary)
+    job_elapsed = time.perf_counter() - started
+
+    # Rows as the query returns them (building them is not timed)
+    rows = [{"_time": t, **{field: columns[field][i] == "true" for field in DOWNTIME_SIGNALS["lathe"]}}
+            for i, t in enumerate(times.tolist())]
+    tail_rows = rows[int(np.searchsorted(times, until)):]
+    periods = [(end - args.range * DAY, end), (end - 2 * args.range * DAY, end - args.range * DAY)]
+
+    # Per request, raw: every sample of both periods
+    started = time.perf_counter()
+    raw = [raw_downtime(rows, start, stop) for start, stop in periods]
+    raw_elapsed = time.perf_counter() - started
+
+    # Per request, summary: the daily rows of both periods, plus the tail after the job's last run
+    started = time.perf_counter()
+    summed = [sum(day["downtime"] for day in daily[int((start - START) // DAY):int((stop - START) // DAY)])
+              for start, stop in periods]
+    summed[0] += raw_downtime(tail_rows, until, end, state["down"])
+    summary_elapsed = time.perf_counter() - started
+
+    if any(abs(a - b) > 1e-6 for a, b in zip(raw, summed)):
+        print(f"❌ Summaries disagree with the raw scan: {summed} != {raw}")
+        sys.exit(1)
+    print(f"   job          {job_elapsed:>8.3f}s  ({job_elapsed / args.days * 1000:,.1f} ms per machine-day)")
+    print(f"   raw          {raw_elapsed * 1000:>8.1f} ms per request  ({2 * args.range * DAY / INTERVAL:,.0f} samples)")
+    print(f"   summary      {summary_elapsed * 1000:>8.1f} ms per request  "
+          f"({2 * args.range} daily rows + {len(tail_rows):,} tail samples)")
+    print(f"   downtime {raw[0] / 3600:,.1f}h (previous {raw[1] / 3600:,.1f}h), "
+          f"{raw_elapsed / max(summary_elapsed, 1e-9):,.0f}x less work per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmark - End-to-end latency and throughput of the real
+influxdb_writer_production and alarm_monitor processes, without any external
+services
+
+Starts an in-process MQTT broker stand-in (benchmarks/mqtt_broker.py) and a
+stub InfluxDB (benchmarks/influx_stub.py), launches both services against
+them as subprocesses, then:
+
+  1. publishes mock_plc_agent / lathe_sim payloads at MACHINES x RATE msg/s
+     for DURATION seconds and reports p50/p90/p99 latency from publish to the
+     InfluxDB write (payload timestamp vs. arrival at the stub)
+  2. toggles bottlefiller alarms at the same rate and reports p50/p90/p99
+     latency from publish to the WebSocket broadcast
+  3. (--saturate N) publishes N messages of each kind as fast as possible and
+     reports the throughput each service sustained
+
+Results can be saved with --output and compared against a saved run with
+--baseline (exit code 1 when throughput drops or p99 latency grows by more
+than --tolerance).
+
+Usage: python benchmarks/bench_pipeline.py [--machines 20] [--lathes 10] [--rate 0.5]
+       [--duration 20] [--alarm-machines 20] [--saturate 20000] [--influx-latency-ms 0]
+       [--batch-size 500] [--flush-interval 1.0] [--shards 1]
+       [--output results.json] [--baseline results.json] [--tolerance 0.2]
+"""
+import argparse
+import collections
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+from websockets.sync.client import connect as ws_connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks.influx_stub import InfluxStub
+from benchmarks.mqtt_broker import MiniBroker
+from lathe_sim.lathe_sim import LatheState
+from mock_plc_agent.mock_plc_agent import BottleFillerTags
+
+DATA_BUCKET = "bench_plc_data"
+ALARM_BUCKET = "bench_alarm_events"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0, "p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(values)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {"count": len(ordered), "p50_ms": at(0.50), "p90_ms": at(0.90), "p99_ms": at(0.99),
+            "max_ms": ordered[-1] * 1000}
+
+
+def wait_for(condition, timeout, interval=0.05):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
+
+
+class Service:
+    """One service under test, run as a subprocess with its output in a log file"""
+
+    def __init__(self, name, script, env, log_dir):
+        self.name = name
+        self.log_path = os.path.join(log_dir, f"{name}.log")
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen([sys.executable, "-u", os.path.join(ROOT, script)], cwd=ROOT,
+                                        env={**os.environ, **env}, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def check(self):
+        if self.process.poll() is not None:
+            raise RuntimeError(f"{self.name} exited with code {self.process.returncode}, see {self.log_path}")
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(2)  # SIGINT: flush and exit
+            try:
+                self.process.wait(15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._log.close()
+
+
+class AlarmListener:
+    """WebSocket client timing alarm broadcasts against their publish times"""
+
+    def __init__(self, url):
+        self.url = url
+        self.pending = collections.defaultdict(collections.deque)  # (machine, alarm, state) -> publish times
+        self.latencies = []
+        self.received = 0
+        self._lock = threading.Lock()
+        self._socket = ws_connect(url, open_timeout=10)
+        threading.Thread(target=self._run, name="alarm-listener", daemon=True).start()
+
+    def expect(self, key):
+        with self._lock:
+            self.pending[key].append(time.perf_counter())
+
+    def _run(self):
+        try:
+            for message in self._socket:
+                now = time.perf_counter()
+                event = json.loads(message)
+                key = (event.get("machine_id"), event.get("alarm_name"), event.get("state"))
+                with self._lock:
+                    self.received += 1
+                    if self.pending[key]:
+                        self.latencies.append(now - self.pending[key].popleft())
+        except Exception:
+            pass
+
+    def close(self):
+        self._socket.close()
+
+
+class Publisher:
+    """Paho client publishing like the producers do (QoS 1)"""
+
+    def __init__(self, port):
+        self.client = mqtt.Client(client_id=f"bench_publisher_{os.getpid()}", clean_session=True)
+        self.client.max_inflight_messages_set(1000)
+        self.client.max_queued_messages_set(0)
+        self.client.connect("127.0.0.1", port, 60)
+        self.client.loop_start()
+
+    def publish(self, topic, payload):
+        self.client.publish(topic, payload, qos=1)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def paced(total, rate, send):
+    """Call send(i) for i in range(total) at `rate` calls per second"""
+    started = time.perf_counter()
+    for i in range(total):
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        send(i)
+    return time.perf_counter() - started
+
+
+def data_producers(machines, lathes):
+    producers = []
+    for index in range(machines):
+        tags = BottleFillerTags()
+        tags.system_running = True
+        producers.append((f"plc/bench-{index + 1:03d}/bottlefiller/data", tags))
+    for index in range(lathes):
+        producers.append((f"plc/bench-lathe{index + 1:03d}/lathe/data", LatheState()))
+    return producers
+
+
+def alarm_payload(raised):
+    return json.dumps({"Overfill": raised, "Underfill": False, "LowProductLevel": False, "CapMissing": False})
+
+
+def run_writer_latency(args, publisher, stub, producers):
+    total = int(len(producers) * args.rate * args.duration)
+    before = stub.total_points(DATA_BUCKET)
+
+    def send(i):
+        topic, tags = producers[i % len(producers)]
+        publisher.publish(topic, json.dumps(tags.generate_mock_data()))
+
+    elapsed = paced(total, len(producers) * args.rate, send)
+    complete = wait_for(lambda: stub.total_points(DATA_BUCKET) - before >= total, args.drain_timeout)
+    result = percentiles(stub.latencies.get(DATA_BUCKET, []))
+    result.update(published=total, written=stub.total_points(DATA_BUCKET) - before,
+                  offered_rate=total / elapsed, complete=complete)
+    return result
+
+
+def run_alarm_latency(args, publisher, listener, states):
+    machines = len(states)
+    total = int(machines * args.rate * args.duration)
+    before = listener.received
+
+    def send(i):
+        machine = i % machines
+        states[machine] = not states[machine]
+        machine_id = f"bench-alarm-{machine + 1:03d}"
+        listener.expect((machine_id, "Overfill", "RAISED" if states[machine] else "CLEARED"))
+        publisher.publish(f"plc/{machine_id}/bottlefiller/alarms", alarm_payload(states[machine]))
+
+    elapsed = paced(total, machines * args.rate, send)
+    complete = wait_for(lambda: listener.received - before >= total, args.drain_timeout)
+    result = percentiles(listener.latencies)
+    result.update(published=total, broadcast=listener.received - before,
+                  offered_rate=total / elapsed, complete=complete)
+    return result
+
+
+def run_saturation(args, publisher, stub, listener, producers, states):
+    # Payloads generated up front so the publisher is not the bottleneck
+    payloads = [(producers[i % len(producers)][0], json.dumps(producers[i % len(producers)][1].generate_mock_data()))
+                for i in range(args.saturate)]
+    before = stub.total_points(DATA_BUCKET)
+    started = time.perf_counter()
+    for topic, payload in payloads:
+        publisher.publish(topic, payload)
+    complete = wait_for(lambda: stub.total_points(DATA_BUCKET) - before >= args.saturate, args.drain_timeout)
+    writer_elapsed = time.perf_counter() - started
+    writer = {"messages": stub.total_points(DATA_BUCKET) - before, "seconds": writer_elapsed,
+              "throughput": (stub.total_points(DATA_BUCKET) - before) / writer_elapsed, "complete": complete}
+
+    machines = len(states)
+    before = listener.received
+    started = time.perf_counter()
+    for i in range(args.saturate):
+        machine = i % machines
+        states[machine] = not states[machine]
+        publisher.publish(f"plc/bench-alarm-{machine + 1:03d}/bottlefiller/alarms", alarm_payload(states[machine]))
+    complete = wait_for(lambda: listener.received - before >= args.saturate, args.drain_timeout)
+    alarm_elapsed = time.perf_counter() - started
+    alarms = {"messages": listener.received - before, "seconds": alarm_elapsed,
+              "throughput": (listener.received - before) / alarm_elapsed, "complete": complete}
+    return writer, alarms
+
+
+def print_latency(title, result, unit):
+    print(f"📊 {title}: {result['published']:,} published @ {result['offered_rate']:,.0f} msg/s, "
+          f"{result.get('written', result.get('broadcast')):,} {unit}"
+          f"{'' if result['complete'] else ' (INCOMPLETE)'}")
+    if result["count"]:
+        print(f"   latency p50 {result['p50_ms']:.1f} ms | p90 {result['p90_ms']:.1f} ms | "
+              f"p99 {result['p99_ms']:.1f} ms | max {result['max_ms']:.1f} ms")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against a saved baseline run"""
+    regressions = []
+    for section in ("writer_latency", "alarm_latency"):
+        old, new = baseline.get(section, {}).get("p99_ms"), results.get(section, {}).get("p99_ms")
+        if old and new and new > old * (1 + tolerance):
+            regressions.append(f"{section} p99 {old:.1f} -> {new:.1f} ms")
+    for section in ("writer_saturation", "alarm_saturation"):
+        old, new = baseline.get(section, {}).get("throughput"), results.get(section, {}).get("throughput")
+        if old and new and new < old * (1 - tolerance):
+            regressions.append(f"{section} throughput {old:,.0f} -> {new:,.0f} msg/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machines", type=int, default=20, help="bottlefiller producers")
+    parser.add_argument("--lathes", type=int, default=10, help="lathe producers")
+    parser.add_argument("--alarm-machines", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=0.5, help="messages per second per machine")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per latency run")
+    parser.add_argument("--saturate", type=int, default=0, help="messages per saturation run (0 skips)")
+    parser.add_argument("--influx-latency-ms", type=float, default=0.0, help="added to every stub write")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--keep-logs", action="store_true")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    broker = MiniBroker().start()
+    stub = InfluxStub(latency=args.influx_latency_ms / 1000, timed_buckets=(DATA_BUCKET,)).start()
+    ws_port = free_port()
+    common_env = {
+        "MQTT_BROKER_HOST": "127.0.0.1",
+        "MQTT_BROKER_PORT": str(broker.port),
+        "MQTT_TLS_ENABLED": "false",
+        "INFLUXDB_URL": stub.url,
+        "LOG_LEVEL": "WARNING",
+        "LOG_SUMMARY_INTERVAL": "0",
+    }
+    print(f"🧪 Broker on :{broker.port}, InfluxDB stub on :{stub.port}, logs in {work_dir}")
+    services = []
+    publisher = listener = None
+    try:
+        writer = Service("influxdb_writer", "influxdb_writer/influxdb_writer_production.py", {
+            **common_env,
+            "INFLUXDB_BUCKET": DATA_BUCKET,
+            "WRITE_BATCH_SIZE": str(args.batch_size),
+            "WRITE_FLUSH_INTERVAL": str(args.flush_interval),
+            "WRITER_SHARDS": str(args.shards),
+            "WRITER_STATS_INTERVAL": "0",
+            "WRITER_METRICS_PORT": "0",
+            "SPOOL_DIR": os.path.join(work_dir, "spool"),
+        }, work_dir)
+        services.append(writer)
+        alarms = Service("alarm_monitor", "alarm_monitor/alarm_monitor.py", {
+            **common_env,
+            "INFLUXDB_BUCKET_ALARMS": ALARM_BUCKET,
+            "WS_HOST": "127.0.0.1",
+            "WS_PORT": str(ws_port),
+            "ALARM_EVENTS_FILE": os.path.join(work_dir, "alarm_events.json"),
+            "ALARM_METRICS_PORT": "0",
+        }, work_dir)
+        services.append(alarms)
+
+        # Ready once both services subscribed (every shard in hash mode) and the WebSocket is up
+        expected = args.shards
+        if not wait_for(lambda: broker.subscriber_count("plc/x/bottlefiller/data") >= expected
+                        and broker.subscriber_count("plc/x/bottlefiller/alarms") >= 1, 30):
+            for service in services:
+                service.check()
+            raise RuntimeError("Services did not subscribe within 30s")
+        listener = AlarmListener(f"ws://127.0.0.1:{ws_port}")
+        publisher = Publisher(broker.port)
+        print(f"✅ Services ready ({args.machines} bottlefillers, {args.lathes} lathes, "
+              f"{args.alarm_machines} alarm machines @ {args.rate} msg/s each)\n")
+
+        results = {"config": vars(args)}
+        producers = data_producers(args.machines, args.lathes)
+        # Current alarm state per machine, so every publish is a transition
+        alarm_states = [False] * args.alarm_machines
+        results["writer_latency"] = run_writer_latency(args, publisher, stub, producers)
+        print_latency("Publish -> InfluxDB write", results["writer_latency"], "written")
+        results["alarm_latency"] = run_alarm_latency(args, publisher, listener, alarm_states)
+        print_latency("Publish -> WebSocket alarm broadcast", results["alarm_latency"], "broadcast")
+
+        if args.saturate:
+            writer_result, alarm_result = run_saturation(args, publisher, stub, listener, producers, alarm_states)
+            results["writer_saturation"], results["alarm_saturation"] = writer_result, alarm_result
+            for title, result in (("InfluxDB writer", writer_result), ("Alarm monitor", alarm_result)):
+                print(f"🚀 {title} throughput: {result['throughput']:,.0f} msg/s "
+                      f"({result['messages']:,} in {result['seconds']:.1f}s"
+                      f"{'' if result['complete'] else ', INCOMPLETE'})")
+        for service in services:
+            service.check()
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"\n💾 Results saved to {args.output}")
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            if regressions:
+                print("\n❌ Regressions against baseline:")
+                for regression in regressions:
+                    print(f"   {regression}")
+                sys.exit(1)
+            print(f"\n✅ Within {args.tolerance:.0%} of baseline")
+    finally:
+        if listener is not None:
+            listener.close()
+        if publisher is not None:
+            publisher.close()
+        for service in services:
+            service.stop()
+        broker.stop()
+        stub.stop()
+        if not args.keep_logs:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
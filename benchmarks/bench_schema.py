@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Schema Converter Benchmark - Messages per second per core for turning MQTT
+payloads into InfluxDB line protocol
+
+Compares the previous hand-written Point builder (before) with the compiled
+schema converter (after) on bottlefiller and lathe payloads from
+mock_plc_agent and lathe_sim. Both paths produce identical line protocol,
+which is checked before timing.
+
+Usage: python benchmarks/bench_schema.py [--messages 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from influxdb_client import Point
+from influxdb_writer.schema import compile_schemas, detect_schema
+from benchmarks.payloads import bottlefiller_messages, lathe_messages
+
+CONVERTERS = compile_schemas()
+
+
+def parse_time(data):
+    return datetime.fromisoformat(data["timestamp"].replace('Z', '+00:00'))
+
+
+def legacy_point(topic, data):
+    """The writer's original Point-based conversion (before the schema compiler)"""
+    machine_id = topic.split('/')[1]
+    if "counters" in data:
+        status = data.get("status", {})
+        counters = data.get("counters", {})
+        alarms = data.get("alarms", {})
+        analog = data.get("analog", {})
+        inputs = data.get("inputs", {})
+        fault = bool(status.get("Fault", False))
+        return Point("plc_data") \
+            .tag("machine_id", machine_id) \
+            .tag("machine_type", "bottlefiller") \
+            .field("SystemRunning", bool(status.get("SystemRunning", False))) \
+            .field("Fault", fault) \
+            .field("Filling", bool(status.get("Filling", False))) \
+            .field("Ready", bool(status.get("Ready", False))) \
+            .field("BottlesFilled", int(counters.get("BottlesFilled", 0))) \
+            .field("BottlesRejected", int(counters.get("BottlesRejected", 0))) \
+            .field("BottlesPerMinute", float(counters.get("BottlesPerMinute", 0.0))) \
+            .field("AlarmFault", bool(alarms.get("Fault", False) or fault)) \
+            .field("AlarmOverfill", bool(alarms.get("Overfill", False))) \
+            .field("AlarmUnderfill", bool(alarms.get("Underfill", False))) \
+            .field("AlarmLowProductLevel", bool(alarms.get("LowProductLevel", False))) \
+            .field("AlarmCapMissing", bool(alarms.get("CapMissing", False))) \
+            .field("FillLevel", float(analog.get("FillLevel", 0.0))) \
+            .field("TankTemperature", float(analog.get("TankTemperature", 0.0))) \
+            .field("TankPressure", float(analog.get("TankPressure", 0.0))) \
+            .field("FillFlowRate", float(analog.get("FillFlowRate", 0.0))) \
+            .field("ConveyorSpeed", float(analog.get("ConveyorSpeed", 0.0))) \
+            .field("LowLevelSensor", bool(inputs.get("LowLevel", False))) \
+            .time(parse_time(data))
+
+    safety = data.get("safety", {})
+    spindle = data.get("spindle", {})
+    axis_x = data.get("axis_x", {})
+    axis_z = data.get("axis_z", {})
+    production = data.get("production", {})
+    alarms = data.get("alarms", {})
+    status = data.get("status", {})
+    tooling = data.get("tooling", {})
+    coolant = data.get("coolant", {})
+    return Point("plc_data") \
+        .tag("machine_id", machine_id) \
+        .tag("machine_type", "lathe") \
+        .field("DoorClosed", bool(safety.get("door_closed", False))) \
+        .field("EStopOK", bool(safety.get("estop_ok", False))) \
+        .field("SpindleSpeed", float(spindle.get("speed_actual", 0.0))) \
+        .field("SpindleSpeedSetpoint", float(spindle.get("speed_setpoint", 0.0))) \
+        .field("SpindleLoad", float(spindle.get("load_percent", 0.0))) \
+        .field("AxisXPosition", float(axis_x.get("position", 0.0))) \
+        .field("AxisXFeedrate", float(axis_x.get("feedrate", 0.0))) \
+        .field("AxisXHomed", bool(axis_x.get("homed", False))) \
+        .field("AxisZPosition", float(axis_z.get("position", 0.0))) \
+        .field("AxisZFeedrate", float(axis_z.get("feedrate", 0.0))) \
+        .field("AxisZHomed", bool(axis_z.get("homed", False))) \
+        .field("CycleTime", float(production.get("cycle_time_seconds", 0.0))) \
+        .field("PartsCompleted", int(production.get("parts_completed", 0))) \
+        .field("PartsRejected", int(production.get("parts_rejected", 0))) \
+        .field("PartsPerHour", float(production.get("parts_per_hour", 0.0))) \
+        .field("AlarmSpindleOverload", bool(alarms.get("spindle_overload", False))) \
+        .field("AlarmChuckNotClamped", bool(alarms.get("chuck_not_clamped", False))) \
+        .field("AlarmDoorOpen", bool(alarms.get("door_open", False))) \
+        .field("AlarmToolWear", bool(alarms.get("tool_wear", False))) \
+        .field("AlarmCoolantLow", bool(alarms.get("coolant_low", False))) \
+        .field("SystemRunning", bool(status.get("system_running", False))) \
+        .field("Machining", bool(status.get("machining", False))) \
+        .field("Ready", bool(status.get("ready", False))) \
+        .field("Fault", bool(status.get("fault", False))) \
+        .field("AutoMode", bool(status.get("auto_mode", False))) \
+        .field("ToolNumber", int(tooling.get("tool_number", 0))) \
+        .field("ToolLifePercent", float(tooling.get("tool_life_percent", 0.0))) \
+        .field("ToolOffsetX", float(tooling.get("tool_offset_x", 0.0))) \
+        .field("ToolOffsetZ", float(tooling.get("tool_offset_z", 0.0))) \
+        .field("CoolantFlowRate", float(coolant.get("flow_rate", 0.0))) \
+        .field("CoolantTemperature", float(coolant.get("temperature", 0.0))) \
+        .field("CoolantLevelPercent", float(coolant.get("level_percent", 0.0))) \
+        .time(parse_time(data))
+
+
+def before(topic, data):
+    return legacy_point(topic, data).to_line_protocol().encode()
+
+
+def after(topic, data):
+    converter = CONVERTERS[detect_schema(topic, data)]
+    dt = parse_time(data)
+    timestamp = int(dt.timestamp()) * 1_000_000_000 + dt.microsecond * 1000
+    return converter.to_line_protocol(data, topic.split('/')[1], timestamp)
+
+
+def rate(fn, messages, decode):
+    started = time.perf_counter()
+    if decode:
+        for topic, payload in messages:
+            fn(topic, json.loads(payload))
+    else:
+        for topic, data in messages:
+            fn(topic, data)
+    return len(messages) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, messages in (("bottlefiller", bottlefiller_messages(args.messages)),
+                           ("lathe", lathe_messages(args.messages))):
+        decoded = [(topic, json.loads(payload)) for topic, payload in messages]
+        for topic, data in decoded[:1000]:
+            assert before(topic, data) == after(topic, data), f"line protocol mismatch for {topic}"
+
+        print(f"📊 {name} ({len(messages)} messages, single core)")
+        for label, decode, items in (("convert only", False, decoded), ("with JSON decode", True, messages)):
+            old = rate(before, items, decode)
+            new = rate(after, items, decode)
+            print(f"   {label:<17} before {old:>9,.0f} msg/s | after {new:>9,.0f} msg/s | {new / old:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Spool Replay Benchmark - Measures how fast the InfluxDB writer spool drains
+after an outage, in points per second
+
+Fills a temporary spool with bottlefiller-sized line protocol batches and
+replays it against a stub write function that simulates the HTTP round trip
+of an InfluxDB write. Pass --url to replay against a real InfluxDB instead.
+
+Usage: python benchmarks/bench_spool_replay.py [--points 500000] [--latency-ms 20]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from influxdb_writer.spool import Spool
+
+SAMPLE_LINE = (
+    "plc_data,machine_id=machine-{machine:03d},machine_type=bottlefiller "
+    "AlarmCapMissing=false,AlarmFault=false,AlarmLowProductLevel=false,AlarmOverfill=false,"
+    "AlarmUnderfill=false,BottlesFilled={count}i,BottlesPerMinute=41.3,BottlesRejected=0i,"
+    "ConveyorSpeed=131.2,Fault=false,FillFlowRate=32.11,FillLevel=71.42,Filling=true,"
+    "LowLevelSensor=false,Ready=false,SystemRunning=true,TankPressure=12.31,TankTemperature=22.4 "
+    "{ts}"
+)
+
+
+def fill_spool(spool, points, batch_size):
+    base = time.time_ns()
+    written = 0
+    while written < points:
+        size = min(batch_size, points - written)
+        batch = [SAMPLE_LINE.format(machine=i % 200, count=written + i, ts=base + (written + i) * 1000)
+                 for i in range(size)]
+        spool.append(batch)
+        written += size
+
+
+def stub_writer(latency):
+    def write(payload, precision):
+        if latency:
+            time.sleep(latency)
+    return write
+
+
+def influxdb_writer(url, token, org, bucket):
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+    client = InfluxDBClient(url=url, token=token, org=org)
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+
+    def write(payload, precision):
+        write_api.write(bucket=bucket, record=payload, write_precision=precision)
+    return write
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=500000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated write round trip")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--url", help="replay into a real InfluxDB instead of the stub")
+    parser.add_argument("--token", default=os.getenv("INFLUXDB_TOKEN", "my-super-secret-auth-token"))
+    parser.add_argument("--org", default=os.getenv("INFLUXDB_ORG", "myorg"))
+    parser.add_argument("--bucket", default="spool_benchmark")
+    args = parser.parse_args()
+
+    if args.url:
+        write_fn = influxdb_writer(args.url, args.token, args.org, args.bucket)
+        target = args.url
+    else:
+        write_fn = stub_writer(args.latency_ms / 1000)
+        target = f"stub ({args.latency_ms:.0f} ms per write)"
+
+    print(f"🔁 Spool replay: {args.points} points in batches of {args.batch_size} -> {target}")
+    for concurrency in args.concurrency:
+        directory = tempfile.mkdtemp(prefix="spool_bench_")
+        try:
+            spool = Spool(directory)
+            started = time.perf_counter()
+            fill_spool(spool, args.points, args.batch_size)
+            fill_time = time.perf_counter() - started
+            size_mb = spool.pending_bytes / (1024 * 1024)
+
+            started = time.perf_counter()
+            replayed = spool.replay(write_fn, concurrency)
+            replay_time = time.perf_counter() - started
+            print(f"   concurrency={concurrency:<3} spool {size_mb:6.1f} MB | "
+                  f"append {args.points / fill_time:>10,.0f} points/s | "
+                  f"replay {replayed / replay_time:>10,.0f} points/s")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
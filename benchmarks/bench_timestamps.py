@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Timestamp Benchmark - Producer ISO 8601 timestamps to InfluxDB integer
+timestamps
+
+Compares the writer's previous path (datetime.fromisoformat, then the
+InfluxDB client's Point time conversion) with the cached TimestampParser.
+Timestamps are produced with the same expressions as the producers over a
+simulated publish timeline (one message per machine every 2 seconds):
+  mock_plc_agent / lathe_sim  datetime.now(timezone.utc).isoformat()
+  edge_gateway_production     datetime.now().isoformat() (naive, written as UTC)
+Both paths are checked to agree before timing.
+
+Usage: python benchmarks/bench_timestamps.py [--messages 200000] [--machines 50]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from influxdb_client import WritePrecision
+from influxdb_client.client.write.point import _convert_timestamp
+from influxdb_writer.timestamps import TimestampParser
+
+PUBLISH_INTERVAL = 2.0  # seconds, mock_plc_agent default
+WRITE_PRECISIONS = {"ns": WritePrecision.NS, "ms": WritePrecision.MS, "s": WritePrecision.S}
+
+
+def timeline(count, machines, aware):
+    """(machine_id, timestamp string) pairs in publish order"""
+    start = datetime(2026, 3, 1, 23, 58, 30, tzinfo=timezone.utc)
+    messages = []
+    for i in range(count):
+        # Machines publish staggered across the interval, with some jitter
+        offset = (i // machines) * PUBLISH_INTERVAL + (i % machines) * PUBLISH_INTERVAL / machines
+        moment = start + timedelta(seconds=offset, microseconds=(i * 7919) % 1000)
+        text = moment.isoformat() if aware else moment.replace(tzinfo=None).isoformat()
+        messages.append((f"machine-{i % machines + 1:02d}", text))
+    return messages
+
+
+def before(value, producer, precision):
+    """The writer's original path: parse, then let the Point convert the datetime"""
+    timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return int(_convert_timestamp(timestamp, WRITE_PRECISIONS[precision]))
+
+
+def rate(fn, messages, precision):
+    started = time.perf_counter()
+    for machine_id, value in messages:
+        fn(value, machine_id, precision)
+    return len(messages) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--machines", type=int, default=50)
+    args = parser.parse_args()
+
+    for name, aware in (("mock_plc_agent (UTC, +00:00)", True), ("edge_gateway (naive)", False)):
+        messages = timeline(args.messages, args.machines, aware)
+        parser_ = TimestampParser()
+        for machine_id, value in messages[:5000]:
+            expected = before(value, machine_id, "ns")
+            assert parser_.parse(value, machine_id, "ns") == expected, f"mismatch for {value}"
+            assert parser_.parse(value, machine_id, "ms") == expected // 1_000_000, f"ms mismatch for {value}"
+
+        print(f"📊 {name}: {len(messages)} timestamps, {args.machines} machines, e.g. {messages[0][1]}")
+        for precision in ("ns", "ms", "s"):
+            timestamps = TimestampParser()
+            old = rate(before, messages, precision)
+            new = rate(timestamps.parse, messages, precision)
+            print(f"   {precision:<3} before {old:>11,.0f} /s | after {new:>11,.0f} /s | {new / old:4.1f}x")
+        print(f"   parser: {timestamps.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+WebSocket Fan-out Benchmark - Alarm broadcast to 1,000 simulated clients,
+sequential awaits (the previous broadcast_alarm) vs. per-client queues
+
+The server runs in this process like alarm_monitor (event loop thread, alarms
+published from another thread); the clients run in a separate process. A few
+of them are slow consumers (tiny receive buffer, --slow-delay seconds per
+message, like a frozen background tab). Reports delivery latency of the fast
+clients, which should not be affected by the slow ones, and what happened to
+the slow ones.
+
+Messages are padded (--pad bytes, compression off) and the server's send buffers are capped
+at SERVER_SNDBUF (a WAN link buffers roughly one bandwidth-delay product, not
+loopback's autotuned megabytes) so a slow client's buffers fill within a short
+run, as they would over hours with real-size alarm messages.
+
+Usage: python benchmarks/bench_ws_fanout.py [--clients 1000] [--slow 10] [--messages 150]
+       [--rate 5] [--pad 4096] [--slow-delay 2] [--queue 256] [--policy drop_oldest|disconnect]
+       [--mode both|sequential|fanout]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "alarm_monitor"))
+from ws_fanout import Fanout
+
+SLOW_RCVBUF = 4096
+SERVER_SNDBUF = 16384
+
+
+class SequentialBroadcast:
+    """The previous alarm_monitor broadcast: await send() on every client in turn"""
+
+    def __init__(self):
+        self.clients = set()
+
+    def register(self, websocket):
+        self.clients.add(websocket)
+
+    def unregister(self, websocket):
+        self.clients.discard(websocket)
+
+    async def broadcast(self, message):
+        disconnected = set()
+        for client in self.clients:
+            try:
+                await client.send(message)
+            except websockets.exceptions.ConnectionClosed:
+                disconnected.add(client)
+        self.clients.difference_update(disconnected)
+
+    def publish_threadsafe(self, loop, message):
+        asyncio.run_coroutine_threadsafe(self.broadcast(message), loop)
+
+
+class Server:
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self.loop = asyncio.new_event_loop()
+        self.port = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait(10)
+
+    async def _handler(self, websocket, path=None):
+        sock = websocket.transport.get_extra_info("socket")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SERVER_SNDBUF)
+        self.broadcaster.register(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            self.broadcaster.unregister(websocket)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+
+        server = self.loop.run_until_complete(websockets.serve(self._handler, "127.0.0.1", 0,
+                                                                max_queue=None, compression=None))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self.loop.run_forever()
+
+
+async def _client(port, messages, slow, slow_delay, results, timeout):
+    sock = None
+    if slow:
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SLOW_RCVBUF)
+        sock.connect(("127.0.0.1", port))
+    latencies = []
+    received = 0
+    closed_by_server = False
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{port}", sock=sock, open_timeout=60,
+                                      max_queue=4 if slow else None, compression=None) as websocket:
+            results["connected"] += 1
+            deadline = time.monotonic() + timeout
+            while received < messages:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(websocket.recv(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                received += 1
+                if slow:
+                    await asyncio.sleep(slow_delay)
+                else:
+                    # "sent" comes first, so skip decoding the padding
+                    latencies.append(time.time() - float(message[9:message.index(",")]))
+    except websockets.exceptions.ConnectionClosed:
+        closed_by_server = True
+    except OSError:
+        results["failed"] += 1
+    kind = "slow" if slow else "fast"
+    results[f"{kind}_received"] += received
+    results[f"{kind}_closed"] += closed_by_server
+    results["latencies"].extend(latencies)
+
+
+def run_clients(port, clients, slow, slow_delay, messages, timeout, connected, pipe):
+    """Client process: connect everyone, report, then receive until done"""
+    async def main():
+        results = {"connected": 0, "failed": 0, "fast_received": 0, "slow_received": 0,
+                   "fast_closed": 0, "slow_closed": 0, "latencies": []}
+        tasks = []
+        for index in range(clients):
+            tasks.append(asyncio.ensure_future(_client(port, messages, index < slow, slow_delay, results, timeout)))
+            if index % 50 == 49:
+                await asyncio.sleep(0.05)  # Don't overflow the listen backlog
+        while results["connected"] + results["failed"] < clients:
+            await asyncio.sleep(0.05)
+        connected.set()
+        await asyncio.gather(*tasks)
+        return results
+
+    pipe.send(asyncio.run(main()))
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000 if ordered else 0.0
+
+
+def run(mode, args):
+    broadcaster = Fanout(args.queue, args.policy) if mode == "fanout" else SequentialBroadcast()
+    server = Server(broadcaster)
+    connected = multiprocessing.Event()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=run_clients, args=(server.port, args.clients, args.slow, args.slow_delay,
+                                                                args.messages, args.timeout, connected, sender))
+    process.start()
+    if not connected.wait(120):
+        raise RuntimeError("Clients did not connect")
+    time.sleep(0.5)
+
+    padding = "x" * args.pad
+    started = time.perf_counter()
+    for index in range(args.messages):
+        delay = started + index / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        # Serialized once, shared by every client
+        message = json.dumps({"sent": time.time(), "machine_id": f"machine-{index % 50:02d}", "alarm_name": "Overfill",
+                              "alarm_type": "AlarmOverfill", "state": "RAISED" if index % 2 else "CLEARED",
+                              "timestamp": "2026-01-01T00:00:00Z", "pad": padding})
+        broadcaster.publish_threadsafe(server.loop, message)
+    results = receiver.recv()
+    elapsed = time.perf_counter() - started
+    process.join()
+
+    fast = args.clients - args.slow
+    latencies = sorted(results["latencies"])
+    print(f"📊 {mode}: {results['connected']} clients connected ({args.slow} slow), "
+          f"{args.messages} messages @ {args.rate:.0f}/s, done in {elapsed:.1f}s")
+    print(f"   fast clients: {results['fast_received']:,}/{fast * args.messages:,} delivered "
+          f"({results['fast_received'] / elapsed:,.0f} msg/s) | latency p50 {percentile(latencies, 0.5):.1f} ms "
+          f"| p99 {percentile(latencies, 0.99):.1f} ms | max {percentile(latencies, 1.0):.1f} ms")
+    slow_line = f"   slow clients: {results['slow_received']:,}/{args.slow * args.messages:,} received"
+    if mode == "fanout":
+        slow_line += f", {broadcaster.dropped:,} dropped, {broadcaster.disconnected} disconnected ({args.policy})"
+    print(slow_line)
+    server.loop.call_soon_threadsafe(server.loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--slow", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=150)
+    parser.add_argument("--rate", type=float, default=5.0, help="alarm messages per second")
+    parser.add_argument("--pad", type=int, default=4096, help="bytes of padding per message")
+    parser.add_argument("--slow-delay", type=float, default=2.0, help="seconds a slow client spends per message")
+    parser.add_argument("--queue", type=int, default=256, help="per-client queue size (fanout)")
+    parser.add_argument("--policy", default="drop_oldest", choices=("drop_oldest", "disconnect"))
+    parser.add_argument("--mode", default="both", choices=("both", "sequential", "fanout"))
+    parser.add_argument("--timeout", type=float, default=40.0, help="seconds a client keeps receiving")
+    args = parser.parse_args()
+
+    modes = ("sequential", "fanout") if args.mode == "both" else (args.mode,)
+    for mode in modes:
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+InfluxDB Stub - Local HTTP endpoint accepting /api/v2/write for the benchmarks
+
+Every line is counted per bucket and, for buckets being timed, the delay from
+the point's own timestamp (the producer's publish time) to its arrival is
+recorded. An optional artificial latency per request stands in for a slow or
+remote InfluxDB.
+"""
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from influxdb_writer.timestamps import PRECISION_SCALE
+
+
+class InfluxStub:
+    """Stub InfluxDB; latencies[bucket] holds publish -> write delays in seconds"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, timed_buckets=()):
+        self.latency = latency
+        self.timed_buckets = set(timed_buckets)
+        self.points = {}  # bucket -> lines received
+        self.requests = 0
+        self.latencies = {}
+        self.first_write = None
+        self.last_write = None
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                url = urlparse(self.path)
+                if url.path == "/api/v2/write":
+                    query = parse_qs(url.query)
+                    stub._record(query.get("bucket", [""])[0], query.get("precision", ["ns"])[0], body)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                # /ping, /health
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self.url = f"http://{host}:{self.port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="influx-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+    def _record(self, bucket, precision, body):
+        now = time.time_ns()
+        lines = [line for line in body.decode().split("\n") if line and not line.startswith("#")]
+        delays = None
+        if bucket in self.timed_buckets:
+            divisor = 1_000_000_000 // PRECISION_SCALE.get(precision, 1_000_000_000)
+            delays = [(now - int(line.rsplit(" ", 1)[1]) * divisor) / 1e9 for line in lines]
+        with self._lock:
+            self.requests += 1
+            self.points[bucket] = self.points.get(bucket, 0) + len(lines)
+            if delays:
+                self.latencies.setdefault(bucket, []).extend(delays)
+            if self.first_write is None:
+                self.first_write = now
+            self.last_write = now
+
+    def total_points(self, bucket):
+        return self.points.get(bucket, 0)
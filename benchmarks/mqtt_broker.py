@@ -0,0 +1,188 @@
+"""
+MQTT Broker Stand-in - Minimal in-process MQTT 3.1.1 broker for the
+benchmarks, so the real services can be driven without Mosquitto
+
+Supports what the services use: CONNECT, SUBSCRIBE/UNSUBSCRIBE with + and #
+wildcards, $share/<group>/<filter> shared subscriptions (round robin),
+PUBLISH at QoS 0 and 1, PINGREQ and DISCONNECT. No retained messages, no
+persistent sessions, no authentication (credentials are accepted as sent).
+"""
+import asyncio
+import itertools
+import threading
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT topic filter matching with + (one level) and # (all remaining levels)"""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels) or (level != "+" and level != topic_levels[index]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _string(data, offset):
+    length = int.from_bytes(data[offset:offset + 2], "big")
+    return data[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+
+class _Session:
+    """One connected client"""
+
+    def __init__(self, broker, writer):
+        self.broker = broker
+        self.writer = writer
+        self.client_id = None
+        self._packet_ids = itertools.cycle(range(1, 65536))
+
+    def send_publish(self, topic, payload, qos):
+        topic_bytes = topic.encode()
+        variable = len(topic_bytes).to_bytes(2, "big") + topic_bytes
+        if qos:
+            variable += next(self._packet_ids).to_bytes(2, "big")
+        body = variable + payload
+        self.writer.write(bytes([0x30 | (qos << 1)]) + _encode_length(len(body)) + body)
+
+
+class MiniBroker:
+    """MQTT broker running on its own event loop thread
+
+    broker = MiniBroker().start()   # broker.port is the bound port
+    ...
+    broker.stop()
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.messages_in = 0
+        self.messages_out = 0
+        self._subscriptions = []  # (filter, session, qos)
+        self._groups = {}  # (group, filter) -> [sessions]
+        self._group_turns = {}
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mini-broker", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def subscriber_count(self, topic):
+        """Sessions (or share groups) that would receive a publish on topic"""
+        count = sum(1 for topic_filter, _, _ in list(self._subscriptions) if topic_matches(topic_filter, topic))
+        count += sum(1 for (_, topic_filter), sessions in list(self._groups.items())
+                     if sessions and topic_matches(topic_filter, topic))
+        return count
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _read_packet(self, reader):
+        header = await reader.readexactly(1)
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        return header[0], await reader.readexactly(length) if length else b""
+
+    async def _handle(self, reader, writer):
+        session = _Session(self, writer)
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                kind = header >> 4
+                if kind == 3:  # PUBLISH
+                    qos = (header >> 1) & 0x03
+                    topic, offset = _string(body, 0)
+                    if qos:
+                        writer.write(b"\x40\x02" + body[offset:offset + 2])
+                        offset += 2
+                    self._route(topic, body[offset:], qos)
+                elif kind == 1:  # CONNECT
+                    protocol, offset = _string(body, 0)
+                    offset += 4  # level, flags, keepalive
+                    session.client_id, _ = _string(body, offset)
+                    writer.write(b"\x20\x02\x00\x00")
+                elif kind == 8:  # SUBSCRIBE
+                    granted = bytearray()
+                    offset = 2
+                    while offset < len(body):
+                        topic_filter, offset = _string(body, offset)
+                        qos = min(body[offset], 1)
+                        offset += 1
+                        self._subscribe(session, topic_filter, qos)
+                        granted.append(qos)
+                    writer.write(bytes([0x90]) + _encode_length(2 + len(granted)) + body[:2] + bytes(granted))
+                elif kind == 10:  # UNSUBSCRIBE
+                    offset = 2
+                    while offset < len(body):
+                        topic_filter, offset = _string(body, offset)
+                        self._unsubscribe(session, topic_filter)
+                    writer.write(b"\xb0\x02" + body[:2])
+                elif kind == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif kind == 14:  # DISCONNECT
+                    break
+                # PUBACK (4) from subscribers needs no answer
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._drop(session)
+            writer.close()
+
+    def _subscribe(self, session, topic_filter, qos):
+        if topic_filter.startswith("$share/"):
+            _, group, shared_filter = topic_filter.split("/", 2)
+            self._groups.setdefault((group, shared_filter), []).append((session, qos))
+        else:
+            self._subscriptions.append((topic_filter, session, qos))
+
+    def _unsubscribe(self, session, topic_filter):
+        self._subscriptions = [s for s in self._subscriptions if s[1] is not session or s[0] != topic_filter]
+
+    def _drop(self, session):
+        self._subscriptions = [s for s in self._subscriptions if s[1] is not session]
+        for key, members in self._groups.items():
+            self._groups[key] = [member for member in members if member[0] is not session]
+
+    def _route(self, topic, payload, qos):
+        self.messages_in += 1
+        for topic_filter, session, sub_qos in self._subscriptions:
+            if topic_matches(topic_filter, topic):
+                session.send_publish(topic, payload, min(qos, sub_qos))
+                self.messages_out += 1
+        for key, members in self._groups.items():
+            if members and topic_matches(key[1], topic):
+                turn = self._group_turns.get(key, 0)
+                session, sub_qos = members[turn % len(members)]
+                self._group_turns[key] = turn + 1
+                session.send_publish(topic, payload, min(qos, sub_qos))
+                self.messages_out += 1
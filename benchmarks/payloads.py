@@ -0,0 +1,55 @@
+"""
+Benchmark Payloads - Realistic MQTT messages for the benchmarks
+Generated by the real mock_plc_agent and lathe_sim tag generators, so the
+benchmarks follow any change to what the producers publish
+"""
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mock_plc_agent.mock_plc_agent import BottleFillerTags
+from lathe_sim.lathe_sim import LatheState
+
+
+def bottlefiller_messages(count, machines=10):
+    """(topic, payload bytes) pairs as published on plc/<id>/bottlefiller/data"""
+    generators = [BottleFillerTags() for _ in range(machines)]
+    for tags in generators:
+        tags.system_running = True
+    messages = []
+    for i in range(count):
+        data = generators[i % machines].generate_mock_data()
+        data["machine_id"] = f"machine-{i % machines + 1:02d}"
+        messages.append((f"plc/{data['machine_id']}/bottlefiller/data", json.dumps(data, indent=2).encode()))
+    return messages
+
+
+def lathe_messages(count, machines=10):
+    """(topic, payload bytes) pairs as published on plc/<id>/lathe/data"""
+    generators = [LatheState() for _ in range(machines)]
+    messages = []
+    for i in range(count):
+        data = generators[i % machines].generate_mock_data()
+        data["machine_id"] = f"lathe{i % machines + 1:02d}"
+        messages.append((f"plc/{data['machine_id']}/lathe/data", json.dumps(data, indent=2).encode()))
+    return messages
+
+
+def edge_gateway_messages(count, machines=10):
+    """(topic, payload bytes) pairs shaped like edge_gateway_production output"""
+    messages = []
+    for i in range(count):
+        machine_id = f"machine-{i % machines + 1:02d}"
+        data = {
+            "timestamp": datetime.now().isoformat(),
+            "source": "edge_gateway_ot",
+            "machine_id": machine_id,
+            "plc_ip": "10.0.1.10",
+            "BottleCount": i,
+            "FillerSpeed": round(i % 500 / 100.0, 2),
+            "LineRunning": True,
+        }
+        messages.append((f"plc/{machine_id}/bottlefiller/data", json.dumps(data).encode()))
+    return messages
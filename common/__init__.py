@@ -0,0 +1 @@
+# Common Module
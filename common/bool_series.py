@@ -0,0 +1,178 @@
+"""
+Boolean Series - Edges, runs, on-time and incident counts of boolean
+telemetry (alarms, fault and running flags) computed with NumPy over
+columnar arrays
+
+times are sample times in seconds (any numeric array; seconds() converts
+datetime64 arrays and lists of datetimes) and values the boolean samples in
+time order. A value holds until the next sample that differs (zero-order
+hold), so a run that turns on at sample i lasts until the first later sample
+that is off. Missing samples (None or NaN) carry the previous value.
+
+Everything derives from one np.diff over the values: the nonzero positions
+are the edges, their sign the direction, and runs, on-time and incident
+counts follow from the edge indices without scanning the samples again.
+
+    index, rising = edges(values)                    # sample index and direction of every change
+    starts, ends = runs(times, values, end=t1)       # on runs, in seconds
+    stats = summarize(times, values, start=t0, end=t1)
+    starts, ends = union(starts, ends)               # overlapping intervals merged
+
+NumPy is in requirements.txt. The services do not use this module, so
+importing it without NumPy still works; calling it raises ImportError.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _require():
+    if np is None:
+        raise ImportError("common.bool_series needs NumPy (pip install numpy)")
+
+
+def seconds(times):
+    """Epoch seconds (float64) of datetime64 values, datetimes or numbers"""
+    _require()
+    times = np.asarray(times)
+    if times.dtype.kind == "M":
+        return times.astype("datetime64[ns]").astype(np.int64) / 1e9
+    if times.dtype.kind == "O":
+        return np.fromiter((t.timestamp() for t in times), dtype=np.float64, count=len(times))
+    return times.astype(np.float64, copy=False)
+
+
+def as_bool(values, initial=False, present=None):
+    """Boolean array of the samples, missing ones (None / NaN) carrying the previous value
+
+    Leading missing samples take `initial`, the value before the series.
+    present, a boolean mask, marks which samples exist when `values` cannot
+    say (e.g. parsed from CSV, where an empty cell is a missing sample).
+    """
+    _require()
+    values = np.asarray(values)
+    if present is not None:
+        filled = values.astype(bool, copy=False)
+        present = np.asarray(present, dtype=bool)
+    elif values.dtype == bool:
+        return values
+    elif values.dtype.kind == "O":
+        present = np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+        filled = np.fromiter((bool(value) for value in values), dtype=bool, count=len(values))
+    elif values.dtype.kind == "f":
+        present = ~np.isnan(values)
+        filled = values != 0  # Only read where present
+    else:
+        return values != 0
+    if present.all():
+        return filled
+    # Each present sample repeats up to the next one; leading missing samples take initial
+    index = np.flatnonzero(present)
+    held = np.concatenate(([bool(initial)], filled[index]))
+    return np.repeat(held, np.diff(index, prepend=0, append=len(values)))
+
+
+def edges(values, initial=False):
+    """(sample indices of every change, whether each one is rising), starting from `initial`"""
+    values = as_bool(values, initial)
+    change = np.diff(values.view(np.int8), prepend=np.int8(bool(initial)))
+    index = np.flatnonzero(change)
+    return index, change[index] > 0
+
+
+def run_lengths(values, initial=False):
+    """Run-length encoding: (value of each run, its length in samples)"""
+    values = as_bool(values, initial)
+    if not len(values):
+        return values, np.zeros(0, dtype=np.int64)
+    index, _ = edges(values, values[0])
+    bounds = np.concatenate(([0], index, [len(values)]))
+    return values[bounds[:-1]], np.diff(bounds)
+
+
+def _runs(times, values, initial, start, end):
+    """Unclipped (start, end) seconds of the on runs"""
+    index, rising = edges(values, initial)
+    starts = times[index[rising]]
+    ends = times[index[~rising]]
+    if initial:
+        first = times[0] if start is None else min(start, times[0])
+        starts = np.concatenate(([first], starts))
+    if values[-1]:
+        ends = np.concatenate((ends, [times[-1] if end is None else max(end, times[-1])]))
+    return starts, ends
+
+
+def runs(times, values, initial=False, start=None, end=None):
+    """(start, end) seconds of every on run within [start, end], clipped to it
+
+    A run already on at the first sample (initial=True) starts at `start`,
+    or the first sample time; a run still on at the last sample ends at
+    `end`, or the last sample time.
+    """
+    times = seconds(times)
+    values = as_bool(values, initial)
+    if not len(values):
+        on = bool(initial) and start is not None and end is not None
+        return np.array([start] if on else [], dtype=np.float64), np.array([end] if on else [], dtype=np.float64)
+    starts, ends = _runs(times, values, initial, start, end)
+    lo = -np.inf if start is None else start
+    hi = np.inf if end is None else end
+    # Runs overlapping the window, and those that start and end on one sample inside it
+    inside = ((starts <= hi) & (ends > lo)) | ((starts == ends) & (starts >= lo) & (starts <= hi))
+    return np.clip(starts[inside], lo, hi), np.clip(ends[inside], lo, hi)
+
+
+def summarize(times, values, start=None, end=None, initial=False):
+    """On-time, incidents and transitions of one series over [start, end] (default: first to last sample)
+
+    Returns a dict: on_time / off_time / total_time (seconds), on_ratio,
+    incidents (on runs within the window), rising / falling edges, mean_run /
+    max_run (seconds), and open (on at the end).
+    """
+    times = seconds(times)
+    values = as_bool(values, initial)
+    if start is None:
+        start = float(times[0]) if len(times) else 0.0
+    if end is None:
+        end = float(times[-1]) if len(times) else start
+    index, rising = edges(values, initial)
+    starts, ends = runs(times, values, initial, start, end)
+    durations = ends - starts
+    total = max(end - start, 0.0)
+    on_time = float(durations.sum())
+    rises = int(rising.sum())
+    return {
+        "on_time": on_time,
+        "off_time": total - on_time,
+        "total_time": total,
+        "on_ratio": on_time / total if total else 0.0,
+        "incidents": int(len(durations)),
+        "rising": rises,
+        "falling": int(len(index)) - rises,
+        "mean_run": float(durations.mean()) if len(durations) else 0.0,
+        "max_run": float(durations.max()) if len(durations) else 0.0,
+        "open": bool(values[-1]) if len(values) else bool(initial),
+    }
+
+
+def any_of(*columns, initial=False):
+    """Element-wise OR of several series (down when any downtime signal is on)"""
+    _require()
+    return np.logical_or.reduce([as_bool(column, initial) for column in columns])
+
+
+def union(starts, ends):
+    """Merged (start, end) of intervals, overlapping or touching ones joined, in time order"""
+    _require()
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    # A new interval begins where a start lies after every earlier end
+    new = np.concatenate(([True], starts[1:] > ends[:-1]))
+    last = np.concatenate((np.flatnonzero(new)[1:] - 1, [len(starts) - 1]))
+    return starts[new], ends[last]
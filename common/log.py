@@ -0,0 +1,129 @@
+"""
+Service Logging - Shared leveled logging for the Python services
+
+Per-message output goes through a Sampler so only 1 in N messages of each
+type is logged at INFO (all of them at DEBUG), and a Throughput reporter
+prints one summary line (msgs/s, points/s, errors) per interval instead.
+Use %-style arguments so disabled lines are never formatted.
+
+Environment (read when the first logger is created, after .env is loaded):
+  LOG_LEVEL             DEBUG | INFO (default) | WARNING | ERROR
+  LOG_FORMAT            text (default, messages as before) | json (one object per line)
+  LOG_SAMPLE_EVERY      log 1 in N per-message lines of each type at INFO (default 100, 1 = all)
+  LOG_SAMPLE_RATES      per-type overrides, e.g. "received=1000,written=50"
+  LOG_SUMMARY_INTERVAL  seconds between throughput summary lines (default 30, 0 disables)
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; extra={"fields": {...}} adds structured fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "service": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def get_logger(service):
+    """Logger for a service, writing to stdout (the /tmp/*.log files main.py opens)"""
+    logger = logging.getLogger(service)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        if os.getenv("LOG_FORMAT", "text").lower() == "json":
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        logger.propagate = False
+    return logger
+
+
+def parse_rates(spec):
+    """Parse "received=1000,written=50" into {type: N}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        kind, _, every = item.partition("=")
+        rates[kind.strip()] = max(1, int(every))
+    return rates
+
+
+class Sampler:
+    """Decides which per-message lines to log: 1 in N per message type at INFO, all at DEBUG"""
+
+    def __init__(self, logger, every=None, rates=None):
+        self.logger = logger
+        self.every = max(1, every if every is not None else int(os.getenv("LOG_SAMPLE_EVERY", "100")))
+        self.rates = rates if rates is not None else parse_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+        self._counts = {}
+
+    def enabled(self, kind, level=logging.INFO):
+        """Whether to log this message of type `kind` (counts it either way)"""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            return True
+        if not self.logger.isEnabledFor(level):
+            return False
+        count = self._counts.get(kind, 0)
+        self._counts[kind] = count + 1
+        return count % self.rates.get(kind, self.every) == 0
+
+
+class Throughput:
+    """Named counters with a periodic summary line of rates and totals
+
+    summary() can be extended with extra(): a callable returning a string
+    appended to the line (e.g. queue depth).
+    """
+
+    def __init__(self, logger, label, counters=("messages", "errors"), interval=None, extra=None):
+        self.logger = logger
+        self.label = label
+        self.counters = dict.fromkeys(counters, 0)
+        self.interval = interval if interval is not None else float(os.getenv("LOG_SUMMARY_INTERVAL", "30"))
+        self.extra = extra
+        self._last = dict(self.counters)
+        self._last_time = time.monotonic()
+
+    def add(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def start(self):
+        """Start the summary thread (no-op when the interval is 0)"""
+        if self.interval > 0:
+            threading.Thread(target=self._run, name=f"throughput-{self.label}", daemon=True).start()
+        return self
+
+    def summary(self):
+        now = time.monotonic()
+        elapsed = max(now - self._last_time, 1e-9)
+        totals = dict(self.counters)
+        rates = " | ".join(f"{(totals[name] - self._last.get(name, 0)) / elapsed:.1f} {name}/s"
+                           for name in totals)
+        self._last, self._last_time = totals, now
+        line = f"📊 {self.label}: {rates} | totals " + " ".join(f"{name}={value}" for name, value in totals.items())
+        if self.extra is not None:
+            line += f" | {self.extra()}"
+        return line, totals
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                line, totals = self.summary()
+                self.logger.info(line, extra={"fields": {"summary": totals}})
+            except Exception as e:
+                self.logger.warning("⚠️  Throughput summary failed: %s", e)
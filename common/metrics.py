@@ -0,0 +1,258 @@
+"""
+Service Metrics - Counters, gauges and histograms served in the Prometheus
+text format on a small HTTP endpoint (GET /metrics)
+
+Built for the hot path: inc() and observe() are a few attribute updates with
+no locking (each metric is updated from one thread, or tolerates the rare
+lost increment between threads), and gauges that mirror existing state
+(queue depth, WebSocket clients) are read by a callback only when scraped.
+
+    registry = Registry(service="influxdb_writer")
+    received = registry.counter("mqtt_messages_received_total", "MQTT messages received")
+    received.inc()
+    registry.gauge("write_queue_depth", "Points waiting to be written").set_function(lambda: writer.queue_depth)
+    start_server(registry, 9108)
+
+Scrape with Prometheus, or just curl http://host:9108/metrics.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default histogram buckets in seconds (100us .. 10s)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for one metric family; labels(...) returns (and caches) a child per label set"""
+
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), const_labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._const_labels = tuple(const_labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._function = None
+        if not self.labelnames:
+            self._init_value()
+
+    def _init_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    labels = self._const_labels + tuple(zip(self.labelnames, values))
+                    child = self._children[values] = self._child(labels)
+        return child
+
+    def _child(self, const_labels):
+        return type(self)(self.name, self.help, const_labels=const_labels)
+
+    def set_function(self, function):
+        """Read the value from function() at scrape time instead of tracking it"""
+        self._function = function
+        return self
+
+    def _series(self):
+        """(suffix, labels, value) samples of this metric and its children"""
+        if self.labelnames:
+            samples = []
+            for child in list(self._children.values()):
+                samples.extend(child._series())
+            return samples
+        return self._samples()
+
+    def render(self, const_labels=()):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self._series():
+            lines.append(f"{self.name}{suffix}{_format_labels(const_labels + labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count (rate() of it gives e.g. messages/s)"""
+
+    kind = "counter"
+
+    def _init_value(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def _samples(self):
+        value = self._function() if self._function is not None else self.value
+        return [("", self._const_labels, value)]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down (queue depth, connected clients)"""
+
+    kind = "gauge"
+
+    def _init_value(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def _samples(self):
+        value = self._function() if self._function is not None else self.value
+        return [("", self._const_labels, value)]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (latencies in seconds) over fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), const_labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, const_labels)
+
+    def _init_value(self):
+        # Per-bucket (non-cumulative) counts, the last slot is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _child(self, const_labels):
+        return Histogram(self.name, self.help, const_labels=const_labels, buckets=self.buckets)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Context manager observing the duration of a block"""
+        return _Timer(self)
+
+    def _samples(self):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            samples.append(("_bucket", self._const_labels + (("le", _format_value(float(bound))),), cumulative))
+        samples.append(("_sum", self._const_labels, self.sum))
+        samples.append(("_count", self._const_labels, cumulative))
+        return samples
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Registry:
+    """The metrics of one service
+
+    Labels in const_labels (service, shard) are added to every series when
+    rendering, so they can still be set after the metrics are created.
+    """
+
+    def __init__(self, **const_labels):
+        self.const_labels = dict(const_labels)
+        self._metrics = {}
+
+    def _register(self, cls, name, help, labelnames=(), **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        const_labels = tuple(self.const_labels.items())
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render(const_labels))
+            except Exception as e:
+                # A failing callback must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+def start_server(registry, port, host="0.0.0.0"):
+    """Serve registry.render() on http://host:port/metrics from a daemon thread
+
+    Returns the server, or None when port is 0 (metrics disabled).
+    """
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the service log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+    return server
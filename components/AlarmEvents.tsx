@@ -27,11 +27,42 @@ interface WebSocketAlarm {
   alarm_type: string;
   state: 'RAISED' | 'CLEARED';
   timestamp: string;
+  seq?: number; // Sequenced delivery (after hello)
 }
 
+// Replies to hello: the raised alarms, or the alarms missed since last_seq
+interface WebSocketSync {
+  type: 'snapshot' | 'resume';
+  seq: number;
+  active?: WebSocketAlarm[];
+  events?: WebSocketAlarm[];
+}
+
+const RECONNECT_DELAY = 3000; // ms
+const MAX_EVENTS = 50;
+
+const toEvent = (alarm: WebSocketAlarm): AlarmEvent => ({
+  timestamp: alarm.timestamp,
+  machine_id: alarm.machine_id,
+  alarm_type: alarm.alarm_type,
+  alarm_label: alarm.alarm_name,
+  state: alarm.state,
+  value: alarm.state === 'RAISED',
+});
+
+const sameEvent = (a: AlarmEvent, b: AlarmEvent) =>
+  a.machine_id === b.machine_id && a.alarm_type === b.alarm_type && a.state === b.state && a.timestamp === b.timestamp;
+
+// Newest first, without events already in the list
+const mergeEvents = (prevEvents: AlarmEvent[], newEvents: AlarmEvent[]) => {
+  const added = newEvents.filter((event) => !prevEvents.some((prev) => sameEvent(prev, event)));
+  return [...added.reverse(), ...prevEvents].slice(0, MAX_EVENTS);
+};
+
 export function AlarmEvents({ machineId = 'machine-01', machineType }: AlarmEventsProps) {
   const [isExpanded, setIsExpanded] = useState(true);
   const wsRef = useRef<WebSocket | null>(null);
+  const lastSeqRef = useRef<number | null>(null);
   const [wsConnected, setWsConnected] = useState(false);
   const [events, setEvents] = useState<AlarmEvent[]>([]);
   const [connectionStatus, setConnectionStatus] = useState<'connecting' | 'connected' | 'disconnected' | 'error'>('connecting');
@@ -40,109 +71,141 @@ export function AlarmEvents({ machineId = 'machine-01', machineType }: AlarmEven
   // WebSocket connection for real-time notifications
   useEffect(() => {
     const wsUrl = process.env.NEXT_PUBLIC_WS_URL || 'ws://localhost:8765';
-    console.log(`🔌 Attempting to connect to WebSocket: ${wsUrl}`);
-    const ws = new WebSocket(wsUrl);
-    wsRef.current = ws;
-
-    ws.onopen = () => {
-      console.log('✅ Connected to alarm WebSocket');
-      setWsConnected(true);
-      setConnectionStatus('connected');
-    };
+    let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+    let closed = false;
+    // A new machine means a new subscription: start from a snapshot, not from the old machine's seq
+    lastSeqRef.current = null;
 
-    ws.onmessage = (event) => {
-      try {
-        const alarm: WebSocketAlarm = JSON.parse(event.data);
-        console.log('📨 Received alarm via WebSocket:', alarm);
-        console.log('   Machine:', alarm.machine_id);
-        console.log('   Alarm Name:', alarm.alarm_name);
-        console.log('   Alarm Type:', alarm.alarm_type);
-        console.log('   State:', alarm.state);
-        console.log('   Timestamp:', alarm.timestamp);
-        
-        // Only process alarms for the selected machine (or all if machineId is not specified)
-        if (!machineId || alarm.machine_id === machineId) {
-          console.log('   ✅ Processing alarm (matches machine filter)');
-          const alarmLabel = alarm.alarm_name || alarm.alarm_type;
-          const formattedAlarmName = formatAlarmName(alarmLabel);
-          const message = `${formattedAlarmName} on ${alarm.machine_id}`;
-          
-          // Only show toast notification when alarm is RAISED (goes true)
-          if (alarm.state === 'RAISED') {
-            toast.error(
-              <div className="flex items-start gap-3">
-                <div className="flex-shrink-0 w-6 h-6 flex items-center justify-center mt-0.5">
-                  <span className="text-red-400 font-bold text-xl leading-none">!</span>
-                </div>
-                <div className="flex-1 min-w-0">
-                  <div className="text-white font-semibold text-sm mb-0.5">Alarm Raised</div>
-                  <div className="text-gray-400 text-xs truncate">{message}</div>
-                  <div className="text-gray-500 text-xs mt-1">{alarm.machine_id}</div>
-                </div>
-              </div>,
-              {
-                position: 'top-right',
-                autoClose: 6000,
-                hideProgressBar: false,
-                closeOnClick: true,
-                pauseOnHover: true,
-                icon: false,
-                className: 'custom-toast',
-                bodyClassName: 'custom-toast-body',
-              }
-            );
-          }
-          // No toast for CLEARED alarms - silent update only
-          
-          // Update local state directly from WebSocket message (no API call)
-          // Update table for both RAISED and CLEARED to maintain complete history
-          const newEvent: AlarmEvent = {
-            timestamp: alarm.timestamp,
-            machine_id: alarm.machine_id,
-            alarm_type: alarm.alarm_type,
-            alarm_label: alarm.alarm_name,
-            state: alarm.state,
-            value: alarm.state === 'RAISED',
-          };
-          
-          // Add new event to the beginning of the list
-          // Keep events for all machines in state, but filter when displaying
-          setEvents((prevEvents) => {
-            const updated = [newEvent, ...prevEvents];
-            // Keep only last 50 events (to maintain history across machine switches)
-            return updated.slice(0, 50);
-          });
-        }
-      } catch (error) {
-        console.error('Error parsing WebSocket message:', error);
+    // hello (with the last seq seen) gets the alarms missed while disconnected, or a snapshot
+    // of the raised alarms, so reconnecting never re-queries the alarm history
+    const sendHello = (ws: WebSocket) => {
+      const hello: Record<string, unknown> = { type: 'hello' };
+      if (lastSeqRef.current !== null) {
+        hello.last_seq = lastSeqRef.current;
+      }
+      // Only receive this machine's alarms (server-side filter)
+      if (machineId) {
+        hello.machine_ids = [machineId];
       }
+      ws.send(JSON.stringify(hello));
     };
 
-    ws.onerror = (error) => {
-      console.error('WebSocket error:', error);
-      setWsConnected(false);
-      setConnectionStatus('error');
+    const notify = (alarm: WebSocketAlarm) => {
+      const alarmLabel = alarm.alarm_name || alarm.alarm_type;
+      const formattedAlarmName = formatAlarmName(alarmLabel);
+      const message = `${formattedAlarmName} on ${alarm.machine_id}`;
+      toast.error(
+        <div className="flex items-start gap-3">
+          <div className="flex-shrink-0 w-6 h-6 flex items-center justify-center mt-0.5">
+            <span className="text-red-400 font-bold text-xl leading-none">!</span>
+          </div>
+          <div className="flex-1 min-w-0">
+            <div className="text-white font-semibold text-sm mb-0.5">Alarm Raised</div>
+            <div className="text-gray-400 text-xs truncate">{message}</div>
+            <div className="text-gray-500 text-xs mt-1">{alarm.machine_id}</div>
+          </div>
+        </div>,
+        {
+          position: 'top-right',
+          autoClose: 6000,
+          hideProgressBar: false,
+          closeOnClick: true,
+          pauseOnHover: true,
+          icon: false,
+          className: 'custom-toast',
+          bodyClassName: 'custom-toast-body',
+        }
+      );
     };
 
-    ws.onclose = (event) => {
-      console.log('WebSocket closed', event.code, event.reason);
-      setWsConnected(false);
-      setConnectionStatus('disconnected');
-      
-      // Attempt to reconnect after 3 seconds if not a normal closure
-      if (event.code !== 1000) {
-        setTimeout(() => {
-          if (wsRef.current?.readyState === WebSocket.CLOSED) {
+    const connect = () => {
+      console.log(`🔌 Attempting to connect to WebSocket: ${wsUrl}`);
+      const ws = new WebSocket(wsUrl);
+      wsRef.current = ws;
+
+      ws.onopen = () => {
+        console.log('✅ Connected to alarm WebSocket');
+        setWsConnected(true);
+        setConnectionStatus('connected');
+        sendHello(ws);
+      };
+
+      ws.onmessage = (event) => {
+        try {
+          const data = JSON.parse(event.data);
+
+          // Snapshot / resume reply: apply it to the list instead of refetching
+          if (data.type === 'snapshot' || data.type === 'resume') {
+            const sync: WebSocketSync = data;
+            const alarms = (sync.type === 'snapshot' ? sync.active : sync.events) || [];
+            console.log(`📥 Alarm ${sync.type} up to seq ${sync.seq}: ${alarms.length} alarms`);
+            lastSeqRef.current = sync.seq;
+            setEvents((prevEvents) => mergeEvents(
+              prevEvents,
+              alarms.filter((alarm) => !machineId || alarm.machine_id === machineId).map(toEvent)
+            ));
+            return;
+          }
+
+          // seq is not contiguous here (the server filters by machine), only increasing
+          const alarm: WebSocketAlarm = data;
+          if (typeof alarm.seq === 'number') {
+            if (lastSeqRef.current !== null && alarm.seq <= lastSeqRef.current) {
+              return; // Already applied from a resume reply
+            }
+            lastSeqRef.current = alarm.seq;
+          }
+          console.log('📨 Received alarm via WebSocket:', alarm);
+
+          // Only process alarms for the selected machine (or all if machineId is not specified)
+          if (!machineId || alarm.machine_id === machineId) {
+            // Only show toast notification when alarm is RAISED (goes true)
+            // No toast for CLEARED alarms - silent update only
+            if (alarm.state === 'RAISED') {
+              notify(alarm);
+            }
+
+            // Update local state directly from WebSocket message (no API call)
+            // Update table for both RAISED and CLEARED to maintain complete history
+            // Keep events for all machines in state, but filter when displaying
+            setEvents((prevEvents) => mergeEvents(prevEvents, [toEvent(alarm)]));
+          }
+        } catch (error) {
+          console.error('Error parsing WebSocket message:', error);
+        }
+      };
+
+      ws.onerror = (error) => {
+        console.error('WebSocket error:', error);
+        setWsConnected(false);
+        setConnectionStatus('error');
+      };
+
+      ws.onclose = (event) => {
+        console.log('WebSocket closed', event.code, event.reason);
+        setWsConnected(false);
+        setConnectionStatus('disconnected');
+
+        // Reconnect after 3 seconds if not a normal closure; hello resumes from the last seq
+        if (!closed && event.code !== 1000) {
+          reconnectTimer = setTimeout(() => {
             console.log('🔄 Attempting to reconnect...');
             setConnectionStatus('connecting');
-            // Reconnect will be handled by useEffect cleanup and re-run
-          }
-        }, 3000);
-      }
+            connect();
+          }, RECONNECT_DELAY);
+        }
+      };
     };
 
+    connect();
+
     return () => {
-      if (ws.readyState === WebSocket.OPEN || ws.readyState === WebSocket.CONNECTING) {
+      closed = true;
+      if (reconnectTimer) {
+        clearTimeout(reconnectTimer);
+      }
+      const ws = wsRef.current;
+      if (ws && (ws.readyState === WebSocket.OPEN || ws.readyState === WebSocket.CONNECTING)) {
         ws.close();
       }
       wsRef.current = null;
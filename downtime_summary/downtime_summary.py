@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Downtime Summary - Per-machine, per-day downtime periods, uptime, incidents
+and OEE computed from plc_data and written to a compact summary bucket
+
+A machine is down while any of its downtime signals is true (see
+DOWNTIME_CALCULATION.md: AlarmLowProductLevel for the bottle filler; Fault,
+AlarmChuckNotClamped and AlarmDoorOpen for the lathe) or while it sends no
+data for more than DOWNTIME_GAP seconds. Each UTC day of each machine is read
+with one pivoted query and reduced with common.bool_series, and written to
+DOWNTIME_SUMMARY_BUCKET (scripts/create_downtime_summary_bucket.py) as:
+
+  downtime_daily   one point per machine and day (_time = midnight):
+                   planned_time, downtime, uptime, uptime_pct, incidents,
+                   longest, produced, rejected, good, ideal_output,
+                   availability, performance, quality, oee, samples,
+                   complete (the day is over) and until (epoch seconds the
+                   point covers up to)
+  downtime_period  one point per down period within the day (_time = its
+                   start): duration, end_time, open (still down at until)
+                   and continued (carried over from the previous day, so
+                   not a new incident)
+
+OEE is availability (uptime / planned time) x performance (units made /
+OEE_IDEAL_RATE units per hour of uptime) x quality (good / made units), the
+units coming from the production counters (BottlesFilled/BottlesRejected,
+PartsCompleted/PartsRejected), with counter resets handled.
+
+Runs incrementally: DOWNTIME_SUMMARY_CHECKPOINT_FILE keeps, per machine, the
+first day not yet complete and the signal, counter and down state at its
+start. Each run computes the days from there to today (today up to now,
+marked incomplete and overwritten by the next run) and only advances the
+checkpoint over complete days. --reset recomputes the last --days days
+(batch), --interval keeps running every N seconds.
+
+Needs NumPy (in requirements.txt).
+
+Usage: python downtime_summary/downtime_summary.py [machine_id ...] [--days 30] [--reset] [--interval 300]
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from operator import itemgetter
+from influxdb_client import Dialect, InfluxDBClient, Point, WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import bool_series
+from common.bool_series import np
+
+# Load .env file if it exists
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+# Configuration
+INFLUXDB_URL = os.getenv("INFLUXDB_URL", "http://localhost:8086")
+INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN", "my-super-secret-auth-token")
+INFLUXDB_ORG = os.getenv("INFLUXDB_ORG", "myorg")
+INFLUXDB_BUCKET = os.getenv("INFLUXDB_BUCKET", "plc_data_new")
+DOWNTIME_SUMMARY_BUCKET = os.getenv("DOWNTIME_SUMMARY_BUCKET", "downtime_summary")
+DOWNTIME_SUMMARY_DAYS = int(os.getenv("DOWNTIME_SUMMARY_DAYS", "30"))  # days computed for new machines / --reset
+DOWNTIME_SUMMARY_WORKERS = int(os.getenv("DOWNTIME_SUMMARY_WORKERS", "4"))  # machines computed concurrently
+DOWNTIME_SUMMARY_CHECKPOINT_FILE = os.getenv("DOWNTIME_SUMMARY_CHECKPOINT_FILE", "/tmp/downtime_summary_state.json")
+DOWNTIME_SUMMARY_SETTLE = float(os.getenv("DOWNTIME_SUMMARY_SETTLE", "60"))  # seconds before now left for late writes
+DOWNTIME_GAP = float(os.getenv("DOWNTIME_GAP", "300"))  # seconds without data counted as down (0: never)
+# Ideal output per hour of uptime, per machine type ("bottlefiller=1800,lathe=180")
+OEE_IDEAL_RATE = os.getenv("OEE_IDEAL_RATE", "bottlefiller=1800,lathe=180")
+
+DAY = 86400
+
+# Fields that mean the machine is down when true, per machine type
+DOWNTIME_SIGNALS = {
+    "bottlefiller": ("AlarmLowProductLevel",),
+    "lathe": ("Fault", "AlarmChuckNotClamped", "AlarmDoorOpen"),
+}
+
+# (units made, units rejected) counters per machine type
+PRODUCTION_COUNTERS = {
+    "bottlefiller": ("BottlesFilled", "BottlesRejected"),
+    "lathe": ("PartsCompleted", "PartsRejected"),
+}
+
+
+def parse_rates(spec):
+    """Parse "bottlefiller=1800,lathe=180" into {machine type: units per hour}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        machine_type, _, rate = item.partition("=")
+        rates[machine_type.strip()] = float(rate)
+    return rates
+
+
+IDEAL_RATES = parse_rates(OEE_IDEAL_RATE)
+
+
+def _any_equal(column, values):
+    # An or-chain of equalities is pushed down to storage, contains() is not
+    return " or ".join(f'r["{column}"] == "{value}"' for value in values)
+
+
+def _rfc3339(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def build_discovery_query(start, stop, bucket=INFLUXDB_BUCKET):
+    """Flux query for the (machine_id, machine_type) of every machine with downtime signals in the range"""
+    fields = sorted({field for signals in DOWNTIME_SIGNALS.values() for field in signals})
+    return f'''
+from(bucket: "{bucket}")
+  |> range(start: {start}, stop: {stop})
+  |> filter(fn: (r) => r["_measurement"] == "plc_data")
+  |> filter(fn: (r) => {_any_equal('_field', fields)})
+  |> last()
+  |> keep(columns: ["machine_id", "machine_type"])
+'''
+
+
+def build_day_query(machine_id, machine_type, start, stop, bucket=INFLUXDB_BUCKET):
+    """Flux query for one machine's downtime signals and production counters, one row per sample"""
+    fields = DOWNTIME_SIGNALS[machine_type] + PRODUCTION_COUNTERS[machine_type]
+    return f'''
+from(bucket: "{bucket}")
+  |> range(start: {_rfc3339(start)}, stop: {_rfc3339(stop)})
+  |> filter(fn: (r) => r["_measurement"] == "plc_data")
+  |> filter(fn: (r) => r["machine_id"] == "{machine_id}")
+  |> filter(fn: (r) => {_any_equal('_field', fields)})
+  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+  |> group()
+  |> sort(columns: ["_time"])
+  |> keep(columns: ["_time", {", ".join(f'"{field}"' for field in fields)}])
+'''
+
+
+def read_columns(rows):
+    """{column: array} of a pivoted query's plain CSV (query_csv() without annotations)
+
+    _time becomes epoch seconds, other cells stay strings ("" where missing).
+    """
+    header = None
+    data = []
+    for row in rows:
+        if len(row) < 3:
+            continue  # Blank line between tables
+        if row[1] == "result":
+            header = row
+            continue
+        data.append(row)
+    if header is None:
+        return {"_time": np.zeros(0)}
+    columns = {name: np.array(list(map(itemgetter(i), data)), dtype=object)
+               for i, name in enumerate(header) if name not in ("", "result", "table")}
+    # RFC3339 in UTC; datetime64 parses it without the zone designator
+    times = np.array([cell[:-1] for cell in columns["_time"]], dtype="datetime64[ns]")
+    columns["_time"] = bool_series.seconds(times)
+    return columns
+
+
+def counter_increase(cells, last=None):
+    """(total increase, last value) of a cumulative counter column, a drop counting as a reset to 0"""
+    values = np.array([float(cell) for cell in cells if cell != ""], dtype=np.float64)
+    if last is not None:
+        values = np.concatenate(([last], values))
+    if not len(values):
+        return 0.0, last
+    step = np.diff(values)
+    return float(np.where(step >= 0, step, values[1:]).sum()), float(values[-1])
+
+
+def new_state():
+    """Carried from one day to the next: last signal and counter values, down, last sample time, open period"""
+    return {"signals": {}, "counters": {}, "down": False, "last_seen": None, "open": False}
+
+
+def summarize_day(machine_type, day, stop, columns, state, gap=DOWNTIME_GAP, ideal_rate=None):
+    """(daily summary, down periods, state at stop) of one machine over [day, stop)
+
+    columns are read_columns() of the day's query; state (new_state() or what
+    the previous day returned) is not modified.
+    """
+    state = copy.deepcopy(state)
+    times = columns["_time"]
+    signals = []
+    for field in DOWNTIME_SIGNALS[machine_type]:
+        initial = state["signals"].get(field, False)
+        cells = columns.get(field)
+        if cells is None:
+            values = np.full(len(times), initial)
+        else:
+            values = bool_series.as_bool(cells == "true", initial, present=cells != "")
+        if len(values):
+            state["signals"][field] = bool(values[-1])
+        signals.append(values)
+    down = bool_series.any_of(*signals, initial=state["down"]) if len(times) else np.zeros(0, dtype=bool)
+
+    # Down while a signal is on, or while no data arrives for longer than gap
+    starts, ends = bool_series.runs(times, down, initial=state["down"], start=day, end=stop)
+    if gap > 0:
+        seen = np.concatenate(([day if state["last_seen"] is None else state["last_seen"]], times, [stop]))
+        silent = np.flatnonzero(np.diff(seen) > gap)
+        starts = np.concatenate((starts, np.maximum(seen[silent], day)))
+        ends = np.concatenate((ends, seen[silent + 1]))
+    starts, ends = bool_series.union(starts, ends)
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+
+    planned = float(stop - day)
+    durations = ends - starts
+    downtime = float(durations.sum())
+    uptime = planned - downtime
+    continued = bool(len(starts) and state["open"] and starts[0] <= day)
+    is_open = bool(len(ends) and ends[-1] >= stop)
+    periods = [{"start": float(start), "end": float(end), "duration": float(end - start),
+                "open": is_open and i == len(starts) - 1, "continued": continued and i == 0}
+               for i, (start, end) in enumerate(zip(starts, ends))]
+
+    made_field, rejected_field = PRODUCTION_COUNTERS[machine_type]
+    made, state["counters"][made_field] = counter_increase(
+        columns.get(made_field, ()), state["counters"].get(made_field))
+    rejected, state["counters"][rejected_field] = counter_increase(
+        columns.get(rejected_field, ()), state["counters"].get(rejected_field))
+    rejected = min(rejected, made)
+    ideal_rate = IDEAL_RATES.get(machine_type, 0.0) if ideal_rate is None else ideal_rate
+    ideal_output = ideal_rate * uptime / 3600
+    availability = uptime / planned if planned > 0 else 0.0
+    performance = min(made / ideal_output, 1.0) if ideal_output > 0 else 0.0
+    quality = (made - rejected) / made if made else 1.0  # Nothing made, nothing rejected
+
+    state["down"] = bool(down[-1]) if len(down) else state["down"]
+    state["last_seen"] = float(times[-1]) if len(times) else state["last_seen"]
+    state["open"] = is_open
+    summary = {
+        "planned_time": planned,
+        "downtime": downtime,
+        "uptime": uptime,
+        "uptime_pct": availability * 100,
+        "incidents": len(periods) - continued,
+        "longest": float(durations.max()) if len(durations) else 0.0,
+        "produced": int(made),
+        "rejected": int(rejected),
+        "good": int(made - rejected),
+        "ideal_output": ideal_output,
+        "availability": availability,
+        "performance": performance,
+        "quality": quality,
+        "oee": availability * performance * quality,
+        "samples": int(len(times)),
+    }
+    return summary, periods, state
+
+
+def summary_points(machine_id, machine_type, day, stop, summary, periods, complete):
+    """The downtime_daily point and downtime_period points of one machine and day"""
+    daily = Point("downtime_daily").tag("machine_id", machine_id).tag("machine_type", machine_type)
+    for name, value in summary.items():
+        daily.field(name, value)
+    daily.field("complete", complete).field("until", int(stop)).time(int(day * 1000), WritePrecision.MS)
+    points = [daily]
+    for period in periods:
+        points.append(Point("downtime_period").tag("machine_id", machine_id).tag("machine_type", machine_type)
+                      .field("duration", period["duration"]).field("end_time", _rfc3339(period["end"]))
+                      .field("open", period["open"]).field("continued", period["continued"])
+                      .time(int(period["start"] * 1000), WritePrecision.MS))
+    return points
+
+
+def load_checkpoint(path=DOWNTIME_SUMMARY_CHECKPOINT_FILE):
+    """{machine_id: {"machine_type", "day": epoch seconds of the first incomplete day, "state": new_state()}}"""
+    try:
+        with open(path) as f:
+            return json.load(f).get("machines", {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable downtime summary checkpoint {path}: {e}")
+        return {}
+
+
+def save_checkpoint(machines, path=DOWNTIME_SUMMARY_CHECKPOINT_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"bucket": INFLUXDB_BUCKET, "machines": machines}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def discover_machines(query_api, start, stop):
+    """{machine_id: machine_type} of the machines with downtime signals in [start, stop)"""
+    machines = {}
+    for record in query_api.query_stream(build_discovery_query(_rfc3339(start), _rfc3339(stop)), org=INFLUXDB_ORG):
+        machine_type = record.values.get("machine_type")
+        if machine_type in DOWNTIME_SIGNALS:
+            machines[record.values.get("machine_id")] = machine_type
+    return machines
+
+
+def summarize_machine(client, machine_id, machine_type, mark, now):
+    """Compute and write one machine's days from its checkpoint entry up to now
+
+    Returns (new checkpoint entry, days written, rows read).
+    """
+    query_api = client.query_api()
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+    delete_api = client.delete_api()
+    day, state = mark["day"], mark["state"]
+    written = rows = 0
+    while day < now:
+        stop = min(day + DAY, now)
+        csv = query_api.query_csv(build_day_query(machine_id, machine_type, day, stop), org=INFLUXDB_ORG,
+                                  dialect=Dialect(header=True, annotations=[]))
+        columns = read_columns(csv)
+        rows += len(columns["_time"])
+        summary, periods, next_state = summarize_day(machine_type, day, stop, columns, state)
+        complete = stop >= day + DAY
+        # Periods of a recomputed day may have moved (late data): replace them all
+        delete_api.delete(_rfc3339(day), _rfc3339(day + DAY),
+                          f'_measurement="downtime_period" AND machine_id="{machine_id}"',
+                          bucket=DOWNTIME_SUMMARY_BUCKET, org=INFLUXDB_ORG)
+        write_api.write(bucket=DOWNTIME_SUMMARY_BUCKET, org=INFLUXDB_ORG,
+                        record=summary_points(machine_id, machine_type, day, stop, summary, periods, complete))
+        written += 1
+        if not complete:
+            break  # Today: recomputed next run from the same state
+        day, state = day + DAY, next_state
+    return {"machine_type": machine_type, "day": day, "state": state}, written, rows
+
+
+def run_summary(machine_ids=None, days=DOWNTIME_SUMMARY_DAYS, workers=DOWNTIME_SUMMARY_WORKERS, reset=False):
+    """Bring the downtime summaries of every machine (or machine_ids) up to now"""
+    now = time.time() - DOWNTIME_SUMMARY_SETTLE
+    first_day = (now // DAY - days + 1) * DAY
+    checkpoint = {} if reset else load_checkpoint()
+    client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG,
+                            connection_pool_maxsize=max(workers, 1))
+    try:
+        machines = discover_machines(client.query_api(), min([first_day] + [mark["day"] - DAY for mark in
+                                                                           checkpoint.values()]), now)
+    except Exception as e:
+        print(f"❌ Machine discovery failed: {e}")
+        client.close()
+        return None
+    for machine_id, mark in checkpoint.items():
+        machines.setdefault(machine_id, mark["machine_type"])  # Known machines that went silent are still summarized
+    if machine_ids:
+        machines = {machine_id: machine_type for machine_id, machine_type in machines.items()
+                    if machine_id in machine_ids}
+
+    print(f"📊 Summarizing downtime of {len(machines)} machines from {_rfc3339(first_day)[:10]} "
+          f"({sum(machine_id in checkpoint for machine_id in machines)} resume from {DOWNTIME_SUMMARY_CHECKPOINT_FILE})")
+    started = time.perf_counter()
+    rows = written = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {}
+        for machine_id, machine_type in machines.items():
+            mark = checkpoint.get(machine_id) or {"machine_type": machine_type, "day": first_day, "state": new_state()}
+            futures[pool.submit(summarize_machine, client, machine_id, machine_type, mark, now)] = machine_id
+        for future in as_completed(futures):
+            machine_id = futures[future]
+            try:
+                mark, machine_days, machine_rows = future.result()
+            except Exception as e:
+                failed.append(machine_id)
+                print(f"  {machine_id}: Error - {e}")
+                continue
+            checkpoint[machine_id] = mark
+            written += machine_days
+            rows += machine_rows
+    save_checkpoint(checkpoint)
+    elapsed = time.perf_counter() - started
+    print(f"✅ {written} machine-days written to {DOWNTIME_SUMMARY_BUCKET} from {rows:,} rows in {elapsed:.1f}s"
+          + (f", {len(failed)} machines failed: {', '.join(failed)}" if failed else ""))
+    client.close()
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute daily downtime and OEE summaries from plc_data")
+    parser.add_argument("machine_ids", nargs="*", help='machines to summarize (none or "all": discover them)')
+    parser.add_argument("--days", type=int, default=DOWNTIME_SUMMARY_DAYS,
+                        help="days back to start new machines (and every machine with --reset)")
+    parser.add_argument("--workers", type=int, default=DOWNTIME_SUMMARY_WORKERS, help="machines computed concurrently")
+    parser.add_argument("--reset", action="store_true", help="ignore the checkpoint and recompute --days days")
+    parser.add_argument("--interval", type=float, default=0, help="keep running, every INTERVAL seconds")
+    args = parser.parse_args()
+    if np is None:
+        print("❌ NumPy is not installed (pip install -r requirements.txt)")
+        sys.exit(1)
+    machine_ids = [machine_id for machine_id in args.machine_ids if machine_id != "all"]
+    run_summary(machine_ids, args.days, args.workers, args.reset)
+    while args.interval > 0:
+        time.sleep(args.interval)
+        run_summary(machine_ids, args.days, args.workers)
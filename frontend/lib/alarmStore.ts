@@ -0,0 +1,71 @@
+/**
+ * Alarm monitor event store client (server-side only)
+ * The alarm monitor keeps the last 24h of alarm events indexed in memory and
+ * serves them on ALARM_MONITOR_API_URL. Routes ask it first and fall back to
+ * InfluxDB (or the events file) when it is unreachable or the requested range
+ * is older than what it holds.
+ */
+
+const ALARM_MONITOR_API_URL = process.env.ALARM_MONITOR_API_URL || 'http://localhost:8766';
+const ALARM_MONITOR_API_TIMEOUT = parseInt(process.env.ALARM_MONITOR_API_TIMEOUT || '1000'); // ms
+
+export interface AlarmStoreEvent {
+  timestamp: string;
+  machine_id: string;
+  alarm_type: string;
+  alarm_name: string;
+  alarm_label: string;
+  state: string;
+  value: boolean;
+  machine_type?: string;
+  flapping?: boolean;
+  flap_count?: number;
+  seq?: number;
+}
+
+export interface AlarmStoreEventsResponse {
+  events: AlarmStoreEvent[];
+  total: number;
+  offset: number;
+  limit: number;
+  complete: boolean;
+  complete_since: string;
+}
+
+/**
+ * Query the alarm monitor's /events endpoint
+ * Returns null when the monitor is unavailable or does not hold the whole range,
+ * so the caller should query its usual source instead.
+ */
+export async function queryAlarmStore(params: {
+  start?: string | null;
+  end?: string | null;
+  machineId?: string | null;
+  alarmType?: string | null;
+  state?: string | null;
+  limit?: number;
+  offset?: number;
+}): Promise<AlarmStoreEventsResponse | null> {
+  const query = new URLSearchParams();
+  if (params.start) query.set('start', params.start);
+  if (params.end) query.set('end', params.end);
+  if (params.machineId) query.set('machine_id', params.machineId);
+  if (params.alarmType) query.set('alarm_type', params.alarmType);
+  if (params.state) query.set('state', params.state);
+  if (params.limit !== undefined) query.set('limit', String(params.limit));
+  if (params.offset !== undefined) query.set('offset', String(params.offset));
+
+  try {
+    const response = await fetch(`${ALARM_MONITOR_API_URL}/events?${query}`, {
+      cache: 'no-store',
+      signal: AbortSignal.timeout(ALARM_MONITOR_API_TIMEOUT),
+    });
+    if (!response.ok) {
+      return null;
+    }
+    const result: AlarmStoreEventsResponse = await response.json();
+    return result.complete ? result : null;
+  } catch (error) {
+    return null; // Monitor not running: use the fallback
+  }
+}
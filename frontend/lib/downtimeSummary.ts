@@ -0,0 +1,266 @@
+/**
+ * Downtime summary client (server-side only)
+ * downtime_summary/downtime_summary.py writes one downtime_daily row per
+ * machine and day (downtime, incidents, OEE) and its downtime_period points
+ * to DOWNTIME_SUMMARY_BUCKET. A range is answered from the days it touches
+ * plus a live tail computed from raw plc_data after the summaries' last
+ * update, instead of scanning every raw sample of the range. Production of
+ * partly covered days is pro-rated to the part inside the range, so the OEE
+ * factors all describe the same window.
+ */
+import { QueryApi } from '@influxdata/influxdb-client';
+
+const DOWNTIME_SUMMARY_BUCKET = process.env.DOWNTIME_SUMMARY_BUCKET || 'downtime_summary';
+const PLC_DATA_BUCKET = process.env.NEXT_PUBLIC_INFLUXDB_BUCKET || 'plc_data_new';
+const DOWNTIME_GAP = parseFloat(process.env.DOWNTIME_GAP || '300') * 1000; // ms without data counted as down
+
+// Fields that mean the machine is down when true (DOWNTIME_SIGNALS in downtime_summary.py)
+const DOWNTIME_SIGNALS: Record<string, string[]> = {
+  bottlefiller: ['AlarmLowProductLevel'],
+  lathe: ['Fault', 'AlarmChuckNotClamped', 'AlarmDoorOpen'],
+};
+
+// [units made, units rejected] counters (PRODUCTION_COUNTERS in downtime_summary.py)
+const PRODUCTION_COUNTERS: Record<string, [string, string]> = {
+  bottlefiller: ['BottlesFilled', 'BottlesRejected'],
+  lathe: ['PartsCompleted', 'PartsRejected'],
+};
+
+export interface SummaryPeriod {
+  startTime: string;
+  endTime: string | null; // null if still down
+  duration: number; // seconds
+}
+
+export interface DowntimeSummary {
+  totalTime: number; // seconds
+  totalDowntime: number;
+  totalUptime: number;
+  downtimePercentage: number;
+  uptimePercentage: number;
+  incidentCount: number;
+  periods: SummaryPeriod[];
+  oee: {
+    // Percentages, over [start, end] like the downtime
+    availability: number;
+    performance: number;
+    quality: number;
+    oee: number;
+  };
+  until: string; // summaries cover up to here, raw data after
+}
+
+interface Interval {
+  start: number; // ms
+  end: number;
+}
+
+interface Tail {
+  intervals: Interval[];
+  produced: number;
+  rejected: number;
+}
+
+const anyEqual = (column: string, values: string[]) =>
+  values.map((value) => `r["${column}"] == "${value}"`).join(' or ');
+
+/**
+ * Down intervals (signals on, or no data for DOWNTIME_GAP) and units made and
+ * rejected in [since, end] from raw plc_data
+ */
+async function queryTail(
+  queryApi: QueryApi,
+  machineId: string,
+  machineType: string,
+  since: number,
+  end: number,
+  downAtStart: boolean
+): Promise<Tail> {
+  const signals = DOWNTIME_SIGNALS[machineType] || [];
+  const counters: string[] = PRODUCTION_COUNTERS[machineType] || [];
+  if (signals.length === 0) {
+    return { intervals: [], produced: 0, rejected: 0 };
+  }
+  const rows = await queryApi.collectRows<any>(`
+    from(bucket: "${PLC_DATA_BUCKET}")
+      |> range(start: ${new Date(since).toISOString()}, stop: ${new Date(end).toISOString()})
+      |> filter(fn: (r) => r["_measurement"] == "plc_data")
+      |> filter(fn: (r) => r["machine_id"] == "${machineId}")
+      |> filter(fn: (r) => ${anyEqual('_field', [...signals, ...counters])})
+      |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+      |> group()
+      |> sort(columns: ["_time"])
+  `);
+
+  const intervals: Interval[] = [];
+  const last: Record<string, boolean> = {};
+  // Counter increases, a drop counting as a reset to 0 (counter_increase in downtime_summary.py)
+  const increase = counters.map(() => 0);
+  const lastCount: (number | undefined)[] = counters.map(() => undefined);
+  let down = downAtStart;
+  let downSince = since;
+  let previous = since;
+  for (const row of rows) {
+    const time = new Date(row._time).getTime();
+    if (DOWNTIME_GAP > 0 && time - previous > DOWNTIME_GAP) {
+      intervals.push({ start: previous, end: time });
+    }
+    previous = time;
+    // A missing field keeps its previous value
+    for (const signal of signals) {
+      if (row[signal] !== undefined && row[signal] !== null) {
+        last[signal] = row[signal] === true || row[signal] === 'true';
+      }
+    }
+    counters.forEach((counter, i) => {
+      if (row[counter] === undefined || row[counter] === null || row[counter] === '') {
+        return;
+      }
+      const value = Number(row[counter]);
+      const previousCount = lastCount[i];
+      if (previousCount !== undefined) {
+        increase[i] += value >= previousCount ? value - previousCount : value;
+      }
+      lastCount[i] = value;
+    });
+    const known = signals.filter((signal) => signal in last);
+    const isDown = known.length > 0 ? known.some((signal) => last[signal]) : down;
+    if (isDown && !down) {
+      downSince = time;
+    } else if (!isDown && down) {
+      intervals.push({ start: downSince, end: time });
+    }
+    down = isDown;
+  }
+  if (down) {
+    intervals.push({ start: downSince, end });
+  }
+  if (DOWNTIME_GAP > 0 && end - previous > DOWNTIME_GAP) {
+    intervals.push({ start: previous, end });
+  }
+  const produced = increase[0] || 0;
+  return { intervals, produced, rejected: Math.min(increase[1] || 0, produced) };
+}
+
+/**
+ * Merge overlapping or touching intervals (periods split at midnight join up again)
+ */
+function union(intervals: Interval[]): Interval[] {
+  const merged: Interval[] = [];
+  for (const interval of [...intervals].sort((a, b) => a.start - b.start)) {
+    const previous = merged[merged.length - 1];
+    if (previous && interval.start <= previous.end) {
+      previous.end = Math.max(previous.end, interval.end);
+    } else {
+      merged.push({ ...interval });
+    }
+  }
+  return merged;
+}
+
+/**
+ * Downtime and OEE of a machine over [start, end] from the downtime summaries
+ * Returns null when the machine has no summaries in the range (or the bucket
+ * is unreachable), so the caller should compute from its usual source instead.
+ */
+export async function queryDowntimeSummary(
+  queryApi: QueryApi,
+  machineId: string,
+  start: Date,
+  end: Date
+): Promise<DowntimeSummary | null> {
+  const startMs = start.getTime();
+  const endMs = end.getTime();
+  const firstDay = new Date(Math.floor(startMs / 86400000) * 86400000).toISOString();
+  const select = (measurement: string) => `
+    from(bucket: "${DOWNTIME_SUMMARY_BUCKET}")
+      |> range(start: ${firstDay}, stop: ${end.toISOString()})
+      |> filter(fn: (r) => r["_measurement"] == "${measurement}")
+      |> filter(fn: (r) => r["machine_id"] == "${machineId}")
+      |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+      |> group()
+      |> sort(columns: ["_time"])
+  `;
+
+  let days: any[];
+  let periods: any[];
+  try {
+    [days, periods] = await Promise.all([
+      queryApi.collectRows<any>(select('downtime_daily')),
+      queryApi.collectRows<any>(select('downtime_period')),
+    ]);
+  } catch (error) {
+    return null; // No summary bucket: use the fallback
+  }
+  if (days.length === 0) {
+    return null;
+  }
+
+  const machineType = days[0].machine_type;
+  const until = Math.min(Math.max(...days.map((day) => Number(day.until) * 1000)), endMs);
+  const intervals: Interval[] = periods.map((period) => ({
+    start: new Date(period._time).getTime(),
+    end: new Date(period.end_time).getTime(),
+  }));
+  let tailProduced = 0;
+  let tailRejected = 0;
+  if (until < endMs) {
+    const downAtUntil = periods.some((period) => period.open && new Date(period.end_time).getTime() >= until);
+    try {
+      const tail = await queryTail(queryApi, machineId, machineType, until, endMs, downAtUntil);
+      intervals.push(...tail.intervals);
+      tailProduced = tail.produced;
+      tailRejected = tail.rejected;
+    } catch (error) {
+      console.warn('[Downtime Summary] Live tail query failed:', error);
+    }
+  }
+
+  const clipped = union(intervals)
+    .map((interval) => ({ start: Math.max(interval.start, startMs), end: Math.min(interval.end, endMs) }))
+    .filter((interval) => interval.end > interval.start);
+  const totalTime = (endMs - startMs) / 1000;
+  const totalDowntime = clipped.reduce((sum, interval) => sum + (interval.end - interval.start) / 1000, 0);
+  const totalUptime = totalTime - totalDowntime;
+
+  // Units of each day pro-rated to its overlap with [start, end] (a -1h range gets an hour's worth,
+  // not the whole day's), plus the live tail's, so performance and quality cover the same window
+  // as availability. The ideal output follows from the range's uptime at the days' ideal rate.
+  const overlap = (day: any) => {
+    const dayStart = new Date(day._time).getTime();
+    const dayEnd = Math.min(Number(day.until) * 1000, dayStart + 86400000);
+    const covered = Math.min(dayEnd, endMs) - Math.max(dayStart, startMs);
+    return dayEnd > dayStart ? Math.max(covered, 0) / (dayEnd - dayStart) : 0;
+  };
+  const sum = (field: string, weight: (day: any) => number = () => 1) =>
+    days.reduce((total, day) => total + (Number(day[field]) || 0) * weight(day), 0);
+  const produced = sum('produced', overlap) + tailProduced;
+  const good = sum('good', overlap) + tailProduced - tailRejected;
+  const dayUptime = sum('uptime');
+  const idealRate = dayUptime > 0 ? sum('ideal_output') / dayUptime : 0; // units per second of uptime
+  const idealOutput = idealRate * totalUptime;
+  const availability = totalTime > 0 ? totalUptime / totalTime : 0;
+  const performance = idealOutput > 0 ? Math.min(produced / idealOutput, 1) : 0;
+  const quality = produced > 0 ? good / produced : 1;
+
+  return {
+    totalTime,
+    totalDowntime,
+    totalUptime,
+    downtimePercentage: totalTime > 0 ? (totalDowntime / totalTime) * 100 : 0,
+    uptimePercentage: availability * 100,
+    incidentCount: clipped.length,
+    periods: clipped.map((interval) => ({
+      startTime: new Date(interval.start).toISOString(),
+      endTime: interval.end >= endMs ? null : new Date(interval.end).toISOString(),
+      duration: (interval.end - interval.start) / 1000,
+    })),
+    oee: {
+      availability: availability * 100,
+      performance: performance * 100,
+      quality: quality * 100,
+      oee: availability * performance * quality * 100,
+    },
+    until: new Date(until).toISOString(),
+  };
+}
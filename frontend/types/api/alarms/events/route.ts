@@ -1,6 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { readFile } from 'fs/promises';
 import { existsSync } from 'fs';
+import { queryAlarmStore } from '@/lib/alarmStore';
 
 const ALARM_EVENTS_FILE = '/tmp/alarm_events.json';
 
@@ -10,6 +11,13 @@ export async function GET(request: NextRequest) {
     const machineId = searchParams.get('machineId');
     const limit = parseInt(searchParams.get('limit') || '50');
     
+    // Latest events from the alarm monitor's in-memory store (a full page of the last 24h),
+    // else the snapshot file it writes, which can reach further back
+    const stored = await queryAlarmStore({ start: '-24h', machineId, limit });
+    if (stored && stored.events.length >= limit) {
+      return NextResponse.json({ events: stored.events });
+    }
+    
     // Check if file exists
     if (!existsSync(ALARM_EVENTS_FILE)) {
       return NextResponse.json({ events: [] });
@@ -1,5 +1,6 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { InfluxDB, QueryApi } from '@influxdata/influxdb-client';
+import { queryDowntimeSummary } from '@/lib/downtimeSummary';
 
 const INFLUXDB_URL = process.env.NEXT_PUBLIC_INFLUXDB_URL || process.env.INFLUXDB_URL || 'https://influxtest.wisermachines.com';
 const INFLUXDB_TOKEN = process.env.NEXT_PUBLIC_INFLUXDB_TOKEN || process.env.INFLUXDB_TOKEN || '1MrRJ8q-zSnlt9HRZMeY5YNhOQZWbi6Xk-oU6pFFTSbJRv4V32cTJutWMJota0r6t_F6N5zXOfE6IXHYmcUk4Q==';
@@ -31,6 +32,13 @@ interface DowntimeStats {
     change: number;
     trend: 'increasing' | 'decreasing' | 'same';
   };
+  oee?: {
+    availability: number;
+    performance: number;
+    quality: number;
+    oee: number;
+  };
+  source?: 'summary' | 'vibration';
 }
 
 export async function GET(request: NextRequest) {
@@ -82,6 +90,36 @@ export async function GET(request: NextRequest) {
     console.log(`  Total seconds: ${totalTimeSeconds.toFixed(0)} (${(totalTimeSeconds/3600).toFixed(2)} hours)`);
     console.log(`[Downtime API] Querying for machineId: ${machineId}`);
 
+    // plc_data machines summarized by downtime_summary.py: daily rows plus a live tail, for both periods
+    const summary = await queryDowntimeSummary(queryApi, machineId, startTime, endTime);
+    if (summary) {
+      const previousStartTime = new Date(startTime.getTime() - (endTime.getTime() - startTime.getTime()));
+      const previous = await queryDowntimeSummary(queryApi, machineId, previousStartTime, startTime);
+      console.log(`[Downtime API] From downtime summaries (up to ${summary.until}, raw data after)`);
+
+      let comparison: DowntimeStats['comparison'] | undefined;
+      if (previous) {
+        const change = summary.downtimePercentage - previous.downtimePercentage;
+        comparison = {
+          previousDowntimePercentage: Math.max(0, Math.min(100, previous.downtimePercentage)),
+          change: Math.abs(change),
+          trend: Math.abs(change) < 0.1 ? 'same' : (change > 0 ? 'increasing' : 'decreasing'),
+        };
+      }
+      const stats: DowntimeStats = {
+        downtimePercentage: Math.max(0, Math.min(100, summary.downtimePercentage)),
+        uptimePercentage: Math.max(0, Math.min(100, summary.uptimePercentage)),
+        totalDowntime: summary.totalDowntime,
+        totalUptime: summary.totalUptime,
+        incidentCount: summary.incidentCount,
+        periods: summary.periods.slice(0, 10),
+        comparison,
+        oee: summary.oee,
+        source: 'summary',
+      };
+      return NextResponse.json({ data: stats });
+    }
+
     // Query vibration data to find gaps (downtime = no data)
     // First, find the latest data point to ensure we're querying the right range
     const findLatestQuery = `
@@ -465,6 +503,7 @@ export async function GET(request: NextRequest) {
       incidentCount: periods.length,
       periods: periods.slice(0, 10),
       comparison,
+      source: 'vibration',
     };
 
     return NextResponse.json({ data: stats });
@@ -0,0 +1,242 @@
+"""
+Batch Writer - Buffers InfluxDB records in a bounded in-memory queue and
+flushes them from a background thread by size or by time interval
+Keeps HTTP round trips to InfluxDB off the MQTT network thread
+Batches that fail while InfluxDB is unreachable go to an optional on-disk
+spool and are replayed in the background once it comes back; batches
+InfluxDB rejects for good (4xx other than 429) are counted as failed instead
+"""
+import queue
+import threading
+import time
+
+# How often the points/second rate is recomputed (seconds)
+RATE_WINDOW = 5.0
+
+
+def is_retryable(error):
+    """Whether a failed write may succeed later (connection errors, timeouts, 429 and 5xx)
+
+    Other HTTP client errors (400 bad line protocol, 422 field type conflict,
+    401/403/404 ...) fail the same way on every attempt.
+    """
+    status = getattr(error, "status", None)
+    if not isinstance(status, int) or status <= 0:
+        return True  # No HTTP response: connection error or timeout
+    return status == 429 or status >= 500
+
+
+class BatchWriter:
+    """Background batching writer for InfluxDB records
+
+    write_fn(records, precision) is called from the writer thread with a
+    list of records (Points or line protocol) or, when replaying the spool,
+    with one line protocol payload. It should raise on failure.
+
+    on_flush(points, seconds), if given, is called from the writer thread
+    after every flush attempt (e.g. to feed a latency histogram).
+    """
+
+    def __init__(self, write_fn, batch_size=500, flush_interval=1.0,
+                 max_queue=10000, max_block=0.5, name="influxdb",
+                 precision="ns", spool=None, retry_interval=5.0, replay_concurrency=4, on_flush=None):
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_block = max_block
+        self.name = name
+        self.precision = precision
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self.replay_concurrency = replay_concurrency
+        self.on_flush = on_flush
+        # False while InfluxDB is known to be unreachable: batches go straight
+        # to the spool until a replay succeeds (or the spool is found empty)
+        self.online = True
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"batch-writer-{name}", daemon=True)
+        self._replay_thread = threading.Thread(target=self._replay_loop, name=f"spool-replay-{name}", daemon=True)
+
+        # Stats (only updated by the writer thread, except submitted/dropped)
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spooled = 0
+        self.flushes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+        self.points_per_second = 0.0
+        self._rate_points = 0
+        self._rate_started = time.monotonic()
+
+    def start(self):
+        """Start the background flush (and spool replay) threads"""
+        self._thread.start()
+        if self.spool is not None:
+            self._replay_thread.start()
+        return self
+
+    def submit(self, record):
+        """Queue a record for writing
+
+        When the queue is full (InfluxDB is slower than ingest) the caller is
+        held for at most max_block seconds. This throttles the MQTT loop so
+        unacknowledged QoS1 messages back up at the broker, without ever
+        blocking it on an InfluxDB request. Returns False if the record had
+        to be dropped.
+        """
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            try:
+                self._queue.put(record, timeout=self.max_block)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        self.submitted += 1
+        return True
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @property
+    def saturated(self):
+        """True when the queue is at least 90% full"""
+        return self._queue.qsize() >= self.max_queue * 0.9
+
+    def stats(self):
+        """Snapshot of queue depth, flush latency and throughput"""
+        avg_latency = self._total_flush_latency / self.flushes if self.flushes else 0.0
+        # Nothing flushed for a while means nothing is flowing
+        idle = time.monotonic() - self._rate_started >= 2 * RATE_WINDOW
+        stats = {
+            "online": self.online,
+            "queue_depth": self.queue_depth,
+            "submitted": self.submitted,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "spooled": self.spooled,
+            "flushes": self.flushes,
+            "last_flush_latency_ms": self.last_flush_latency * 1000,
+            "avg_flush_latency_ms": avg_latency * 1000,
+            "max_flush_latency_ms": self.max_flush_latency * 1000,
+            "points_per_second": 0.0 if idle else self.points_per_second,
+        }
+        if self.spool is not None:
+            stats["spool"] = self.spool.stats()
+        return stats
+
+    def close(self, timeout=10.0):
+        """Stop accepting new work and flush whatever is still queued"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        if self.spool is not None:
+            self.spool.close()
+
+    def _next_batch(self):
+        """Collect up to batch_size records, waiting at most flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self._stop.is_set() and self._queue.empty()):
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                continue
+            # Drain whatever is already waiting without paying a timeout per item
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch):
+        if not self.online:
+            self._spool(batch)
+            return
+
+        started = time.perf_counter()
+        try:
+            self.write_fn(batch, self.precision)
+            self.written += len(batch)
+        except Exception as e:
+            print(f"❌ [{self.name}] Failed to write batch of {len(batch)} points: {e}")
+            if self.spool is not None and is_retryable(e):
+                # Offline only once the batch is on disk: with an empty spool the replay loop never
+                # runs, so nothing would bring the writer back online
+                if self._spool(batch):
+                    self.online = False
+                    print(f"💽 [{self.name}] InfluxDB unavailable, spooling batches to {self.spool.directory}")
+            else:
+                self.failed += len(batch)
+        latency = time.perf_counter() - started
+
+        self.flushes += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self._total_flush_latency += latency
+        self._update_rate(len(batch))
+        if self.on_flush is not None:
+            self.on_flush(len(batch), latency)
+
+    def _spool(self, batch):
+        """Append a batch to the spool, True when it is on disk"""
+        try:
+            self.spool.append(batch, self.precision)
+            self.spooled += len(batch)
+            return True
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"❌ [{self.name}] Failed to spool batch of {len(batch)} points: {e}")
+            return False
+
+    def _replay_loop(self):
+        """Replay spooled batches whenever InfluxDB accepts writes again"""
+        while not self._stop.wait(self.retry_interval):
+            if self.spool.empty():
+                if not self.online:
+                    # Nothing to replay (later batches failed to spool): let the next batch try
+                    # InfluxDB directly, it goes back to the spool if the write still fails
+                    self.online = True
+                continue
+            rejected = self.spool.rejected_points
+            try:
+                replayed = self.spool.replay(self.write_fn, self.replay_concurrency, is_retryable)
+            except Exception as e:
+                if self.online:
+                    print(f"⚠️  [{self.name}] Spool replay failed: {e}")
+                self.online = False
+                continue
+            if not self.online:
+                print(f"✅ [{self.name}] InfluxDB reachable again")
+            self.online = True
+            if replayed:
+                print(f"📤 [{self.name}] Replayed {replayed} spooled points")
+            if self.spool.rejected_points > rejected:
+                self.failed += self.spool.rejected_points - rejected
+                print(f"❌ [{self.name}] Dropped {self.spool.rejected_points - rejected} spooled points rejected by InfluxDB")
+
+    def _update_rate(self, points):
+        self._rate_points += points
+        elapsed = time.monotonic() - self._rate_started
+        if elapsed >= RATE_WINDOW:
+            self.points_per_second = self._rate_points / elapsed
+            self._rate_points = 0
+            self._rate_started = time.monotonic()
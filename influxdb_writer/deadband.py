@@ -0,0 +1,114 @@
+"""
+Deadband Filter - Report-by-exception stage in front of the InfluxDB writes
+
+Only fields whose value changed since it was last written are kept: bools and
+ints on any change, floats when they moved more than the field's deadband
+away from the last written value (so slow drift is still written once it adds
+up). Every `heartbeat` of payload time a machine gets a keyframe with all
+fields, so last() and aggregateWindow() over a window at least that long
+still see every field.
+
+The last-value table holds one list of values (in schema field order) per
+machine, which is why a machine must always be handled by the same writer
+process: fine for the single writer and hash sharding, not for MQTT shared
+subscriptions.
+"""
+from influxdb_writer.schema import FLOAT
+from influxdb_writer.timestamps import PRECISION_SCALE
+
+
+def parse_deadbands(spec):
+    """Parse "FillLevel=0.5,lathe.SpindleSpeed=5" into {key: deadband}"""
+    deadbands = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        key, _, value = item.partition("=")
+        deadbands[key.strip()] = float(value)
+    return deadbands
+
+
+class DeadbandFilter:
+    """Per-machine change-only filter with per-field float deadbands and a heartbeat keyframe
+
+    deadbands maps "Field" or "machine_type.Field" to an absolute deadband;
+    float fields not listed use default_deadband (0 means any change).
+    """
+
+    def __init__(self, deadbands=None, default_deadband=0.0, heartbeat=60.0, precision="ns"):
+        self.deadbands = deadbands or {}
+        self.default_deadband = default_deadband
+        self.heartbeat = heartbeat
+        # Heartbeat in timestamp units, compared against payload timestamps
+        self._heartbeat_ticks = int(heartbeat * PRECISION_SCALE[precision])
+        self._thresholds = {}  # schema name -> per-field deadband (None for exact comparison)
+        self._machines = {}  # (schema name, machine_id) -> [keyframe timestamp, last written values]
+
+        self.messages = 0
+        self.fields_seen = 0
+        self.fields_written = 0
+        self.keyframes = 0
+        self.suppressed_messages = 0
+
+    def _thresholds_for(self, schema_name, converter):
+        thresholds = self._thresholds.get(schema_name)
+        if thresholds is None:
+            machine_type = converter.schema.machine_type
+            thresholds = []
+            for field in converter.fields:
+                if field.type != FLOAT:
+                    thresholds.append(None)
+                else:
+                    thresholds.append(self.deadbands.get(f"{machine_type}.{field.name}",
+                                                         self.deadbands.get(field.name, self.default_deadband)))
+            thresholds = self._thresholds[schema_name] = tuple(thresholds)
+        return thresholds
+
+    def changed(self, schema_name, converter, machine_id, values, timestamp):
+        """Indices of the fields to write, None for a full keyframe, or [] when nothing changed
+
+        `values` come from converter.extract(); the table is updated as if the
+        returned fields were written.
+        """
+        self.messages += 1
+        self.fields_seen += len(values)
+        key = (schema_name, machine_id)
+        state = self._machines.get(key)
+        if state is None or timestamp - state[0] >= self._heartbeat_ticks or timestamp < state[0]:
+            self._machines[key] = [timestamp, list(values)]
+            self.keyframes += 1
+            self.fields_written += len(values)
+            return None
+
+        last = state[1]
+        indices = []
+        for index, threshold in enumerate(self._thresholds_for(schema_name, converter)):
+            value = values[index]
+            previous = last[index]
+            if threshold is None or threshold <= 0:
+                if value == previous:
+                    continue
+            elif abs(value - previous) <= threshold:
+                continue
+            indices.append(index)
+            last[index] = value
+
+        if indices:
+            self.fields_written += len(indices)
+        else:
+            self.suppressed_messages += 1
+        return indices
+
+    @property
+    def reduction_ratio(self):
+        """Field values received per field value written"""
+        return self.fields_seen / self.fields_written if self.fields_written else 0.0
+
+    def stats(self):
+        return {
+            "machines": len(self._machines),
+            "messages": self.messages,
+            "suppressed_messages": self.suppressed_messages,
+            "keyframes": self.keyframes,
+            "fields_seen": self.fields_seen,
+            "fields_written": self.fields_written,
+            "reduction_ratio": self.reduction_ratio,
+        }
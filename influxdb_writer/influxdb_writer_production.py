@@ -4,18 +4,30 @@ InfluxDB Writer Service (Production) - Subscribes to MQTT and writes to InfluxDB
 This runs on the IT network and subscribes to cloud MQTT broker
 Supports multiple machines via machine_id tags
 """
-from influxdb_client import InfluxDBClient, Point
+from influxdb_client import InfluxDBClient
 from influxdb_client.client.write_api import SYNCHRONOUS
 import paho.mqtt.client as mqtt
 import json
+import logging
 import sys
 import os
+import signal
 import ssl
+import threading
+import time
 import uuid
-from datetime import datetime, timezone
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.log import Sampler, Throughput, get_logger
+from common.metrics import Registry, start_server
+from influxdb_writer.batch_writer import BatchWriter
+from influxdb_writer.deadband import DeadbandFilter, parse_deadbands
+from influxdb_writer.rollups import ROLLUP_PRECISION, RollupAggregator, parse_windows
+from influxdb_writer.schema import compile_schemas, detect_schema
+from influxdb_writer.sharding import COUNTERS, ShardCounters, ShardSupervisor, shard_for, shared_topic
+from influxdb_writer.spool import Spool
+from influxdb_writer.timestamps import PRECISION_SCALE, TimestampParser, parse_precision_map
 
 # Load .env file from project root
 try:
@@ -42,357 +54,528 @@ INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN", "my-super-secret-auth-token")
 INFLUXDB_ORG = os.getenv("INFLUXDB_ORG", "myorg")
 INFLUXDB_BUCKET = os.getenv("INFLUXDB_BUCKET", "plc_data_new")
 
+# Write pipeline: "batch" queues points and flushes them from a background
+# thread, "sync" writes each point from the MQTT callback (legacy behaviour)
+WRITE_MODE = os.getenv("WRITE_MODE", "batch").lower()
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))  # points per flush
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0"))  # seconds
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))  # max buffered points
+WRITE_MAX_BLOCK = float(os.getenv("WRITE_MAX_BLOCK", "0.5"))  # max seconds to hold the MQTT loop when full
+
+# Timestamp precision written to InfluxDB (s, ms, us, ns). Coarser precision
+# means shorter line protocol; per-bucket overrides: "plc_data_new=ms,plc_data_1h=s"
+WRITE_PRECISION_BY_BUCKET = parse_precision_map(os.getenv("WRITE_PRECISION_BY_BUCKET", ""))
+WRITE_PRECISION = WRITE_PRECISION_BY_BUCKET.get(
+    INFLUXDB_BUCKET, os.getenv("WRITE_PRECISION", "ns").strip().lower()
+)
+if WRITE_PRECISION not in PRECISION_SCALE:
+    raise ValueError(f"Unsupported WRITE_PRECISION '{WRITE_PRECISION}' (use s, ms, us or ns)")
+
+# On-disk spool for batches InfluxDB could not accept (batch mode only, "" disables)
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/tmp/influxdb_writer_spool")
+SPOOL_MAX_MB = int(os.getenv("SPOOL_MAX_MB", "1024"))  # disk cap, oldest segments are discarded first
+SPOOL_SEGMENT_MB = int(os.getenv("SPOOL_SEGMENT_MB", "16"))
+SPOOL_REPLAY_CONCURRENCY = int(os.getenv("SPOOL_REPLAY_CONCURRENCY", "4"))  # batches in flight during replay
+SPOOL_RETRY_INTERVAL = float(os.getenv("SPOOL_RETRY_INTERVAL", "5"))  # seconds between replay attempts
+
+WRITER_STATS_INTERVAL = float(os.getenv("WRITER_STATS_INTERVAL", "30"))  # seconds, 0 disables
+
+# Report-by-exception: only write fields that changed (floats beyond their
+# deadband), with a full keyframe per machine every DEADBAND_HEARTBEAT seconds
+DEADBAND_ENABLED = os.getenv("DEADBAND_ENABLED", "false").lower() == "true"
+DEADBAND_DEFAULT = float(os.getenv("DEADBAND_DEFAULT", "0"))  # float fields not listed below, 0 = any change
+DEADBAND_FIELDS = parse_deadbands(os.getenv("DEADBAND_FIELDS", ""))  # "FillLevel=0.5,lathe.SpindleSpeed=5"
+DEADBAND_HEARTBEAT = float(os.getenv("DEADBAND_HEARTBEAT", "60"))  # seconds
+
+# Streaming min/max/mean/count/last rollups, one bucket per window: <prefix>_1m, <prefix>_5m, ...
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "false").lower() == "true"
+ROLLUP_WINDOWS = parse_windows(os.getenv("ROLLUP_WINDOWS", "1m,5m,1h"))
+ROLLUP_BUCKET_PREFIX = os.getenv("ROLLUP_BUCKET_PREFIX", INFLUXDB_BUCKET)
+ROLLUP_GRACE = float(os.getenv("ROLLUP_GRACE", "10"))  # seconds to wait for late samples before closing a window
+
+# Sharding: run WRITER_SHARDS worker processes ("hash" on machine_id, or MQTT "share"d subscriptions).
+# hash (default) keeps each machine in one worker, so its points are written in order, but every worker
+# still subscribes to every topic: the broker sends N copies and only parsing and writing is split.
+# share (opt-in, needs a broker with $share) delivers each message once, but brokers such as Mosquitto
+# hand them out round-robin, so consecutive messages of a machine are written out of order.
+WRITER_SHARDS = int(os.getenv("WRITER_SHARDS", "1"))
+WRITER_SHARD_MODE = os.getenv("WRITER_SHARD_MODE", "hash").lower()
+WRITER_SHARE_GROUP = os.getenv("WRITER_SHARE_GROUP", "influxdb_writer")
+
+# Prometheus metrics on http://<host>:<port>/metrics (0 disables); when sharded
+# the supervisor serves per-shard totals on this port and worker N on port + 1 + N
+METRICS_PORT = int(os.getenv("WRITER_METRICS_PORT", "9108"))
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+
+# Payload schemas compiled once into line protocol converters
+CONVERTERS = compile_schemas()
+# Producer timestamp strings -> integers at WRITE_PRECISION, format cached per machine
+TIMESTAMPS = TimestampParser()
+
+log = get_logger("influxdb_writer")
+sampler = Sampler(log)
+throughput = Throughput(log, "InfluxDB Writer", counters=("messages", "points", "skipped", "errors"))
+
+metrics = Registry(service="influxdb_writer")
+COUNTER_HELP = {
+    "messages": "MQTT messages handled by this writer",
+    "points": "Points handed to the write pipeline",
+    "skipped": "MQTT messages left to the shard that owns the machine",
+    "errors": "Messages that could not be parsed or written, and points dropped on a full queue",
+}
+metric_counters = {name: metrics.counter(f"influxdb_writer_{name}_total", COUNTER_HELP[name]) for name in COUNTERS}
+parse_latency = metrics.histogram("influxdb_writer_parse_seconds",
+                                  "Time from MQTT message to line protocol record", ("schema",))
+mqtt_reconnects = metrics.counter("influxdb_writer_mqtt_reconnects_total", "MQTT reconnections after the first connect")
+batch_latency = metrics.histogram("influxdb_writer_batch_write_seconds", "InfluxDB write latency per batch", ("bucket",))
+queue_depth = metrics.gauge("influxdb_writer_queue_depth", "Points waiting in the write queue", ("bucket",))
+points_written = metrics.counter("influxdb_writer_points_written_total", "Points accepted by InfluxDB", ("bucket",))
+points_dropped = metrics.counter("influxdb_writer_points_dropped_total",
+                                 "Points dropped because the write queue was full", ("bucket",))
+points_failed = metrics.counter("influxdb_writer_points_failed_total",
+                                "Points lost to failed writes (not spooled)", ("bucket",))
+points_spooled = metrics.counter("influxdb_writer_points_spooled_total",
+                                 "Points spooled to disk while InfluxDB was unavailable", ("bucket",))
+spool_pending = metrics.gauge("influxdb_writer_spool_pending_bytes", "Spooled bytes waiting for replay", ("bucket",))
+influx_online = metrics.gauge("influxdb_writer_influxdb_online", "1 while InfluxDB accepts writes", ("bucket",))
+
+influx_client = None
+write_api = None
+batch_writer = None
+deadband = None
+rollups = None
+rollup_writers = {}  # window label -> BatchWriter of its rollup bucket (batch mode)
+
+# Set per worker process by run_worker()
+shard_index = 0
+shard_count = 1
+shard_counters = None
+shard_label = ""
+_machine_shards = {}  # machine_id -> shard index cache (hash mode)
+_mqtt_connects = 0
+
+def count(name, amount=1):
+    """Add to the throughput summary and this worker's shared counters (sharded mode)"""
+    throughput.add(name, amount)
+    metric_counters[name].inc(amount)
+    if shard_counters is not None:
+        shard_counters.add(shard_index, name, amount)
+
+def owns_machine(machine_id):
+    """Whether this worker handles the machine (always true unless hash-sharded)"""
+    if shard_count == 1 or WRITER_SHARD_MODE != "hash":
+        return True
+    shard = _machine_shards.get(machine_id)
+    if shard is None:
+        shard = _machine_shards[machine_id] = shard_for(machine_id, shard_count)
+    return shard == shard_index
+
+def write_point(record):
+    """Hand a line protocol record to the active write pipeline"""
+    if batch_writer is not None:
+        if not batch_writer.submit(record):
+            if sampler.enabled("dropped", logging.WARNING):
+                log.warning("⚠️  Write queue full (%d points), dropping point", batch_writer.max_queue)
+            count("errors")
+            return False
+        count("points")
+        return True
+    write_api.write(bucket=INFLUXDB_BUCKET, record=record, write_precision=WRITE_PRECISION)
+    count("points")
+    return True
+
+def rollup_bucket(label):
+    return f"{ROLLUP_BUCKET_PREFIX}_{label}"
+
+def write_rollup(label, record):
+    """Hand a closed rollup window to the write pipeline of its bucket"""
+    if label in rollup_writers:
+        if not rollup_writers[label].submit(record):
+            log.warning("⚠️  Rollup queue for %s full, dropping %s rollup", rollup_bucket(label), label)
+        return
+    try:
+        write_api.write(bucket=rollup_bucket(label), record=record, write_precision=ROLLUP_PRECISION)
+    except Exception as e:
+        log.error("❌ Failed to write %s rollup to %s: %s", label, rollup_bucket(label), e)
+
+def expire_rollups():
+    """Close rollup windows of machines that stopped sending"""
+    while True:
+        time.sleep(min(ROLLUP_GRACE, 5.0))
+        try:
+            rollups.expire()
+        except Exception as e:
+            log.warning("⚠️  Error closing rollup windows: %s", e)
+
+def report_stats():
+    """Periodically log write pipeline stats"""
+    while True:
+        time.sleep(WRITER_STATS_INTERVAL)
+        stats = batch_writer.stats()
+        log.info("📊 Writer%s: queue=%s/%s | %.1f points/s | flush=%.1fms (avg %.1fms) | "
+                 "written=%s failed=%s dropped=%s",
+                 shard_label, stats['queue_depth'], batch_writer.max_queue, stats['points_per_second'],
+                 stats['last_flush_latency_ms'], stats['avg_flush_latency_ms'],
+                 stats['written'], stats['failed'], stats['dropped'])
+        if "spool" in stats and (stats["spool"]["pending_segments"] or not stats["online"]):
+            spool = stats["spool"]
+            log.info("💽 Spool: %.1f MB in %s segments | replayed=%s points | InfluxDB %s",
+                     spool['pending_bytes'] / (1024 * 1024), spool['pending_segments'],
+                     spool['replayed_points'], "online" if stats['online'] else "offline")
+        if deadband is not None:
+            filtered = deadband.stats()
+            log.info("🔻 Deadband: %s field values in, %s written (%.1fx reduction) | "
+                     "%s messages without changes | %s machines tracked",
+                     filtered['fields_seen'], filtered['fields_written'], filtered['reduction_ratio'],
+                     filtered['suppressed_messages'], filtered['machines'])
+        if rollups is not None:
+            rolled = rollups.stats()
+            closed = " ".join(f"{label}={count}" for label, count in rolled["closed"].items())
+            log.info("🧮 Rollups: %s open windows | closed %s | %s late samples dropped",
+                     rolled['open_windows'], closed, rolled['late_samples'])
+
 # MQTT callback
+def subscription(topic):
+    """Topic filter to subscribe with, shared between workers in share mode"""
+    if shard_count > 1 and WRITER_SHARD_MODE == "share":
+        return shared_topic(topic, WRITER_SHARE_GROUP)
+    return topic
+
 def on_connect(client, userdata, flags, rc):
+    global _mqtt_connects
     if rc == 0:
-        print(f"✅ Connected to MQTT broker")
-        client.subscribe(MQTT_TOPIC)  # Bottlefiller topics
-        client.subscribe("plc/+/lathe/data")  # Lathe topics
-        print(f"📡 Subscribed to: {MQTT_TOPIC} (bottlefiller)")
-        print(f"📡 Subscribed to: plc/+/lathe/data (lathe)\n")
+        if _mqtt_connects:
+            mqtt_reconnects.inc()
+        _mqtt_connects += 1
+        log.info("✅ Connected to MQTT broker%s", shard_label)
+        client.subscribe(subscription(MQTT_TOPIC))  # Bottlefiller topics
+        client.subscribe(subscription("plc/+/lathe/data"))  # Lathe topics
+        log.info("📡 Subscribed to: %s (bottlefiller)", subscription(MQTT_TOPIC))
+        log.info("📡 Subscribed to: %s (lathe)\n", subscription("plc/+/lathe/data"))
     else:
-        print(f"❌ Failed to connect to MQTT broker, return code {rc}")
+        log.error("❌ Failed to connect to MQTT broker, return code %s", rc)
 
 def on_message(client, userdata, msg):
+    started = time.perf_counter()
     try:
-        # Debug: Print ALL received messages
-        print(f"📨 Received message on topic: {msg.topic} (Machine: {msg.topic.split('/')[1] if len(msg.topic.split('/')) > 1 else 'unknown'})")
+        # Extract machine_id from topic: "plc/machine-01/bottlefiller/data"
+        topic_parts = msg.topic.split('/')
+        machine_id = topic_parts[1] if len(topic_parts) > 1 else "unknown"
+        
+        # Hash sharding: another worker owns this machine
+        if not owns_machine(machine_id):
+            count("skipped")
+            return
+        count("messages")
+        log.debug("📨 Received message on topic: %s (Machine: %s)", msg.topic, machine_id)
         
         # Parse JSON message
         data = json.loads(msg.payload.decode())
         
-        # Extract machine_id from topic: "plc/machine-01/bottlefiller/data"
-        topic_parts = msg.topic.split('/')
-        machine_id = topic_parts[1] if len(topic_parts) > 1 else "unknown"
+        # Handle different data formats (edge gateway, mock_plc_agent, lathe_sim)
+        schema_name = detect_schema(msg.topic, data)
+        if schema_name is None:
+            if sampler.enabled("unknown", logging.WARNING):
+                log.warning("⚠️  Unknown data format, skipping. Keys: %s", list(data.keys())[:5])
+            return
         
         # Optional: Extract additional metadata from environment or data
         line_id = data.get("line_id") or os.getenv("LINE_ID", None)
         location = data.get("location") or os.getenv("LOCATION", None)
         
-        # Debug: print received topic
-        print(f"📨 Received message on topic: {msg.topic} (Machine: {machine_id})")
+        # Convert straight to line protocol with the precompiled schema converter
+        converter = CONVERTERS[schema_name]
+        timestamp = TIMESTAMPS.parse(data.get("timestamp"), machine_id, WRITE_PRECISION)
+        values = converter.extract(data) if deadband is not None or rollups is not None else None
+        if rollups is not None:
+            rollups.add(converter, converter.series_key(machine_id, line_id, location), values, timestamp)
+        if deadband is not None:
+            indices = deadband.changed(schema_name, converter, machine_id, values, timestamp)
+            record = converter.encode_values(values, machine_id, timestamp, line_id, location, indices)
+            if record is None:
+                log.debug("⏭️  No changes [%s], nothing to write", machine_id)
+                return
+        else:
+            record = converter.to_line_protocol(data, machine_id, timestamp, line_id, location)
+        parse_latency.labels(schema_name).observe(time.perf_counter() - started)
         
-        # Handle different data formats
-        if "BottleCount" in data:
-            # Format from edge gateway (simplified)
-            bottle_count = int(data.get("BottleCount", 0))
-            filler_speed = float(data.get("FillerSpeed", 0.0))
-            line_running = bool(data.get("LineRunning", False))
-            
-            # Create InfluxDB point with basic fields and machine_id tag
-            point = Point("plc_data") \
-                .tag("machine_id", machine_id) \
-                .tag("machine_type", "bottlefiller")
-            
-            # Add optional tags if available
-            if line_id:
-                point = point.tag("line", line_id)
-            if location:
-                point = point.tag("location", location)
-            
-            # Parse timestamp (expecting UTC with timezone info)
-            timestamp_str = data.get("timestamp")
-            if timestamp_str:
-                try:
-                    timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                except (ValueError, AttributeError):
-                    timestamp = datetime.now(timezone.utc)
-            else:
-                timestamp = datetime.now(timezone.utc)
-            
-            point = point \
-                .field("BottleCount", bottle_count) \
-                .field("FillerSpeed", filler_speed) \
-                .field("LineRunning", line_running) \
-                .time(timestamp)
-            
-        elif "counters" in data:
-            # Format from mock_plc_agent (full dataset)
-            # Extract all critical tags
-            
-            # === TIER 1: CRITICAL STATUS ===
-            status = data.get("status", {})
-            system_running = bool(status.get("SystemRunning", False))
-            fault = bool(status.get("Fault", False))
-            filling = bool(status.get("Filling", False))
-            ready = bool(status.get("Ready", False))
-            
-            # === TIER 1: CRITICAL COUNTERS ===
+        log.debug("🔍 Writing to bucket=%s, machine_id=%s, timestamp=%s",
+                  INFLUXDB_BUCKET, machine_id, data.get("timestamp", "not provided"))
+        if not write_point(record):
+            return
+        
+        # Sampled summary of what was written (every message at LOG_LEVEL=DEBUG)
+        if not sampler.enabled(schema_name):
+            return
+        if schema_name == "bottlefiller":
             counters = data.get("counters", {})
-            bottles_filled = int(counters.get("BottlesFilled", 0))
-            bottles_rejected = int(counters.get("BottlesRejected", 0))
-            bottles_per_minute = float(counters.get("BottlesPerMinute", 0.0))
-            
-            # === TIER 1: CRITICAL ALARMS ===
-            alarms = data.get("alarms", {})
-            alarm_fault = bool(alarms.get("Fault", False) or fault)  # Check both
-            alarm_overfill = bool(alarms.get("Overfill", False))
-            alarm_underfill = bool(alarms.get("Underfill", False))
-            alarm_low_level = bool(alarms.get("LowProductLevel", False))
-            alarm_cap_missing = bool(alarms.get("CapMissing", False))
-            
-            # === TIER 2: IMPORTANT ANALOG ===
+            status = data.get("status", {})
             analog = data.get("analog", {})
-            fill_level = float(analog.get("FillLevel", 0.0))
-            tank_temperature = float(analog.get("TankTemperature", 0.0))
-            tank_pressure = float(analog.get("TankPressure", 0.0))
-            fill_flow_rate = float(analog.get("FillFlowRate", 0.0))
-            conveyor_speed = float(analog.get("ConveyorSpeed", 0.0))
-            
-            # === TIER 2: IMPORTANT INPUTS ===
-            inputs = data.get("inputs", {})
-            low_level_sensor = bool(inputs.get("LowLevel", False))
-            
-            # Create InfluxDB point with ALL critical tags and machine_id
-            # Tier 1: Critical Status, Counters, Alarms
-            # Tier 2: Important Analog and Inputs
-            point = Point("plc_data") \
-                .tag("machine_id", machine_id) \
-                .tag("machine_type", "bottlefiller")
-            
-            # Add optional tags if available
-            if line_id:
-                point = point.tag("line", line_id)
-            if location:
-                point = point.tag("location", location)
-            
-            point = point \
-                .field("SystemRunning", system_running) \
-                .field("Fault", fault) \
-                .field("Filling", filling) \
-                .field("Ready", ready) \
-                .field("BottlesFilled", bottles_filled) \
-                .field("BottlesRejected", bottles_rejected) \
-                .field("BottlesPerMinute", bottles_per_minute) \
-                .field("AlarmFault", alarm_fault) \
-                .field("AlarmOverfill", alarm_overfill) \
-                .field("AlarmUnderfill", alarm_underfill) \
-                .field("AlarmLowProductLevel", alarm_low_level) \
-                .field("AlarmCapMissing", alarm_cap_missing) \
-                .field("FillLevel", fill_level) \
-                .field("TankTemperature", tank_temperature) \
-                .field("TankPressure", tank_pressure) \
-                .field("FillFlowRate", fill_flow_rate) \
-                .field("ConveyorSpeed", conveyor_speed) \
-                .field("LowLevelSensor", low_level_sensor)
-            
-            # Parse timestamp (expecting UTC with timezone info)
-            timestamp_str = data.get("timestamp")
-            if timestamp_str:
-                try:
-                    timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                except (ValueError, AttributeError):
-                    timestamp = datetime.now(timezone.utc)
-            else:
-                timestamp = datetime.now(timezone.utc)
-            
-            point = point.time(timestamp)
-            
-        elif "lathe" in msg.topic or "spindle" in data:
-            # Format from lathe_sim (CNC Lathe data)
-            # Extract machine_id from topic: "plc/lathe01/lathe/data"
-            print(f"🔧 Processing lathe data from topic: {msg.topic}")
-            machine_id = topic_parts[1] if len(topic_parts) > 1 else "unknown"
-            
-            # Extract lathe-specific data
-            safety = data.get("safety", {})
-            spindle = data.get("spindle", {})
-            axis_x = data.get("axis_x", {})
-            axis_z = data.get("axis_z", {})
-            production = data.get("production", {})
             alarms = data.get("alarms", {})
-            status = data.get("status", {})
-            tooling = data.get("tooling", {})
-            coolant = data.get("coolant", {})
-            
-            # Create InfluxDB point for lathe with machine_type tag
-            point = Point("plc_data") \
-                .tag("machine_id", machine_id) \
-                .tag("machine_type", "lathe") \
-                .field("DoorClosed", bool(safety.get("door_closed", False))) \
-                .field("EStopOK", bool(safety.get("estop_ok", False))) \
-                .field("SpindleSpeed", float(spindle.get("speed_actual", 0.0))) \
-                .field("SpindleSpeedSetpoint", float(spindle.get("speed_setpoint", 0.0))) \
-                .field("SpindleLoad", float(spindle.get("load_percent", 0.0))) \
-                .field("AxisXPosition", float(axis_x.get("position", 0.0))) \
-                .field("AxisXFeedrate", float(axis_x.get("feedrate", 0.0))) \
-                .field("AxisXHomed", bool(axis_x.get("homed", False))) \
-                .field("AxisZPosition", float(axis_z.get("position", 0.0))) \
-                .field("AxisZFeedrate", float(axis_z.get("feedrate", 0.0))) \
-                .field("AxisZHomed", bool(axis_z.get("homed", False))) \
-                .field("CycleTime", float(production.get("cycle_time_seconds", 0.0))) \
-                .field("PartsCompleted", int(production.get("parts_completed", 0))) \
-                .field("PartsRejected", int(production.get("parts_rejected", 0))) \
-                .field("PartsPerHour", float(production.get("parts_per_hour", 0.0))) \
-                .field("AlarmSpindleOverload", bool(alarms.get("spindle_overload", False))) \
-                .field("AlarmChuckNotClamped", bool(alarms.get("chuck_not_clamped", False))) \
-                .field("AlarmDoorOpen", bool(alarms.get("door_open", False))) \
-                .field("AlarmToolWear", bool(alarms.get("tool_wear", False))) \
-                .field("AlarmCoolantLow", bool(alarms.get("coolant_low", False))) \
-                .field("SystemRunning", bool(status.get("system_running", False))) \
-                .field("Machining", bool(status.get("machining", False))) \
-                .field("Ready", bool(status.get("ready", False))) \
-                .field("Fault", bool(status.get("fault", False))) \
-                .field("AutoMode", bool(status.get("auto_mode", False))) \
-                .field("ToolNumber", int(tooling.get("tool_number", 0))) \
-                .field("ToolLifePercent", float(tooling.get("tool_life_percent", 0.0))) \
-                .field("ToolOffsetX", float(tooling.get("tool_offset_x", 0.0))) \
-                .field("ToolOffsetZ", float(tooling.get("tool_offset_z", 0.0))) \
-                .field("CoolantFlowRate", float(coolant.get("flow_rate", 0.0))) \
-                .field("CoolantTemperature", float(coolant.get("temperature", 0.0))) \
-                .field("CoolantLevelPercent", float(coolant.get("level_percent", 0.0)))
-            
-            # Parse timestamp (expecting UTC with timezone info)
-            timestamp_str = data.get("timestamp")
-            if timestamp_str:
-                try:
-                    timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                except (ValueError, AttributeError):
-                    timestamp = datetime.now(timezone.utc)
-            else:
-                timestamp = datetime.now(timezone.utc)
-            
-            point = point.time(timestamp)
-            
+            log.info("💾 Written to InfluxDB [%s]:\n"
+                     "   📊 Production: %s bottles | %.1f bottles/min | %s rejected\n"
+                     "   🔧 Status: Running=%s | Filling=%s | Fault=%s\n"
+                     "   📈 Fill Level: %.1f%% | Temp: %.1f°C\n"
+                     "   ⚠️  Alarms: Fault=%s | Overfill=%s | Underfill=%s",
+                     machine_id,
+                     counters.get('BottlesFilled', 0), counters.get('BottlesPerMinute', 0.0),
+                     counters.get('BottlesRejected', 0),
+                     status.get('SystemRunning', False), status.get('Filling', False), status.get('Fault', False),
+                     analog.get('FillLevel', 0.0), analog.get('TankTemperature', 0.0),
+                     bool(alarms.get('Fault', False) or status.get('Fault', False)),
+                     alarms.get('Overfill', False), alarms.get('Underfill', False))
+        elif schema_name == "lathe":
+            lathe_spindle = data.get("spindle", {})
+            lathe_axis_x = data.get("axis_x", {})
+            lathe_axis_z = data.get("axis_z", {})
+            lathe_production = data.get("production", {})
+            lathe_alarms = data.get("alarms", {})
+            lathe_status = data.get("status", {})
+            log.info("💾 Written to InfluxDB [%s - Lathe]:\n"
+                     "   ⚙️  Spindle: Speed=%.1f RPM | Load=%.1f%%\n"
+                     "   📍 Axis: X=%.2f mm | Z=%.2f mm\n"
+                     "   📊 Production: Parts=%s | Rate=%.1f/hr | Cycle=%.1fs\n"
+                     "   🔧 Status: Running=%s | Machining=%s | Fault=%s\n"
+                     "   ⚠️  Alarms: SpindleOverload=%s | ChuckNotClamped=%s",
+                     machine_id,
+                     lathe_spindle.get('speed_actual', 0), lathe_spindle.get('load_percent', 0),
+                     lathe_axis_x.get('position', 0), lathe_axis_z.get('position', 0),
+                     lathe_production.get('parts_completed', 0), lathe_production.get('parts_per_hour', 0),
+                     lathe_production.get('cycle_time_seconds', 0),
+                     lathe_status.get('system_running', False), lathe_status.get('machining', False),
+                     lathe_status.get('fault', False),
+                     lathe_alarms.get('spindle_overload', False), lathe_alarms.get('chuck_not_clamped', False))
         else:
-            print(f"⚠️  Unknown data format, skipping. Keys: {list(data.keys())[:5]}")
-            return
-        
-        # Write to InfluxDB with explicit error handling
-        try:
-            # Debug: Print point details (every 10th message to avoid spam)
-            import random
-            if random.randint(1, 10) == 1:  # Print debug info 10% of the time
-                data_timestamp = data.get("timestamp", "not provided")
-                print(f"🔍 DEBUG: Writing to bucket={INFLUXDB_BUCKET}, machine_id={machine_id}, timestamp={data_timestamp}")
-            
-            write_api.write(bucket=INFLUXDB_BUCKET, record=point)
-            
-            # Print detailed summary of what was written
-            if "counters" in data:
-                # Bottlefiller data
-                bottles_per_min = counters.get("BottlesPerMinute", 0.0)
-                print(f"💾 Written to InfluxDB [{machine_id}]:")
-                print(f"   📊 Production: {bottles_filled} bottles | "
-                      f"{bottles_per_min:.1f} bottles/min | "
-                      f"{bottles_rejected} rejected")
-                print(f"   🔧 Status: Running={system_running} | "
-                      f"Filling={filling} | Fault={fault}")
-                print(f"   📈 Fill Level: {fill_level:.1f}% | "
-                      f"Temp: {tank_temperature:.1f}°C")
-                print(f"   ⚠️  Alarms: Fault={alarm_fault} | "
-                      f"Overfill={alarm_overfill} | Underfill={alarm_underfill}")
-                print()
-            elif "lathe" in msg.topic or "spindle" in data:
-                # Lathe data - extract again for printing
-                lathe_safety = data.get("safety", {})
-                lathe_spindle = data.get("spindle", {})
-                lathe_axis_x = data.get("axis_x", {})
-                lathe_axis_z = data.get("axis_z", {})
-                lathe_production = data.get("production", {})
-                lathe_alarms = data.get("alarms", {})
-                lathe_status = data.get("status", {})
-                print(f"💾 Written to InfluxDB [{machine_id} - Lathe]:")
-                print(f"   ⚙️  Spindle: Speed={lathe_spindle.get('speed_actual', 0):.1f} RPM | Load={lathe_spindle.get('load_percent', 0):.1f}%")
-                print(f"   📍 Axis: X={lathe_axis_x.get('position', 0):.2f} mm | Z={lathe_axis_z.get('position', 0):.2f} mm")
-                print(f"   📊 Production: Parts={lathe_production.get('parts_completed', 0)} | Rate={lathe_production.get('parts_per_hour', 0):.1f}/hr | Cycle={lathe_production.get('cycle_time_seconds', 0):.1f}s")
-                print(f"   🔧 Status: Running={lathe_status.get('system_running', False)} | Machining={lathe_status.get('machining', False)} | Fault={lathe_status.get('fault', False)}")
-                print(f"   ⚠️  Alarms: SpindleOverload={lathe_alarms.get('spindle_overload', False)} | ChuckNotClamped={lathe_alarms.get('chuck_not_clamped', False)}")
-                print()
-            else:
-                print(f"💾 Written [{machine_id}]: Bottles={bottle_count}, Speed={filler_speed:.2f}, Running={line_running}")
-        except Exception as write_error:
-            print(f"❌ Failed to write to InfluxDB: {write_error}")
-            import traceback
-            traceback.print_exc()
-            return  # Don't continue if write failed
+            log.info("💾 Written [%s]: Bottles=%s, Speed=%.2f, Running=%s",
+                     machine_id, data.get('BottleCount', 0), float(data.get('FillerSpeed', 0.0)),
+                     bool(data.get('LineRunning', False)))
         
     except json.JSONDecodeError as e:
-        print(f"⚠️  JSON decode error: {e}")
+        count("errors")
+        if sampler.enabled("errors", logging.WARNING):
+            log.warning("⚠️  JSON decode error: %s", e)
     except Exception as e:
-        print(f"⚠️  Error writing to InfluxDB: {e}")
-        import traceback
-        traceback.print_exc()
+        count("errors")
+        if sampler.enabled("errors", logging.WARNING):
+            log.exception("⚠️  Error writing to InfluxDB: %s", e)
 
 def on_disconnect(client, userdata, rc):
     if rc != 0:
-        print(f"⚠️  Unexpected MQTT disconnection (rc={rc})")
+        log.warning("⚠️  Unexpected MQTT disconnection (rc=%s)", rc)
 
-# Connect to InfluxDB
-print(f"🔗 Connecting to InfluxDB at {INFLUXDB_URL}...")
-try:
-    influx_client = InfluxDBClient(
-        url=INFLUXDB_URL,
-        token=INFLUXDB_TOKEN,
-        org=INFLUXDB_ORG
-    )
-    write_api = influx_client.write_api(write_options=SYNCHRONOUS)
-    print(f"✅ Connected to InfluxDB")
-    print(f"   Org: {INFLUXDB_ORG}")
-    print(f"   Bucket: {INFLUXDB_BUCKET}\n")
-except Exception as e:
-    print(f"❌ InfluxDB connection error: {e}")
-    print(f"   Make sure InfluxDB is running at {INFLUXDB_URL}")
-    exit(1)
-
-# Create MQTT client with unique ID to avoid conflicts
-client_id = f"influxdb_writer_it_{uuid.uuid4().hex[:8]}"
-mqtt_client = mqtt.Client(client_id=client_id, clean_session=True)
-mqtt_client.on_connect = on_connect
-mqtt_client.on_message = on_message
-mqtt_client.on_disconnect = on_disconnect
-mqtt_client.reconnect_delay_set(min_delay=1, max_delay=120)
-
-# Set username and password
-mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
-
-# Configure TLS if enabled
-if MQTT_TLS_ENABLED:
-    print(f"🔐 Configuring TLS connection...")
-    # Check if connecting to cloud broker (HiveMQ Cloud, etc.)
-    is_cloud_broker = "hivemq.cloud" in MQTT_BROKER.lower() or "cloud" in MQTT_BROKER.lower()
-    
-    if os.path.exists(CA_CERT_PATH) and not is_cloud_broker:
-        # Use CA cert for local/self-hosted brokers
-        mqtt_client.tls_set(
-            ca_certs=CA_CERT_PATH,
-            cert_reqs=ssl.CERT_REQUIRED,
-            tls_version=ssl.PROTOCOL_TLSv1_2
+def create_batch_writer(bucket, precision):
+    """Batch writer (with its own spool directory) for one bucket"""
+    spool = None
+    if SPOOL_DIR:
+        spool_name = bucket if shard_count == 1 else f"{bucket}-shard{shard_index}"
+        spool = Spool(
+            os.path.join(SPOOL_DIR, spool_name),
+            segment_bytes=SPOOL_SEGMENT_MB * 1024 * 1024,
+            max_bytes=SPOOL_MAX_MB * 1024 * 1024,
         )
-        # Disable hostname verification for testing (localhost vs mqtt-broker)
-        # In production, use proper hostname matching
-        check_hostname = os.getenv("MQTT_TLS_CHECK_HOSTNAME", "true").lower() == "true"
-        if not check_hostname:
-            mqtt_client.tls_insecure_set(True)
-            print(f"   ⚠️  Hostname verification disabled (for testing only)")
-        print(f"   ✅ TLS configured with CA cert: {CA_CERT_PATH}")
+    latency = batch_latency.labels(bucket)
+    writer = BatchWriter(
+        lambda records, precision: write_api.write(bucket=bucket, record=records, write_precision=precision),
+        batch_size=WRITE_BATCH_SIZE,
+        flush_interval=WRITE_FLUSH_INTERVAL,
+        max_queue=WRITE_QUEUE_SIZE,
+        max_block=WRITE_MAX_BLOCK,
+        name=bucket,
+        precision=precision,
+        spool=spool,
+        retry_interval=SPOOL_RETRY_INTERVAL,
+        replay_concurrency=SPOOL_REPLAY_CONCURRENCY,
+        on_flush=lambda points, seconds: latency.observe(seconds),
+    ).start()
+
+    # Read from the writer when scraped, nothing extra on the write path
+    queue_depth.labels(bucket).set_function(lambda: writer.queue_depth)
+    points_written.labels(bucket).set_function(lambda: writer.written)
+    points_dropped.labels(bucket).set_function(lambda: writer.dropped)
+    points_failed.labels(bucket).set_function(lambda: writer.failed)
+    points_spooled.labels(bucket).set_function(lambda: writer.spooled)
+    influx_online.labels(bucket).set_function(lambda: int(writer.online))
+    if spool is not None:
+        spool_pending.labels(bucket).set_function(lambda: spool.pending_bytes)
+    return writer
+
+def serve_metrics(registry, port):
+    """Start the metrics endpoint; a busy port only costs the metrics, not the writer"""
+    try:
+        if start_server(registry, port, METRICS_HOST) is not None:
+            print(f"📈 Metrics: http://{METRICS_HOST}:{port}/metrics")
+    except OSError as e:
+        print(f"⚠️  Metrics endpoint on port {port} unavailable: {e}")
+
+def run_worker(worker_index=0, worker_count=1, counters=None):
+    """Run one writer: InfluxDB pipeline plus MQTT loop (one shard when sharded)"""
+    global influx_client, write_api, batch_writer, deadband, rollups
+    global shard_index, shard_count, shard_counters, shard_label
+
+    shard_index, shard_count, shard_counters = worker_index, worker_count, counters
+    if shard_count > 1:
+        shard_label = f" [shard {shard_index}/{shard_count}]"
+        throughput.label += shard_label
+    # Treat SIGTERM (docker stop, supervisor kill) like Ctrl+C so buffered points get flushed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    # Connect to InfluxDB
+    print(f"🔗 Connecting to InfluxDB at {INFLUXDB_URL}...")
+    try:
+        influx_client = InfluxDBClient(
+            url=INFLUXDB_URL,
+            token=INFLUXDB_TOKEN,
+            org=INFLUXDB_ORG
+        )
+        write_api = influx_client.write_api(write_options=SYNCHRONOUS)
+        print(f"✅ Connected to InfluxDB")
+        print(f"   Org: {INFLUXDB_ORG}")
+        print(f"   Bucket: {INFLUXDB_BUCKET}\n")
+    except Exception as e:
+        print(f"❌ InfluxDB connection error: {e}")
+        print(f"   Make sure InfluxDB is running at {INFLUXDB_URL}")
+        exit(1)
+
+    if DEADBAND_ENABLED:
+        if shard_count > 1 and WRITER_SHARD_MODE == "share":
+            # The last-value table needs every message of a machine in one process
+            print("⚠️  Deadband filter disabled: needs WRITER_SHARD_MODE=hash when sharded")
+        else:
+            deadband = DeadbandFilter(DEADBAND_FIELDS, DEADBAND_DEFAULT, DEADBAND_HEARTBEAT, WRITE_PRECISION)
+            print(f"🔻 Deadband filter: default {DEADBAND_DEFAULT}, {len(DEADBAND_FIELDS)} field overrides, "
+                  f"keyframe every {DEADBAND_HEARTBEAT:.0f}s")
+
+    if ROLLUPS_ENABLED:
+        if shard_count > 1 and WRITER_SHARD_MODE == "share":
+            # Every sample of a machine has to land in the same process
+            print("⚠️  Rollups disabled: need WRITER_SHARD_MODE=hash when sharded")
+        else:
+            rollups = RollupAggregator(ROLLUP_WINDOWS, write_rollup, WRITE_PRECISION, ROLLUP_GRACE)
+            print(f"🧮 Rollups: {', '.join(rollup_bucket(label) for label, _ in ROLLUP_WINDOWS)}")
+
+    if WRITE_MODE == "batch":
+        batch_writer = create_batch_writer(INFLUXDB_BUCKET, WRITE_PRECISION)
+        print(f"📦 Batched writes: {WRITE_BATCH_SIZE} points or {WRITE_FLUSH_INTERVAL}s per flush, "
+              f"queue limit {WRITE_QUEUE_SIZE}, precision {WRITE_PRECISION}")
+        if batch_writer.spool is not None:
+            print(f"💽 Spool: {batch_writer.spool.directory} (cap {SPOOL_MAX_MB} MB, "
+                  f"{batch_writer.spool.pending_bytes / (1024 * 1024):.1f} MB pending from previous runs)")
+        if rollups is not None:
+            for label, _ in ROLLUP_WINDOWS:
+                rollup_writers[label] = create_batch_writer(rollup_bucket(label), ROLLUP_PRECISION)
+        if WRITER_STATS_INTERVAL > 0:
+            threading.Thread(target=report_stats, daemon=True).start()
     else:
-        # For cloud brokers or when CA cert not found, disable certificate verification
-        if is_cloud_broker:
-            print(f"   ℹ️  Cloud MQTT broker detected, disabling certificate verification")
+        print(f"📝 Synchronous writes (one request per message), precision {WRITE_PRECISION}")
+    if rollups is not None:
+        threading.Thread(target=expire_rollups, daemon=True).start()
+    throughput.start()
+    if METRICS_PORT:
+        if shard_count > 1:
+            metrics.const_labels["shard"] = str(shard_index)
+            serve_metrics(metrics, METRICS_PORT + 1 + shard_index)
         else:
-            print(f"   ⚠️  CA cert not found: {CA_CERT_PATH}")
-            print(f"   ⚠️  Running without TLS verification (for cloud MQTT)")
-        mqtt_client.tls_set(cert_reqs=ssl.CERT_NONE)
-        mqtt_client.tls_insecure_set(True)  # Disable certificate verification for cloud brokers
-
-print(f"🔗 Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}...")
-print(f"   Network: IT Network")
-print(f"   TLS: {'Enabled' if MQTT_TLS_ENABLED else 'Disabled'}")
-try:
-    mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    print("🔄 Waiting for messages...\n")
-    mqtt_client.loop_forever()
-except KeyboardInterrupt:
-    print("\n🛑 Stopping InfluxDB Writer...")
-    mqtt_client.disconnect()
-    write_api.close()
-    influx_client.close()
-    print("✅ InfluxDB Writer stopped")
-except Exception as e:
-    print(f"❌ Error: {e}")
-    mqtt_client.disconnect()
+            serve_metrics(metrics, METRICS_PORT)
+
+    # Create MQTT client with unique ID to avoid conflicts
+    client_id = f"influxdb_writer_it_{shard_index}_{uuid.uuid4().hex[:8]}"
+    mqtt_client = mqtt.Client(client_id=client_id, clean_session=True)
+    mqtt_client.on_connect = on_connect
+    mqtt_client.on_message = on_message
+    mqtt_client.on_disconnect = on_disconnect
+    mqtt_client.reconnect_delay_set(min_delay=1, max_delay=120)
+
+    # Set username and password
+    mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+
+    # Configure TLS if enabled
+    if MQTT_TLS_ENABLED:
+        print(f"🔐 Configuring TLS connection...")
+        # Check if connecting to cloud broker (HiveMQ Cloud, etc.)
+        is_cloud_broker = "hivemq.cloud" in MQTT_BROKER.lower() or "cloud" in MQTT_BROKER.lower()
+        
+        if os.path.exists(CA_CERT_PATH) and not is_cloud_broker:
+            # Use CA cert for local/self-hosted brokers
+            mqtt_client.tls_set(
+                ca_certs=CA_CERT_PATH,
+                cert_reqs=ssl.CERT_REQUIRED,
+                tls_version=ssl.PROTOCOL_TLSv1_2
+            )
+            # Disable hostname verification for testing (localhost vs mqtt-broker)
+            # In production, use proper hostname matching
+            check_hostname = os.getenv("MQTT_TLS_CHECK_HOSTNAME", "true").lower() == "true"
+            if not check_hostname:
+                mqtt_client.tls_insecure_set(True)
+                print(f"   ⚠️  Hostname verification disabled (for testing only)")
+            print(f"   ✅ TLS configured with CA cert: {CA_CERT_PATH}")
+        else:
+            # For cloud brokers or when CA cert not found, disable certificate verification
+            if is_cloud_broker:
+                print(f"   ℹ️  Cloud MQTT broker detected, disabling certificate verification")
+            else:
+                print(f"   ⚠️  CA cert not found: {CA_CERT_PATH}")
+                print(f"   ⚠️  Running without TLS verification (for cloud MQTT)")
+            mqtt_client.tls_set(cert_reqs=ssl.CERT_NONE)
+            mqtt_client.tls_insecure_set(True)  # Disable certificate verification for cloud brokers
+
+    print(f"🔗 Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}...")
+    print(f"   Network: IT Network")
+    print(f"   TLS: {'Enabled' if MQTT_TLS_ENABLED else 'Disabled'}")
+    try:
+        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        print("🔄 Waiting for messages...\n")
+        mqtt_client.loop_forever()
+    except KeyboardInterrupt:
+        # Don't let a second Ctrl+C / supervisor signal interrupt the final flush
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        print(f"\n🛑 Stopping InfluxDB Writer{shard_label}...")
+        mqtt_client.disconnect()
+        shutdown()
+        print("✅ InfluxDB Writer stopped")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        mqtt_client.disconnect()
+        shutdown()
+        exit(1)
+
+def shutdown():
+    """Flush buffered points and close InfluxDB connections"""
+    if rollups is not None:
+        # Partial windows are written too; a restart mid-window rewrites them from the new samples only
+        rollups.flush()
+    if batch_writer is not None:
+        print(f"⏳ Flushing {batch_writer.queue_depth} buffered points...")
+        batch_writer.close()
+    for writer in rollup_writers.values():
+        writer.close()
     write_api.close()
     influx_client.close()
-    exit(1)
 
+def main():
+    if WRITER_SHARDS > 1:
+        print(f"🧩 Sharded writer: {WRITER_SHARDS} workers, mode={WRITER_SHARD_MODE}")
+        if WRITER_SHARD_MODE == "share":
+            print("⚠️  WRITER_SHARD_MODE=share: the broker spreads a machine's messages over the workers, "
+                  "per-machine write order is not guaranteed")
+        # The supervisor forwards SIGTERM to the workers as SIGINT
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        counters = ShardCounters(WRITER_SHARDS)
+        supervisor = ShardSupervisor(run_worker, WRITER_SHARDS, counters, report_interval=WRITER_STATS_INTERVAL)
+        if METRICS_PORT:
+            # Per-shard totals in one scrape; each worker serves its full metrics on METRICS_PORT + 1 + N
+            shard_metrics = Registry(service="influxdb_writer")
+            for name in COUNTERS:
+                family = shard_metrics.counter(f"influxdb_writer_shard_{name}_total", COUNTER_HELP[name], ("shard",))
+                for index in range(WRITER_SHARDS):
+                    family.labels(str(index)).set_function(lambda index=index, name=name: counters.shard(index)[name])
+            restarts = shard_metrics.counter("influxdb_writer_shard_restarts_total",
+                                             "Worker processes restarted after exiting", ("shard",))
+            for index in range(WRITER_SHARDS):
+                restarts.labels(str(index)).set_function(lambda index=index: supervisor.restarts[index])
+            serve_metrics(shard_metrics, METRICS_PORT)
+        supervisor.run()
+    else:
+        run_worker()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Streaming Rollups - Per machine and field min/max/mean/count/last over fixed
+windows (1m, 5m, 1h by default), written to one rollup bucket per window when
+the window closes
+
+Windows are aligned to the epoch like aggregateWindow(), and each rollup is
+stamped with its window stop, which is also the _time aggregateWindow()
+reports, so long-range charts can read e.g. plc_data_new_5m instead of
+re-aggregating every raw 2-second point:
+
+    from(bucket: "plc_data_new_5m")
+      |> range(start: -7d)
+      |> filter(fn: (r) => r["machine_id"] == "machine-01")
+      |> filter(fn: (r) => r["_field"] == "FillLevel_mean")
+
+Only the finest window sees raw samples; each closed window is merged into the
+next coarser one, so the per-message cost does not grow with the number of
+windows. A window closes when the first sample of a later window arrives, or
+`grace` seconds after its stop when a machine goes quiet. A sample that falls
+in a window already written (at any level) is counted in late_samples and
+dropped, so a complete rollup is never overwritten by a partial one.
+
+Fields per rollup line: count (samples in the window), then <Field>_min,
+<Field>_max, <Field>_mean and <Field>_last for numeric fields, and
+<Field>_mean (fraction of samples that were true) and <Field>_last for bools.
+Timestamps are whole seconds, so rollups are written with precision "s".
+"""
+import math
+import threading
+import time
+
+from influxdb_writer.schema import BOOL, INT, escape_key, format_bool, format_float, format_int
+from influxdb_writer.timestamps import PRECISION_SCALE
+
+ROLLUP_PRECISION = "s"
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_windows(spec):
+    """Parse "1m,5m,1h" into [(label, seconds)], finest first
+
+    Every window must be a multiple of the previous one so closed windows can
+    be merged upwards.
+    """
+    windows = []
+    for label in filter(None, (part.strip() for part in (spec or "").split(","))):
+        if label[-1] not in _UNITS or not label[:-1].isdigit() or int(label[:-1]) <= 0:
+            raise ValueError(f"Invalid rollup window '{label}' (use e.g. 30s, 1m, 5m, 1h)")
+        windows.append((label, int(label[:-1]) * _UNITS[label[-1]]))
+    windows.sort(key=lambda window: window[1])
+    for (finer, finer_seconds), (coarser, coarser_seconds) in zip(windows, windows[1:]):
+        if coarser_seconds % finer_seconds:
+            raise ValueError(f"Rollup window {coarser} is not a multiple of {finer}")
+    return windows
+
+
+class _Window:
+    """Running aggregates of one series over one window"""
+
+    __slots__ = ("converter", "start", "stop", "samples", "mins", "maxs", "sums", "counts", "lasts")
+
+    def __init__(self, converter, start, stop):
+        size = len(converter.fields)
+        self.converter = converter
+        self.start = start
+        self.stop = stop
+        self.samples = 0
+        self.mins = [None] * size
+        self.maxs = [None] * size
+        self.sums = [0.0] * size
+        self.counts = [0] * size
+        self.lasts = [None] * size
+
+    def add(self, values):
+        self.samples += 1
+        mins, maxs, sums, counts, lasts = self.mins, self.maxs, self.sums, self.counts, self.lasts
+        for index, value in enumerate(values):
+            if not math.isfinite(value):
+                continue
+            if counts[index]:
+                if value < mins[index]:
+                    mins[index] = value
+                elif value > maxs[index]:
+                    maxs[index] = value
+            else:
+                mins[index] = maxs[index] = value
+            sums[index] += value
+            counts[index] += 1
+            lasts[index] = value
+
+    def merge(self, other):
+        """Fold a closed finer window (later in time than anything merged so far) into this one"""
+        self.samples += other.samples
+        for index, count in enumerate(other.counts):
+            if not count:
+                continue
+            if self.counts[index]:
+                self.mins[index] = min(self.mins[index], other.mins[index])
+                self.maxs[index] = max(self.maxs[index], other.maxs[index])
+            else:
+                self.mins[index], self.maxs[index] = other.mins[index], other.maxs[index]
+            self.sums[index] += other.sums[index]
+            self.counts[index] += count
+            self.lasts[index] = other.lasts[index]
+
+    def to_line_protocol(self, series, scale):
+        parts = [f"count={self.samples}i"]
+        for index, field in enumerate(self.converter.fields):
+            count = self.counts[index]
+            if not count:
+                continue
+            name = escape_key(field.name)
+            mean = format_float(self.sums[index] / count)
+            if field.type == BOOL:
+                parts.append(f"{name}_last={format_bool(self.lasts[index])},{name}_mean={mean}")
+            else:
+                fmt = format_int if field.type == INT else format_float
+                parts.append(f"{name}_last={fmt(self.lasts[index])},{name}_max={fmt(self.maxs[index])},"
+                             f"{name}_mean={mean},{name}_min={fmt(self.mins[index])}")
+        return f"{series} {','.join(parts)} {self.stop // scale}".encode()
+
+
+class RollupAggregator:
+    """Streaming window rollups for every series the writer sees
+
+    emit(label, record) is called with one line protocol record (precision
+    "s") per closed window. Timestamps passed to add() are integers in
+    `precision` units, as produced by the writer's TimestampParser.
+    """
+
+    def __init__(self, windows, emit, precision="ns", grace=10.0):
+        self.windows = windows
+        self.emit = emit
+        self.precision = precision
+        self.grace = grace
+        self._scale = PRECISION_SCALE[precision]
+        self._widths = [seconds * self._scale for _, seconds in windows]
+        self._open = [{} for _ in windows]  # per window: series -> _Window
+        self._closed = [{} for _ in windows]  # per window: series -> stop of the last window written
+        self._lock = threading.Lock()
+
+        self.samples = 0
+        self.late_samples = 0
+        self.closed = dict.fromkeys((label for label, _ in windows), 0)
+
+    def add(self, converter, series, values, timestamp):
+        """Add one sample (values from converter.extract()) for a series"""
+        width = self._widths[0]
+        start = timestamp - timestamp % width
+        with self._lock:
+            if any(start < closed.get(series, start) for closed in self._closed):
+                # Falls in a window already written (at this or a coarser level): rewriting it would
+                # replace the complete rollup with a partial one
+                self.late_samples += 1
+                return
+            window = self._open[0].get(series)
+            if window is not None and window.start != start:
+                if start < window.start:
+                    # Older than the open window: that window was already written
+                    self.late_samples += 1
+                    return
+                self._close(0, series, window)
+                window = None
+            if window is None:
+                window = self._open[0][series] = _Window(converter, start, start + width)
+            window.add(values)
+            self.samples += 1
+
+    def _close(self, level, series, window):
+        """Write a closed window and merge it into the next coarser one (caller holds the lock)"""
+        del self._open[level][series]
+        self._closed[level][series] = window.stop
+        self.closed[self.windows[level][0]] += 1
+        self.emit(self.windows[level][0], window.to_line_protocol(series, self._scale))
+
+        if level + 1 == len(self.windows):
+            return
+        width = self._widths[level + 1]
+        start = window.start - window.start % width
+        coarser = self._open[level + 1].get(series)
+        if coarser is not None and coarser.start != start:
+            self._close(level + 1, series, coarser)
+            coarser = None
+        if coarser is None:
+            coarser = self._open[level + 1][series] = _Window(window.converter, start, start + width)
+        coarser.merge(window)
+        if window.stop == coarser.stop:
+            # Last finer window of the coarser one: it is complete
+            self._close(level + 1, series, coarser)
+
+    def expire(self, now=None):
+        """Close windows whose stop is more than `grace` seconds in the past"""
+        if now is None:
+            now = time.time_ns() // (1_000_000_000 // self._scale)
+        cutoff = now - int(self.grace * self._scale)
+        with self._lock:
+            for level, windows in enumerate(self._open):
+                for series in [series for series, window in windows.items() if window.stop <= cutoff]:
+                    # A cascade from a finer level may already have closed it
+                    if series in windows and windows[series].stop <= cutoff:
+                        self._close(level, series, windows[series])
+
+    def flush(self):
+        """Write every open window, complete or not (shutdown)"""
+        with self._lock:
+            for level, windows in enumerate(self._open):
+                for series in list(windows):
+                    if series in windows:
+                        self._close(level, series, windows[series])
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "late_samples": self.late_samples,
+            "open_windows": sum(len(windows) for windows in self._open),
+            "closed": dict(self.closed),
+        }
@@ -0,0 +1,298 @@
+"""
+Payload Schemas - Declarative mapping from MQTT payloads to InfluxDB fields
+Each machine type lists (field name, payload path, type). A schema is compiled
+once at startup into a specialised converter that emits line protocol bytes
+directly instead of building a Point per message.
+"""
+import math
+from collections import namedtuple
+
+FLOAT = "float"
+INT = "int"
+BOOL = "bool"
+
+# path is a dotted payload path ("status.SystemRunning"). A tuple of paths is
+# allowed for bool fields and means "true if any of them is true".
+Field = namedtuple("Field", ["name", "path", "type"])
+
+# site_tags: whether the optional line/location tags are attached
+MachineSchema = namedtuple("MachineSchema", ["measurement", "machine_type", "fields", "site_tags"])
+
+# Edge gateway (Modbus) - simplified bottle filler payload
+EDGE_GATEWAY = MachineSchema("plc_data", "bottlefiller", (
+    Field("BottleCount", "BottleCount", INT),
+    Field("FillerSpeed", "FillerSpeed", FLOAT),
+    Field("LineRunning", "LineRunning", BOOL),
+), site_tags=True)
+
+# mock_plc_agent - full bottle filler dataset (Tier 1 and Tier 2 tags)
+BOTTLEFILLER = MachineSchema("plc_data", "bottlefiller", (
+    # === TIER 1: CRITICAL STATUS ===
+    Field("SystemRunning", "status.SystemRunning", BOOL),
+    Field("Fault", "status.Fault", BOOL),
+    Field("Filling", "status.Filling", BOOL),
+    Field("Ready", "status.Ready", BOOL),
+    # === TIER 1: CRITICAL COUNTERS ===
+    Field("BottlesFilled", "counters.BottlesFilled", INT),
+    Field("BottlesRejected", "counters.BottlesRejected", INT),
+    Field("BottlesPerMinute", "counters.BottlesPerMinute", FLOAT),
+    # === TIER 1: CRITICAL ALARMS ===
+    Field("AlarmFault", ("alarms.Fault", "status.Fault"), BOOL),
+    Field("AlarmOverfill", "alarms.Overfill", BOOL),
+    Field("AlarmUnderfill", "alarms.Underfill", BOOL),
+    Field("AlarmLowProductLevel", "alarms.LowProductLevel", BOOL),
+    Field("AlarmCapMissing", "alarms.CapMissing", BOOL),
+    # === TIER 2: IMPORTANT ANALOG ===
+    Field("FillLevel", "analog.FillLevel", FLOAT),
+    Field("TankTemperature", "analog.TankTemperature", FLOAT),
+    Field("TankPressure", "analog.TankPressure", FLOAT),
+    Field("FillFlowRate", "analog.FillFlowRate", FLOAT),
+    Field("ConveyorSpeed", "analog.ConveyorSpeed", FLOAT),
+    # === TIER 2: IMPORTANT INPUTS ===
+    Field("LowLevelSensor", "inputs.LowLevel", BOOL),
+), site_tags=True)
+
+# lathe_sim - CNC lathe telemetry
+LATHE = MachineSchema("plc_data", "lathe", (
+    Field("DoorClosed", "safety.door_closed", BOOL),
+    Field("EStopOK", "safety.estop_ok", BOOL),
+    Field("SpindleSpeed", "spindle.speed_actual", FLOAT),
+    Field("SpindleSpeedSetpoint", "spindle.speed_setpoint", FLOAT),
+    Field("SpindleLoad", "spindle.load_percent", FLOAT),
+    Field("AxisXPosition", "axis_x.position", FLOAT),
+    Field("AxisXFeedrate", "axis_x.feedrate", FLOAT),
+    Field("AxisXHomed", "axis_x.homed", BOOL),
+    Field("AxisZPosition", "axis_z.position", FLOAT),
+    Field("AxisZFeedrate", "axis_z.feedrate", FLOAT),
+    Field("AxisZHomed", "axis_z.homed", BOOL),
+    Field("CycleTime", "production.cycle_time_seconds", FLOAT),
+    Field("PartsCompleted", "production.parts_completed", INT),
+    Field("PartsRejected", "production.parts_rejected", INT),
+    Field("PartsPerHour", "production.parts_per_hour", FLOAT),
+    Field("AlarmSpindleOverload", "alarms.spindle_overload", BOOL),
+    Field("AlarmChuckNotClamped", "alarms.chuck_not_clamped", BOOL),
+    Field("AlarmDoorOpen", "alarms.door_open", BOOL),
+    Field("AlarmToolWear", "alarms.tool_wear", BOOL),
+    Field("AlarmCoolantLow", "alarms.coolant_low", BOOL),
+    Field("SystemRunning", "status.system_running", BOOL),
+    Field("Machining", "status.machining", BOOL),
+    Field("Ready", "status.ready", BOOL),
+    Field("Fault", "status.fault", BOOL),
+    Field("AutoMode", "status.auto_mode", BOOL),
+    Field("ToolNumber", "tooling.tool_number", INT),
+    Field("ToolLifePercent", "tooling.tool_life_percent", FLOAT),
+    Field("ToolOffsetX", "tooling.tool_offset_x", FLOAT),
+    Field("ToolOffsetZ", "tooling.tool_offset_z", FLOAT),
+    Field("CoolantFlowRate", "coolant.flow_rate", FLOAT),
+    Field("CoolantTemperature", "coolant.temperature", FLOAT),
+    Field("CoolantLevelPercent", "coolant.level_percent", FLOAT),
+), site_tags=False)
+
+SCHEMAS = {
+    "edge_gateway": EDGE_GATEWAY,
+    "bottlefiller": BOTTLEFILLER,
+    "lathe": LATHE,
+}
+
+_DEFAULTS = {FLOAT: 0.0, INT: 0, BOOL: False}
+_ESCAPE_KEY = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n", "\r": "\\r", "\t": "\\t"})
+
+
+def detect_schema(topic, data):
+    """Return the schema name for a message, or None for unknown formats"""
+    if "BottleCount" in data:
+        return "edge_gateway"
+    if "counters" in data:
+        return "bottlefiller"
+    if "lathe" in topic or "spindle" in data:
+        return "lathe"
+    return None
+
+
+class NonFiniteFloat(ValueError):
+    pass
+
+
+def format_float(value):
+    """Format a float the way the InfluxDB client does (no trailing .0)"""
+    value = float(value)
+    if not math.isfinite(value):
+        raise NonFiniteFloat(value)
+    text = repr(value)
+    return text[:-2] if text.endswith(".0") else text
+
+
+def format_bool(value):
+    return "true" if value else "false"
+
+
+def format_int(value):
+    return f"{int(value)}i"
+
+
+FORMATTERS = {FLOAT: format_float, INT: format_int, BOOL: format_bool}
+
+
+def escape_key(key):
+    return str(key).translate(_ESCAPE_KEY)
+
+
+def escape_tag_value(value):
+    text = escape_key(value)
+    return text + " " if text.endswith("\\") else text
+
+
+def _paths(field):
+    return field.path if isinstance(field.path, tuple) else (field.path,)
+
+
+def get_path(data, path):
+    """Generic (slow path) lookup of a dotted payload path"""
+    value = data
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def extract_value(data, field):
+    """Generic (slow path) extraction and coercion of one field"""
+    if field.type == BOOL:
+        return any(get_path(data, path) for path in _paths(field))
+    value = get_path(data, field.path)
+    if value is None:
+        value = _DEFAULTS[field.type]
+    return int(value) if field.type == INT else float(value)
+
+
+def _generate_lookups(fields):
+    """Lookup statements plus one raw value expression per field (shared by the generators)"""
+    body = ["    get = data.get"]
+    groups = {}  # dotted prefix -> local variable holding that sub-dict
+
+    def lookup(path, default):
+        parts = path.split(".")
+        parent = "get"
+        for depth in range(1, len(parts)):
+            prefix = ".".join(parts[:depth])
+            if prefix not in groups:
+                groups[prefix] = f"g{len(groups)}"
+                getter = parent if parent == "get" else f"{parent}.get"
+                body.append(f"    {groups[prefix]} = {getter}({parts[depth - 1]!r}) or _EMPTY")
+            parent = groups[prefix]
+        getter = parent if parent == "get" else f"{parent}.get"
+        return f"{getter}({parts[-1]!r}, {default!r})"
+
+    expressions = []
+    for field in fields:
+        if field.type == BOOL:
+            expressions.append(" or ".join(lookup(path, False) for path in _paths(field)))
+        else:
+            expressions.append(lookup(field.path, _DEFAULTS[field.type]))
+    return body, expressions
+
+
+def _generate_source(fields):
+    """Generate the source of a specialised convert(data, series, ts) function"""
+    body, expressions = _generate_lookups(fields)
+    parts = []
+    for index, (field, expression) in enumerate(zip(fields, expressions)):
+        var = f"v{index}"
+        # Literal text of an f-string: braces must be doubled
+        name = escape_key(field.name).replace("{", "{{").replace("}", "}}")
+        if field.type == BOOL:
+            body.append(f"    {var} = 'true' if ({expression}) else 'false'")
+            parts.append(f"{name}={{{var}}}")
+        elif field.type == INT:
+            body.append(f"    {var} = int({expression})")
+            parts.append(f"{name}={{{var}}}i")
+        else:
+            body.append(f"    {var} = _format_float({expression})")
+            parts.append(f"{name}={{{var}}}")
+
+    field_set = ",".join(parts).replace("\\", "\\\\").replace('"', '\\"')
+    return "\n".join(
+        ["def convert(data, series, ts):"] + body + [f'    return f"{{series}} {field_set} {{ts}}".encode()']
+    )
+
+
+def _generate_extract_source(fields):
+    """Generate the source of extract(data), returning the typed field values as a tuple"""
+    body, expressions = _generate_lookups(fields)
+    coerce = {BOOL: "bool", INT: "int", FLOAT: "float"}
+    values = ", ".join(f"{coerce[field.type]}({expression})" for field, expression in zip(fields, expressions))
+    return "\n".join(["def extract(data):"] + body + [f"    return ({values},)"])
+
+
+class CompiledSchema:
+    """Line protocol converter specialised for one machine schema"""
+
+    def __init__(self, schema):
+        self.schema = schema
+        # Same field order as the InfluxDB client (sorted by key)
+        self.fields = tuple(sorted(schema.fields, key=lambda f: f.name))
+        self.source = _generate_source(self.fields)
+        self.extract_source = _generate_extract_source(self.fields)
+        namespace = {"_EMPTY": {}, "_format_float": format_float}
+        exec(compile(self.source, f"<schema {schema.machine_type}>", "exec"), namespace)
+        exec(compile(self.extract_source, f"<schema {schema.machine_type} extract>", "exec"), namespace)
+        self._convert = namespace["convert"]
+        self.extract = namespace["extract"]
+        self._series = {}
+        self._encoders = tuple((f"{escape_key(field.name)}=", FORMATTERS[field.type]) for field in self.fields)
+
+    def series_key(self, machine_id, line=None, location=None):
+        """Escaped measurement and tag set, cached per machine"""
+        key = (machine_id, line, location)
+        series = self._series.get(key)
+        if series is None:
+            tags = {"machine_id": machine_id, "machine_type": self.schema.machine_type}
+            if self.schema.site_tags:
+                tags["line"] = line
+                tags["location"] = location
+            tag_set = "".join(f",{escape_key(k)}={escape_tag_value(v)}"
+                              for k, v in sorted(tags.items()) if v)
+            series = f"{escape_key(self.schema.measurement)}{tag_set}"
+            self._series[key] = series
+        return series
+
+    def to_line_protocol(self, data, machine_id, timestamp, line=None, location=None):
+        """Convert a payload to one line of line protocol (bytes)"""
+        series = self.series_key(machine_id, line, location)
+        try:
+            return self._convert(data, series, timestamp)
+        except NonFiniteFloat:
+            return self._convert_skipping_nonfinite(data, series, timestamp)
+
+    def encode_values(self, values, machine_id, timestamp, line=None, location=None, indices=None):
+        """Line protocol for values from extract(), optionally only the fields at `indices`
+
+        Returns None when no field is left to write (all skipped as non-finite).
+        """
+        parts = []
+        encoders = self._encoders
+        for index in (range(len(values)) if indices is None else indices):
+            prefix, formatter = encoders[index]
+            try:
+                parts.append(prefix + formatter(values[index]))
+            except NonFiniteFloat:
+                continue
+        if not parts:
+            return None
+        return f"{self.series_key(machine_id, line, location)} {','.join(parts)} {timestamp}".encode()
+
+    def _convert_skipping_nonfinite(self, data, series, timestamp):
+        """Slow path: drop NaN/inf fields like the InfluxDB client does"""
+        parts = []
+        for field in self.fields:
+            value = extract_value(data, field)
+            if field.type == FLOAT and not math.isfinite(value):
+                continue
+            parts.append(f"{escape_key(field.name)}={FORMATTERS[field.type](value)}")
+        return f"{series} {','.join(parts)} {timestamp}".encode()
+
+
+def compile_schemas(schemas=None):
+    """Compile every schema once, keyed by schema name"""
+    return {name: CompiledSchema(schema) for name, schema in (schemas or SCHEMAS).items()}
@@ -0,0 +1,123 @@
+"""
+Writer Sharding - Runs N InfluxDB writer worker processes that split the MQTT
+ingest between them, so throughput scales with CPU cores
+
+Two modes:
+  hash  - every worker subscribes to all topics and keeps only the machines
+          where crc32(machine_id) % N equals its shard index. Each machine is
+          always handled by the same worker, so per-machine ordering holds,
+          but the broker sends every message to all N workers: only the
+          parsing and writing is split, not the MQTT traffic.
+  share - workers use an MQTT shared subscription ($share/<group>/<topic>)
+          and the broker distributes messages. Per-machine ordering then
+          depends on the broker's shared subscription strategy (use a
+          sticky / hash-by-publisher strategy if ordering matters; Mosquitto
+          is round-robin). Each message is delivered once. Opt-in only: the
+          default is hash.
+"""
+import multiprocessing
+import os
+import signal
+import time
+import zlib
+
+COUNTERS = ("messages", "points", "skipped", "errors")
+
+
+def shard_for(machine_id, shard_count):
+    """Deterministic shard index for a machine"""
+    return zlib.crc32(machine_id.encode()) % shard_count
+
+
+def shared_topic(topic, group):
+    """MQTT shared subscription form of a topic filter"""
+    return f"$share/{group}/{topic}"
+
+
+class ShardCounters:
+    """Throughput counters for every shard, in shared memory
+
+    Each worker only increments its own slots, so no lock is needed; the
+    supervisor reads them to report aggregated throughput.
+    """
+
+    def __init__(self, shard_count):
+        self.shard_count = shard_count
+        self._values = multiprocessing.Array("Q", shard_count * len(COUNTERS), lock=False)
+
+    def add(self, shard_index, name, count=1):
+        self._values[shard_index * len(COUNTERS) + COUNTERS.index(name)] += count
+
+    def shard(self, shard_index):
+        base = shard_index * len(COUNTERS)
+        return {name: self._values[base + i] for i, name in enumerate(COUNTERS)}
+
+    def totals(self):
+        totals = dict.fromkeys(COUNTERS, 0)
+        for shard_index in range(self.shard_count):
+            for name, value in self.shard(shard_index).items():
+                totals[name] += value
+        return totals
+
+
+class ShardSupervisor:
+    """Starts the worker processes, restarts dead ones and reports totals"""
+
+    def __init__(self, target, shard_count, counters, report_interval=30.0):
+        self.target = target
+        self.shard_count = shard_count
+        self.counters = counters
+        self.report_interval = report_interval
+        self.processes = [None] * shard_count
+        self.restarts = [0] * shard_count
+
+    def _start(self, shard_index):
+        process = multiprocessing.Process(
+            target=self.target,
+            args=(shard_index, self.shard_count, self.counters),
+            name=f"influxdb-writer-shard-{shard_index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[shard_index] = process
+        print(f"🧩 Started writer shard {shard_index}/{self.shard_count} (PID: {process.pid})")
+
+    def run(self):
+        for shard_index in range(self.shard_count):
+            self._start(shard_index)
+
+        last_totals = self.counters.totals()
+        last_time = time.monotonic()
+        try:
+            while True:
+                time.sleep(min(self.report_interval, 5.0) if self.report_interval > 0 else 5.0)
+                for shard_index, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        print(f"⚠️  Writer shard {shard_index} exited (code {process.exitcode}), restarting...")
+                        self.restarts[shard_index] += 1
+                        self._start(shard_index)
+
+                elapsed = time.monotonic() - last_time
+                if self.report_interval > 0 and elapsed >= self.report_interval:
+                    totals = self.counters.totals()
+                    rates = {name: (totals[name] - last_totals[name]) / elapsed for name in COUNTERS}
+                    per_shard = " ".join(f"{i}:{self.counters.shard(i)['messages']}" for i in range(self.shard_count))
+                    print(f"📊 Shards ({self.shard_count}): {rates['messages']:.1f} msg/s | "
+                          f"{rates['points']:.1f} points/s | {rates['errors']:.1f} errors/s | "
+                          f"messages per shard {per_shard}")
+                    last_totals, last_time = totals, time.monotonic()
+        except KeyboardInterrupt:
+            print("\n🛑 Stopping writer shards...")
+            self.stop()
+
+    def stop(self, timeout=15.0):
+        """Ask every worker to flush and exit, then kill stragglers"""
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is not None:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.terminate()
@@ -0,0 +1,215 @@
+"""
+Write Spool - Durable on-disk spool (write-ahead log) for line protocol
+batches that could not be delivered to InfluxDB
+
+Batches are appended to fixed-size segment files and replayed in order once
+InfluxDB is reachable again. Total disk use is capped by discarding the
+oldest segments. Replaying a segment twice is harmless because InfluxDB
+overwrites points with the same series and timestamp.
+"""
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+SEGMENT_MAGIC = b"LPSPOOL1"
+SEGMENT_SUFFIX = ".seg"
+# Record header: payload length, crc32 of payload, write precision code
+RECORD_HEADER = struct.Struct(">IIB")
+PRECISIONS = ("ns", "us", "ms", "s")
+
+
+def encode_batch(records):
+    """Encode Points, line protocol strings or bytes as one payload"""
+    lines = []
+    for record in records:
+        if isinstance(record, bytes):
+            lines.append(record.rstrip(b"\n"))
+        elif isinstance(record, str):
+            lines.append(record.rstrip("\n").encode())
+        else:
+            lines.append(record.to_line_protocol().encode())
+    return b"\n".join(lines)
+
+
+class Spool:
+    """Segment-based append-only spool of line protocol batches"""
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024,
+                 max_bytes=1024 * 1024 * 1024, fsync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._segments = {}  # segment id -> size in bytes
+        for name in os.listdir(directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                path = os.path.join(directory, name)
+                self._segments[int(name[:-len(SEGMENT_SUFFIX)])] = os.path.getsize(path)
+        self._next_id = max(self._segments, default=0) + 1
+        self._active = None
+        self._active_id = None
+
+        self.spooled_batches = 0
+        self.replayed_batches = 0
+        self.replayed_points = 0
+        self.rejected_batches = 0
+        self.rejected_points = 0
+        self.discarded_segments = 0
+        self.corrupt_records = 0
+
+    @property
+    def pending_bytes(self):
+        return sum(list(self._segments.values()))
+
+    @property
+    def pending_segments(self):
+        return len(self._segments)
+
+    def empty(self):
+        return not self._segments
+
+    def append(self, records, precision="ns"):
+        """Durably append one batch of records"""
+        payload = encode_batch(records)
+        header = RECORD_HEADER.pack(len(payload), zlib.crc32(payload), PRECISIONS.index(precision))
+        with self._lock:
+            if self._active is None or self._segments[self._active_id] >= self.segment_bytes:
+                self._rotate()
+            self._active.write(header)
+            self._active.write(payload)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._segments[self._active_id] += len(header) + len(payload)
+            self.spooled_batches += 1
+            self._enforce_limit()
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f"{segment_id:012d}{SEGMENT_SUFFIX}")
+
+    def _rotate(self):
+        """Close the active segment and start a new one (caller holds the lock)"""
+        self._seal()
+        self._active_id = self._next_id
+        self._next_id += 1
+        self._active = open(self._segment_path(self._active_id), "ab")
+        self._active.write(SEGMENT_MAGIC)
+        self._segments[self._active_id] = len(SEGMENT_MAGIC)
+
+    def _seal(self):
+        if self._active is not None:
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._active.close()
+            self._active = None
+            self._active_id = None
+
+    def _enforce_limit(self):
+        """Discard the oldest segments while over the disk cap (caller holds the lock)"""
+        while self.pending_bytes > self.max_bytes and len(self._segments) > 1:
+            oldest = min(self._segments)
+            if oldest == self._active_id:
+                break
+            self._remove(oldest)
+            self.discarded_segments += 1
+            print(f"⚠️  Spool over {self.max_bytes // (1024 * 1024)} MB, discarded oldest segment {oldest}")
+
+    def _remove(self, segment_id):
+        self._segments.pop(segment_id, None)
+        try:
+            os.remove(self._segment_path(segment_id))
+        except FileNotFoundError:
+            pass
+
+    def read_segment(self, segment_id):
+        """Return the (precision, payload) records of a segment
+
+        Stops at a torn or corrupt record, which is what a crash in the
+        middle of an append leaves behind.
+        """
+        try:
+            with open(self._segment_path(segment_id), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        if not data.startswith(SEGMENT_MAGIC):
+            self.corrupt_records += 1
+            return []
+
+        records = []
+        offset = len(SEGMENT_MAGIC)
+        while offset + RECORD_HEADER.size <= len(data):
+            length, crc, precision = RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            payload = data[offset:offset + length]
+            if len(payload) < length or zlib.crc32(payload) != crc or precision >= len(PRECISIONS):
+                self.corrupt_records += 1
+                break
+            records.append((PRECISIONS[precision], payload))
+            offset += length
+        return records
+
+    def replay(self, write_fn, concurrency=4, retryable=None):
+        """Replay spooled batches in segment order
+
+        write_fn(payload, precision) is called with up to `concurrency`
+        batches in flight. A segment is deleted only once every batch in it
+        was written; the first failure stops the replay and leaves the
+        remaining segments for the next attempt. Returns the number of
+        points replayed.
+
+        retryable(error), if given, decides which failures are worth another
+        attempt: a batch InfluxDB rejected for good (bad line protocol, field
+        type conflict) is counted in rejected_batches / rejected_points and
+        skipped, so it cannot hold back the rest of the spool.
+        """
+        with self._lock:
+            self._seal()
+            segment_ids = sorted(self._segments)
+
+        replayed = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for segment_id in segment_ids:
+                records = self.read_segment(segment_id)
+                futures = [pool.submit(write_fn, payload, precision) for precision, payload in records]
+                points = rejected_batches = rejected_points = 0
+                for (_, payload), future in zip(records, futures):
+                    try:
+                        future.result()
+                        points += payload.count(b"\n") + 1
+                    except Exception as e:
+                        # Raises on the first retryable failure, keeping this segment
+                        if retryable is None or retryable(e):
+                            raise
+                        rejected_batches += 1
+                        rejected_points += payload.count(b"\n") + 1
+                replayed += points
+                with self._lock:
+                    self._remove(segment_id)
+                    self.replayed_batches += len(records) - rejected_batches
+                    self.replayed_points += points
+                    self.rejected_batches += rejected_batches
+                    self.rejected_points += rejected_points
+        return replayed
+
+    def stats(self):
+        return {
+            "pending_segments": self.pending_segments,
+            "pending_bytes": self.pending_bytes,
+            "spooled_batches": self.spooled_batches,
+            "replayed_batches": self.replayed_batches,
+            "replayed_points": self.replayed_points,
+            "rejected_batches": self.rejected_batches,
+            "rejected_points": self.rejected_points,
+            "discarded_segments": self.discarded_segments,
+            "corrupt_records": self.corrupt_records,
+        }
+
+    def close(self):
+        with self._lock:
+            self._seal()
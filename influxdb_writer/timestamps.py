@@ -0,0 +1,159 @@
+"""
+Timestamp Parsing - Fast path from producer ISO 8601 strings to integer epoch
+timestamps at the bucket's write precision
+
+Each producer sends the same timestamp shape every time (mock_plc_agent and
+lathe_sim: "2024-01-01T12:00:00.123456+00:00", edge gateway: naive
+"2024-01-01T12:00:00.123456"). The shape is detected once per producer with
+datetime.fromisoformat and cached; after that only the seconds and fraction
+digits are sliced out: the epoch seconds of the "YYYY-MM-DDTHH:MM:SS" prefix
+come from a small cache shared by all producers using that shape, so the
+fraction is the only number parsed per message. Naive timestamps are
+treated as UTC, as the InfluxDB client does.
+"""
+import calendar
+import time
+from datetime import datetime
+
+PRECISION_SCALE = {"s": 1, "ms": 1_000, "us": 1_000_000, "ns": 1_000_000_000}
+MAX_CACHED_SECONDS = 4096
+
+
+def parse_precision_map(spec):
+    """Parse "bucket=ms,other_bucket=s" into {bucket: precision}"""
+    precisions = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        bucket, _, precision = item.partition("=")
+        precision = precision.strip().lower()
+        if precision not in PRECISION_SCALE:
+            raise ValueError(f"Unsupported write precision '{precision}' for bucket '{bucket}'")
+        precisions[bucket.strip()] = precision
+    return precisions
+
+
+class _Format:
+    """One timestamp shape: total length, fraction digits and UTC offset suffix"""
+
+    def __init__(self, length, fraction_digits, suffix, offset_seconds, fast):
+        self.length = length
+        self.fraction_digits = fraction_digits
+        self.fraction_end = 20 + fraction_digits
+        self.fraction_scale = 10 ** (9 - fraction_digits) if fraction_digits else 0
+        self.suffix = suffix
+        self.offset_seconds = offset_seconds
+        self.fast = fast
+        self.seconds = {}  # "YYYY-MM-DDTHH:MM:SS" -> epoch seconds (UTC)
+        self._minute = None  # Last (prefix, epoch) of "YYYY-MM-DDTHH:MM"
+
+    def epoch_seconds(self, prefix):
+        """Epoch seconds of a "YYYY-MM-DDTHH:MM:SS" prefix (cache miss path)"""
+        if self._minute is None or self._minute[0] != prefix[:16]:
+            minute = calendar.timegm((int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]),
+                                      int(prefix[11:13]), int(prefix[14:16]), 0)) - self.offset_seconds
+            self._minute = (prefix[:16], minute)
+        epoch = self._minute[1] + int(prefix[17:19])
+        if len(self.seconds) >= MAX_CACHED_SECONDS:
+            self.seconds.clear()
+        self.seconds[prefix] = epoch
+        return epoch
+
+
+class TimestampParser:
+    """Producer timestamp -> integer epoch at a given precision, with per-producer format caching"""
+
+    def __init__(self):
+        self._producers = {}  # producer -> _Format
+        self._formats = {}  # (length, fraction digits, suffix) -> shared _Format
+        self.fast_parses = 0
+        self.slow_parses = 0
+        self.invalid = 0
+
+    def parse(self, value, producer=None, precision="ns"):
+        """Return the timestamp as an integer in `precision` units
+
+        Missing or unparseable timestamps fall back to the current time,
+        like the writer always did.
+        """
+        if not value or not isinstance(value, str):
+            return time.time_ns() // (1_000_000_000 // PRECISION_SCALE[precision])
+
+        fmt = self._producers.get(producer)
+        if fmt is None or len(value) != fmt.length or not value.endswith(fmt.suffix):
+            fmt = self._detect(value)
+            if fmt is None:
+                self.invalid += 1
+                return time.time_ns() // (1_000_000_000 // PRECISION_SCALE[precision])
+            self._producers[producer] = fmt
+
+        if fmt.fast:
+            try:
+                seconds = fmt.seconds.get(value[:19])
+                if seconds is None:
+                    seconds = fmt.epoch_seconds(value[:19])
+                if fmt.fraction_digits:
+                    fraction_ns = int(value[20:fmt.fraction_end]) * fmt.fraction_scale
+                else:
+                    fraction_ns = 0
+            except ValueError:
+                return self._parse_slow(value, precision)  # Same shape, unexpected characters
+            self.fast_parses += 1
+            if precision == "ns":
+                return seconds * 1_000_000_000 + fraction_ns
+            return self._scale(seconds, fraction_ns, precision)
+
+        return self._parse_slow(value, precision)
+
+    def _scale(self, seconds, fraction_ns, precision):
+        if precision == "ns":
+            return seconds * 1_000_000_000 + fraction_ns
+        scale = PRECISION_SCALE[precision]
+        return seconds * scale + fraction_ns // (1_000_000_000 // scale)
+
+    def _parse_slow(self, value, precision):
+        try:
+            timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except (ValueError, AttributeError):
+            self.invalid += 1
+            return time.time_ns() // (1_000_000_000 // PRECISION_SCALE[precision])
+        self.slow_parses += 1
+        offset = timestamp.utcoffset()
+        seconds = calendar.timegm(timestamp.replace(tzinfo=None).timetuple())
+        if offset is not None:
+            seconds -= int(offset.total_seconds())
+        return self._scale(seconds, timestamp.microsecond * 1000, precision)
+
+    def _detect(self, value):
+        """Work out the shape of a timestamp string (None if it is not a timestamp)"""
+        try:
+            timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except (ValueError, AttributeError):
+            return None
+
+        fraction_digits = 0
+        if len(value) > 20 and value[19] == '.':
+            while 20 + fraction_digits < len(value) and value[20 + fraction_digits].isdigit():
+                fraction_digits += 1
+        suffix = value[20 + fraction_digits:] if fraction_digits else value[19:]
+        offset = timestamp.utcoffset()
+        offset_seconds = int(offset.total_seconds()) if offset is not None else 0
+
+        # Only the plain "YYYY-MM-DDTHH:MM:SS[.fff][Z|+HH:MM]" layout takes the fast path
+        layout_ok = (len(value) >= 19 and value[4] == '-' and value[7] == '-' and value[10] in 'T '
+                     and value[13] == ':' and value[16] == ':' and fraction_digits <= 9)
+        suffix_ok = suffix in ("", "Z") or (len(suffix) == 6 and suffix[0] in "+-" and suffix[3] == ':')
+        fast = layout_ok and suffix_ok
+
+        key = (len(value), fraction_digits, suffix)
+        fmt = self._formats.get(key)
+        if fmt is None:
+            fmt = self._formats[key] = _Format(len(value), fraction_digits, suffix, offset_seconds, fast)
+        return fmt
+
+    def stats(self):
+        return {
+            "producers": len(self._producers),
+            "formats": len(self._formats),
+            "fast_parses": self.fast_parses,
+            "slow_parses": self.slow_parses,
+            "invalid": self.invalid,
+        }
@@ -25,6 +25,9 @@ MQTT_TLS_CHECK_HOSTNAME = os.getenv("MQTT_TLS_CHECK_HOSTNAME", "false").lower()
 # Agent Configuration
 PUBLISH_INTERVAL = float(os.getenv("LATHE_PUBLISH_INTERVAL", "2.0"))  # seconds (default 2 seconds)
 CLIENT_ID = "lathe_sim"
+# Also publish the per-group sub-topics (alarms) next to the full data topic;
+# false publishes only data (run alarm_monitor with ALARM_SOURCE=data)
+PUBLISH_SUBTOPICS = os.getenv("PUBLISH_SUBTOPICS", "true").lower() == "true"
 
 # Machine ID - identifies which machine this agent represents
 MACHINE_ID = os.getenv("LATHE_MACHINE_ID", "lathe01")
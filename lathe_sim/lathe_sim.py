@@ -18,10 +18,11 @@ import uuid
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from lathe_sim.config import (
     MQTT_BROKER, MQTT_PORT, MQTT_TOPIC_BASE,
-    PUBLISH_INTERVAL, CLIENT_ID,
+    PUBLISH_INTERVAL, CLIENT_ID, PUBLISH_SUBTOPICS,
     MACHINE_ID, MQTT_USERNAME, MQTT_PASSWORD,
     MQTT_TLS_ENABLED, CA_CERT_PATH, MQTT_TLS_CHECK_HOSTNAME
 )
+from common.log import Sampler, Throughput, get_logger
 
 # Store MQTT_BROKER for TLS detection
 _MQTT_BROKER_HOST = MQTT_BROKER
@@ -31,6 +32,11 @@ PRINT_JSON_DATA = os.getenv("PRINT_JSON_DATA", "false").lower() == "true"
 SAVE_JSON_DATA = os.getenv("SAVE_JSON_DATA", "false").lower() == "true"
 JSON_OUTPUT_FILE = os.getenv("JSON_OUTPUT_FILE", f"/tmp/lathe_sim_data_{MACHINE_ID}.json")
 
+# Per-publish lines are sampled (LOG_SAMPLE_EVERY), with a periodic throughput summary
+log = get_logger("lathe_sim")
+sampler = Sampler(log)
+throughput = Throughput(log, f"Lathe Simulator [{MACHINE_ID}]", counters=("messages", "errors"))
+
 # CNC Lathe State
 class LatheState:
     def __init__(self):
@@ -161,6 +167,7 @@ class LatheState:
         return data
 
 # MQTT Client Setup
+client = None
 connected = False
 reconnect_count = 0
 
@@ -169,13 +176,13 @@ def on_connect(client, userdata, flags, rc):
     if rc == 0:
         connected = True
         if reconnect_count > 0:
-            print(f"✅ Reconnected to MQTT broker (reconnect #{reconnect_count})")
+            log.info("✅ Reconnected to MQTT broker (reconnect #%s)", reconnect_count)
             reconnect_count = 0
         else:
-            print(f"✅ Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
+            log.info("✅ Connected to MQTT broker at %s:%s", MQTT_BROKER, MQTT_PORT)
     else:
         connected = False
-        print(f"❌ Failed to connect, return code {rc}")
+        log.error("❌ Failed to connect, return code %s", rc)
 
 def on_publish(client, userdata, mid):
     # Suppress verbose publish messages
@@ -186,55 +193,59 @@ def on_disconnect(client, userdata, rc):
     connected = False
     if rc != 0:
         reconnect_count += 1
-        print(f"⚠️  Unexpected disconnection (rc={rc}). Reconnecting...")
+        log.warning("⚠️  Unexpected disconnection (rc=%s). Reconnecting...", rc)
     else:
-        print("ℹ️  Disconnected from broker")
+        log.info("ℹ️  Disconnected from broker")
 
 def on_log(client, userdata, level, buf):
     # Only log warnings and errors
     if level <= mqtt.MQTT_LOG_WARNING:
-        print(f"MQTT Log: {buf}")
-
-# Initialize MQTT client with unique client ID to avoid conflicts
-client = mqtt.Client(client_id=f"{CLIENT_ID}_{MACHINE_ID}_{uuid.uuid4().hex[:8]}", clean_session=True)
-client.on_connect = on_connect
-client.on_publish = on_publish
-client.on_disconnect = on_disconnect
-client.on_log = on_log
-
-# Enable automatic reconnection
-client.reconnect_delay_set(min_delay=1, max_delay=120)
-
-# Set username and password
-if MQTT_USERNAME and MQTT_PASSWORD:
-    client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
-    print(f"   🔑 Using authentication: {MQTT_USERNAME}")
-
-# Configure TLS if enabled
-if MQTT_TLS_ENABLED:
-    print(f"🔐 Configuring TLS connection...")
-    # Check if connecting to cloud broker (HiveMQ Cloud, etc.)
-    is_cloud_broker = "hivemq.cloud" in _MQTT_BROKER_HOST.lower() or "cloud" in _MQTT_BROKER_HOST.lower()
-    
-    if CA_CERT_PATH and os.path.exists(CA_CERT_PATH) and not is_cloud_broker:
-        # Use CA cert for local/self-hosted brokers
-        client.tls_set(
-            ca_certs=CA_CERT_PATH,
-            cert_reqs=ssl.CERT_REQUIRED,
-            tls_version=ssl.PROTOCOL_TLSv1_2
-        )
-        if not MQTT_TLS_CHECK_HOSTNAME:
-            client.tls_insecure_set(True)
-            print(f"   ⚠️  Hostname verification disabled (for testing only)")
-        print(f"   ✅ TLS configured with CA cert: {CA_CERT_PATH}")
-    else:
-        # For cloud brokers, disable certificate verification
-        if is_cloud_broker:
-            print(f"   ℹ️  Cloud MQTT broker detected, disabling certificate verification")
+        log.warning("MQTT Log: %s", buf)
+
+def create_client():
+    """Create and configure the MQTT client for this simulator"""
+    global client
+    # Initialize MQTT client with unique client ID to avoid conflicts
+    client = mqtt.Client(client_id=f"{CLIENT_ID}_{MACHINE_ID}_{uuid.uuid4().hex[:8]}", clean_session=True)
+    client.on_connect = on_connect
+    client.on_publish = on_publish
+    client.on_disconnect = on_disconnect
+    client.on_log = on_log
+
+    # Enable automatic reconnection
+    client.reconnect_delay_set(min_delay=1, max_delay=120)
+
+    # Set username and password
+    if MQTT_USERNAME and MQTT_PASSWORD:
+        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        print(f"   🔑 Using authentication: {MQTT_USERNAME}")
+
+    # Configure TLS if enabled
+    if MQTT_TLS_ENABLED:
+        print(f"🔐 Configuring TLS connection...")
+        # Check if connecting to cloud broker (HiveMQ Cloud, etc.)
+        is_cloud_broker = "hivemq.cloud" in _MQTT_BROKER_HOST.lower() or "cloud" in _MQTT_BROKER_HOST.lower()
+
+        if CA_CERT_PATH and os.path.exists(CA_CERT_PATH) and not is_cloud_broker:
+            # Use CA cert for local/self-hosted brokers
+            client.tls_set(
+                ca_certs=CA_CERT_PATH,
+                cert_reqs=ssl.CERT_REQUIRED,
+                tls_version=ssl.PROTOCOL_TLSv1_2
+            )
+            if not MQTT_TLS_CHECK_HOSTNAME:
+                client.tls_insecure_set(True)
+                print(f"   ⚠️  Hostname verification disabled (for testing only)")
+            print(f"   ✅ TLS configured with CA cert: {CA_CERT_PATH}")
         else:
-            print(f"   ⚠️  CA cert not found, running without TLS verification (for cloud MQTT)")
-        client.tls_set(cert_reqs=ssl.CERT_NONE)
-        client.tls_insecure_set(True)  # Disable certificate verification for cloud brokers
+            # For cloud brokers, disable certificate verification
+            if is_cloud_broker:
+                print(f"   ℹ️  Cloud MQTT broker detected, disabling certificate verification")
+            else:
+                print(f"   ⚠️  CA cert not found, running without TLS verification (for cloud MQTT)")
+            client.tls_set(cert_reqs=ssl.CERT_NONE)
+            client.tls_insecure_set(True)  # Disable certificate verification for cloud brokers
+    return client
 
 # Connect to broker
 def connect_broker():
@@ -255,99 +266,118 @@ def connect_broker():
         print(f"   Make sure the MQTT broker is running at {MQTT_BROKER}:{MQTT_PORT}")
         exit(1)
 
-connect_broker()
+def main():
+    global client, connected
 
-# Initialize lathe state
-lathe = LatheState()
+    client = create_client()
+    connect_broker()
 
-print("🚀 CNC Lathe Simulator started. Publishing data every {} seconds...".format(PUBLISH_INTERVAL))
-print(f"🏭 Machine ID: {MACHINE_ID}")
-print(f"📡 Topic: plc/{MACHINE_ID}/lathe/data")
-print("Press Ctrl+C to stop\n")
+    # Initialize lathe state
+    lathe = LatheState()
 
-try:
-    while True:
-        # Check connection status before publishing
-        if not connected:
-            print("⏳ Waiting for connection...")
-            time.sleep(1)
-            continue
-        
-        # Generate mock data
-        data = lathe.generate_mock_data()
-        
-        try:
-            # Publish full dataset with machine_id in topic
-            topic_full = f"plc/{MACHINE_ID}/lathe/data"
-            payload = json.dumps(data, indent=2)
-            result = client.publish(topic_full, payload, qos=1, retain=False)
-            
-            # Publish alarms separately (for alarm monitor WebSocket)
-            client.publish(f"plc/{MACHINE_ID}/lathe/alarms", json.dumps(data["alarms"]), qos=1)
-            
-            # Print detailed status with key metrics
-            print(f"📤 [{MACHINE_ID}] Published to MQTT:")
-            print(f"   ⏰ Time: {data['timestamp']}")
-            print(f"   🔒 Safety: Door={data['safety']['door_closed']} | EStop={data['safety']['estop_ok']}")
-            print(f"   ⚙️  Spindle: Speed={data['spindle']['speed_actual']:.1f} RPM | Load={data['spindle']['load_percent']:.1f}%")
-            print(f"   📍 Axis X: {data['axis_x']['position']:.2f} mm | Axis Z: {data['axis_z']['position']:.2f} mm")
-            print(f"   📊 Production: Cycle={data['production']['cycle_time_seconds']:.1f}s | Parts={data['production']['parts_completed']} | Rate={data['production']['parts_per_hour']:.1f}/hr")
-            print(f"   🔧 Status: Running={data['status']['system_running']} | Machining={data['status']['machining']} | Fault={data['status']['fault']}")
-            print(f"   ⚠️  Alarms: SpindleOverload={data['alarms']['spindle_overload']} | ChuckNotClamped={data['alarms']['chuck_not_clamped']}")
-            print(f"   📡 Topic: {topic_full}")
-            
-            # Print full JSON if enabled
-            if PRINT_JSON_DATA:
-                print(f"\n📄 Full JSON Data:")
-                print("=" * 60)
-                print(payload)
-                print("=" * 60)
-            
-            # Save to JSON file if enabled
-            if SAVE_JSON_DATA:
-                try:
-                    # Read existing data if file exists
-                    json_data = []
-                    if os.path.exists(JSON_OUTPUT_FILE):
-                        try:
-                            with open(JSON_OUTPUT_FILE, 'r') as f:
-                                json_data = json.load(f)
-                                if not isinstance(json_data, list):
-                                    json_data = [json_data]
-                        except (json.JSONDecodeError, ValueError):
-                            json_data = []
-                    
-                    # Append new data with timestamp
-                    json_data.append({
-                        "timestamp": data['timestamp'],
-                        "machine_id": MACHINE_ID,
-                        "topic": topic_full,
-                        "data": data
-                    })
-                    
-                    # Write back to file
-                    with open(JSON_OUTPUT_FILE, 'w') as f:
-                        json.dump(json_data, f, indent=2)
-                    
-                    print(f"💾 Saved to: {JSON_OUTPUT_FILE} ({len(json_data)} entries)")
-                except Exception as e:
-                    print(f"⚠️  Error saving JSON: {e}")
-            
-            print()
-        except Exception as e:
-            print(f"⚠️  Error publishing: {e}")
-            connected = False
-        
-        time.sleep(PUBLISH_INTERVAL)
-        
-except KeyboardInterrupt:
-    print("\n🛑 Stopping lathe simulator...")
-    client.loop_stop()
-    client.disconnect()
-    print("✅ Lathe simulator stopped")
-except Exception as e:
-    print(f"\n❌ Error: {e}")
-    client.loop_stop()
-    client.disconnect()
-    exit(1)
+    print("🚀 CNC Lathe Simulator started. Publishing data every {} seconds...".format(PUBLISH_INTERVAL))
+    print(f"🏭 Machine ID: {MACHINE_ID}")
+    print(f"📡 Topic: plc/{MACHINE_ID}/lathe/data")
+    print("Press Ctrl+C to stop\n")
+    throughput.start()
+
+    try:
+        while True:
+            # Check connection status before publishing
+            if not connected:
+                log.info("⏳ Waiting for connection...")
+                time.sleep(1)
+                continue
+
+            # Generate mock data
+            data = lathe.generate_mock_data()
+
+            try:
+                # Publish full dataset with machine_id in topic
+                topic_full = f"plc/{MACHINE_ID}/lathe/data"
+                payload = json.dumps(data, indent=2)
+                result = client.publish(topic_full, payload, qos=1, retain=False)
+
+                # Publish alarms separately (for alarm monitor WebSocket, unless it reads the data topic)
+                if PUBLISH_SUBTOPICS:
+                    client.publish(f"plc/{MACHINE_ID}/lathe/alarms", json.dumps(data["alarms"]), qos=1)
+
+                throughput.add("messages")
+
+                # Sampled status with key metrics (every publish at LOG_LEVEL=DEBUG)
+                if sampler.enabled("published"):
+                    log.info("📤 [%s] Published to MQTT:\n"
+                             "   ⏰ Time: %s\n"
+                             "   🔒 Safety: Door=%s | EStop=%s\n"
+                             "   ⚙️  Spindle: Speed=%.1f RPM | Load=%.1f%%\n"
+                             "   📍 Axis X: %.2f mm | Axis Z: %.2f mm\n"
+                             "   📊 Production: Cycle=%.1fs | Parts=%s | Rate=%.1f/hr\n"
+                             "   🔧 Status: Running=%s | Machining=%s | Fault=%s\n"
+                             "   ⚠️  Alarms: SpindleOverload=%s | ChuckNotClamped=%s\n"
+                             "   📡 Topic: %s",
+                             MACHINE_ID, data['timestamp'],
+                             data['safety']['door_closed'], data['safety']['estop_ok'],
+                             data['spindle']['speed_actual'], data['spindle']['load_percent'],
+                             data['axis_x']['position'], data['axis_z']['position'],
+                             data['production']['cycle_time_seconds'], data['production']['parts_completed'],
+                             data['production']['parts_per_hour'],
+                             data['status']['system_running'], data['status']['machining'], data['status']['fault'],
+                             data['alarms']['spindle_overload'], data['alarms']['chuck_not_clamped'],
+                             topic_full)
+
+                # Print full JSON if enabled
+                if PRINT_JSON_DATA:
+                    print(f"\n📄 Full JSON Data:")
+                    print("=" * 60)
+                    print(payload)
+                    print("=" * 60)
+
+                # Save to JSON file if enabled
+                if SAVE_JSON_DATA:
+                    try:
+                        # Read existing data if file exists
+                        json_data = []
+                        if os.path.exists(JSON_OUTPUT_FILE):
+                            try:
+                                with open(JSON_OUTPUT_FILE, 'r') as f:
+                                    json_data = json.load(f)
+                                    if not isinstance(json_data, list):
+                                        json_data = [json_data]
+                            except (json.JSONDecodeError, ValueError):
+                                json_data = []
+
+                        # Append new data with timestamp
+                        json_data.append({
+                            "timestamp": data['timestamp'],
+                            "machine_id": MACHINE_ID,
+                            "topic": topic_full,
+                            "data": data
+                        })
+
+                        # Write back to file
+                        with open(JSON_OUTPUT_FILE, 'w') as f:
+                            json.dump(json_data, f, indent=2)
+
+                        print(f"💾 Saved to: {JSON_OUTPUT_FILE} ({len(json_data)} entries)")
+                    except Exception as e:
+                        print(f"⚠️  Error saving JSON: {e}")
+            except Exception as e:
+                throughput.add("errors")
+                log.warning("⚠️  Error publishing: %s", e)
+                connected = False
+
+            time.sleep(PUBLISH_INTERVAL)
+
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping lathe simulator...")
+        client.loop_stop()
+        client.disconnect()
+        print("✅ Lathe simulator stopped")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        client.loop_stop()
+        client.disconnect()
+        exit(1)
 
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,9 @@ MQTT_TOPIC_BASE = "plc/bottlefiller"
 # Agent Configuration
 PUBLISH_INTERVAL = float(os.getenv("PUBLISH_INTERVAL", "2.0"))  # seconds
 CLIENT_ID = "mock_plc_agent"
+# Also publish the per-group sub-topics (inputs, outputs, analog, status, counters, alarms) next to the full data topic;
+# false publishes only data (run alarm_monitor with ALARM_SOURCE=data)
+PUBLISH_SUBTOPICS = os.getenv("PUBLISH_SUBTOPICS", "true").lower() == "true"
 
 # Bottle Filler Configuration
 FILL_TARGET_DEFAULT = 500.0  # mL
@@ -17,10 +17,11 @@ import uuid
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from mock_plc_agent.config import (
     MQTT_BROKER, MQTT_PORT, MQTT_TOPIC_BASE,
-    PUBLISH_INTERVAL, CLIENT_ID,
+    PUBLISH_INTERVAL, CLIENT_ID, PUBLISH_SUBTOPICS,
     FILL_TARGET_DEFAULT, FILL_TIME_DEFAULT, FILL_SPEED_DEFAULT,
     CONVEYOR_SPEED_DEFAULT, TOLERANCE_DEFAULT
 )
+from common.log import Sampler, Throughput, get_logger
 
 # Store MQTT_BROKER for TLS detection
 _MQTT_BROKER_HOST = MQTT_BROKER
@@ -33,6 +34,11 @@ PRINT_JSON_DATA = os.getenv("PRINT_JSON_DATA", "false").lower() == "true"
 SAVE_JSON_DATA = os.getenv("SAVE_JSON_DATA", "false").lower() == "true"
 JSON_OUTPUT_FILE = os.getenv("JSON_OUTPUT_FILE", f"/tmp/mock_plc_data_{MACHINE_ID}.json")
 
+# Per-publish lines are sampled (LOG_SAMPLE_EVERY), with a periodic throughput summary
+log = get_logger("mock_plc_agent")
+sampler = Sampler(log)
+throughput = Throughput(log, f"Mock PLC Agent [{MACHINE_ID}]", counters=("messages", "errors"))
+
 # Bottle Filler Tag States
 class BottleFillerTags:
     def __init__(self):
@@ -114,6 +120,7 @@ class BottleFillerTags:
         return data
 
 # MQTT Client Setup
+client = None
 connected = False
 reconnect_count = 0
 
@@ -122,13 +129,13 @@ def on_connect(client, userdata, flags, rc):
     if rc == 0:
         connected = True
         if reconnect_count > 0:
-            print(f"✅ Reconnected to MQTT broker (reconnect #{reconnect_count})")
+            log.info("✅ Reconnected to MQTT broker (reconnect #%s)", reconnect_count)
             reconnect_count = 0
         else:
-            print(f"✅ Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
+            log.info("✅ Connected to MQTT broker at %s:%s", MQTT_BROKER, MQTT_PORT)
     else:
         connected = False
-        print(f"❌ Failed to connect, return code {rc}")
+        log.error("❌ Failed to connect, return code %s", rc)
 
 def on_publish(client, userdata, mid):
     # Suppress verbose publish messages - only show errors
@@ -139,26 +146,16 @@ def on_disconnect(client, userdata, rc):
     connected = False
     if rc != 0:
         reconnect_count += 1
-        print(f"⚠️  Unexpected disconnection (rc={rc}). Reconnecting...")
+        log.warning("⚠️  Unexpected disconnection (rc=%s). Reconnecting...", rc)
     else:
-        print("ℹ️  Disconnected from broker")
+        log.info("ℹ️  Disconnected from broker")
 
 def on_log(client, userdata, level, buf):
     # Only log warnings and errors
     if level <= mqtt.MQTT_LOG_WARNING:
-        print(f"MQTT Log: {buf}")
-
-# Initialize MQTT client with unique client ID to avoid conflicts
-client = mqtt.Client(client_id=f"{CLIENT_ID}_{MACHINE_ID}_{uuid.uuid4().hex[:8]}", clean_session=True)
-client.on_connect = on_connect
-client.on_publish = on_publish
-client.on_disconnect = on_disconnect
-client.on_log = on_log
-
-# Enable automatic reconnection
-client.reconnect_delay_set(min_delay=1, max_delay=120)
+        log.warning("MQTT Log: %s", buf)
 
-# Configure TLS if enabled
+# MQTT authentication and TLS options
 MQTT_TLS_ENABLED = os.getenv("MQTT_TLS_ENABLED", "false").lower() == "true"
 MQTT_USERNAME = os.getenv("MQTT_USERNAME", None)
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", None)
@@ -166,36 +163,50 @@ CA_CERT_PATH = os.getenv("CA_CERT_PATH", None)
 CLIENT_CERT_PATH = os.getenv("CLIENT_CERT_PATH", None)
 CLIENT_KEY_PATH = os.getenv("CLIENT_KEY_PATH", None)
 
-if MQTT_USERNAME and MQTT_PASSWORD:
-    client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
-
-if MQTT_TLS_ENABLED:
-    print(f"🔐 Configuring TLS connection...")
-    # Check if connecting to cloud broker (HiveMQ Cloud, etc.)
-    is_cloud_broker = "hivemq.cloud" in _MQTT_BROKER_HOST.lower() or "cloud" in _MQTT_BROKER_HOST.lower()
-    
-    if CA_CERT_PATH and os.path.exists(CA_CERT_PATH) and not is_cloud_broker:
-        # Use CA cert for local/self-hosted brokers
-        client.tls_set(
-            ca_certs=CA_CERT_PATH,
-            certfile=CLIENT_CERT_PATH if CLIENT_CERT_PATH and os.path.exists(CLIENT_CERT_PATH) else None,
-            keyfile=CLIENT_KEY_PATH if CLIENT_KEY_PATH and os.path.exists(CLIENT_KEY_PATH) else None,
-            cert_reqs=ssl.CERT_REQUIRED,
-            tls_version=ssl.PROTOCOL_TLSv1_2
-        )
-        check_hostname = os.getenv("MQTT_TLS_CHECK_HOSTNAME", "true").lower() == "true"
-        if not check_hostname:
-            client.tls_insecure_set(True)
-            print(f"   ⚠️  Hostname verification disabled (for testing only)")
-        print(f"   ✅ TLS configured with CA cert: {CA_CERT_PATH}")
-    else:
-        # For cloud brokers, disable certificate verification
-        if is_cloud_broker:
-            print(f"   ℹ️  Cloud MQTT broker detected, disabling certificate verification")
+def create_client():
+    """Create and configure the MQTT client for this agent"""
+    global client
+    # Initialize MQTT client with unique client ID to avoid conflicts
+    client = mqtt.Client(client_id=f"{CLIENT_ID}_{MACHINE_ID}_{uuid.uuid4().hex[:8]}", clean_session=True)
+    client.on_connect = on_connect
+    client.on_publish = on_publish
+    client.on_disconnect = on_disconnect
+    client.on_log = on_log
+
+    # Enable automatic reconnection
+    client.reconnect_delay_set(min_delay=1, max_delay=120)
+
+    if MQTT_USERNAME and MQTT_PASSWORD:
+        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+
+    if MQTT_TLS_ENABLED:
+        print(f"🔐 Configuring TLS connection...")
+        # Check if connecting to cloud broker (HiveMQ Cloud, etc.)
+        is_cloud_broker = "hivemq.cloud" in _MQTT_BROKER_HOST.lower() or "cloud" in _MQTT_BROKER_HOST.lower()
+
+        if CA_CERT_PATH and os.path.exists(CA_CERT_PATH) and not is_cloud_broker:
+            # Use CA cert for local/self-hosted brokers
+            client.tls_set(
+                ca_certs=CA_CERT_PATH,
+                certfile=CLIENT_CERT_PATH if CLIENT_CERT_PATH and os.path.exists(CLIENT_CERT_PATH) else None,
+                keyfile=CLIENT_KEY_PATH if CLIENT_KEY_PATH and os.path.exists(CLIENT_KEY_PATH) else None,
+                cert_reqs=ssl.CERT_REQUIRED,
+                tls_version=ssl.PROTOCOL_TLSv1_2
+            )
+            check_hostname = os.getenv("MQTT_TLS_CHECK_HOSTNAME", "true").lower() == "true"
+            if not check_hostname:
+                client.tls_insecure_set(True)
+                print(f"   ⚠️  Hostname verification disabled (for testing only)")
+            print(f"   ✅ TLS configured with CA cert: {CA_CERT_PATH}")
         else:
-            print(f"   ⚠️  CA cert not found, running without TLS verification (for cloud MQTT)")
-        client.tls_set(cert_reqs=ssl.CERT_NONE)
-        client.tls_insecure_set(True)  # Disable certificate verification for cloud brokers
+            # For cloud brokers, disable certificate verification
+            if is_cloud_broker:
+                print(f"   ℹ️  Cloud MQTT broker detected, disabling certificate verification")
+            else:
+                print(f"   ⚠️  CA cert not found, running without TLS verification (for cloud MQTT)")
+            client.tls_set(cert_reqs=ssl.CERT_NONE)
+            client.tls_insecure_set(True)  # Disable certificate verification for cloud brokers
+    return client
 
 # Connect to broker
 def connect_broker():
@@ -216,108 +227,119 @@ def connect_broker():
         print(f"   Make sure the MQTT broker is running at {MQTT_BROKER}:{MQTT_PORT}")
         exit(1)
 
-connect_broker()
+def main():
+    global client, connected
 
-# Initialize tag generator
-tags = BottleFillerTags()
-tags.system_running = True
+    client = create_client()
+    connect_broker()
 
-print("🚀 Mock PLC Agent started. Publishing data every {} seconds...".format(PUBLISH_INTERVAL))
-print(f"🏭 Machine ID: {MACHINE_ID}")
-print(f"📡 Topic: plc/{MACHINE_ID}/bottlefiller/#")
-print("Press Ctrl+C to stop\n")
+    # Initialize tag generator
+    tags = BottleFillerTags()
+    tags.system_running = True
 
-try:
-    while True:
-        # Check connection status before publishing
-        if not connected:
-            print("⏳ Waiting for connection...")
-            time.sleep(1)
-            continue
-        
-        # Generate mock data
-        data = tags.generate_mock_data()
-        
-        try:
-            # Publish full dataset with machine_id in topic
-            topic_full = f"plc/{MACHINE_ID}/bottlefiller/data"
-            payload = json.dumps(data, indent=2)
-            result = client.publish(topic_full, payload, qos=1, retain=False)
-            
-            # Publish individual tag groups (for selective subscriptions)
-            client.publish(f"plc/{MACHINE_ID}/bottlefiller/inputs", json.dumps(data["inputs"]), qos=1)
-            client.publish(f"plc/{MACHINE_ID}/bottlefiller/outputs", json.dumps(data["outputs"]), qos=1)
-            client.publish(f"plc/{MACHINE_ID}/bottlefiller/analog", json.dumps(data["analog"]), qos=1)
-            client.publish(f"plc/{MACHINE_ID}/bottlefiller/status", json.dumps(data["status"]), qos=1)
-            client.publish(f"plc/{MACHINE_ID}/bottlefiller/counters", json.dumps(data["counters"]), qos=1)
-            client.publish(f"plc/{MACHINE_ID}/bottlefiller/alarms", json.dumps(data["alarms"]), qos=1)
-            
-            # Print detailed status with key metrics
-            print(f"📤 [{MACHINE_ID}] Published to MQTT:")
-            print(f"   ⏰ Time: {data['timestamp']}")
-            print(f"   📊 Production: {data['counters']['BottlesFilled']} bottles | "
-                  f"{data['counters']['BottlesPerMinute']:.1f} bottles/min | "
-                  f"{data['counters']['BottlesRejected']} rejected")
-            print(f"   🔧 Status: Running={data['status']['SystemRunning']} | "
-                  f"Filling={data['status']['Filling']} | "
-                  f"Fault={data['status']['Fault']}")
-            print(f"   📈 Levels: Fill={data['analog']['FillLevel']:.1f}% | "
-                  f"Temp={data['analog']['TankTemperature']:.1f}°C | "
-                  f"Pressure={data['analog']['TankPressure']:.1f} PSI")
-            print(f"   📡 Topic: {topic_full}")
-            
-            # Print full JSON if enabled
-            if PRINT_JSON_DATA:
-                print(f"\n📄 Full JSON Data:")
-                print("=" * 60)
-                print(payload)
-                print("=" * 60)
-            
-            # Save to JSON file if enabled
-            if SAVE_JSON_DATA:
-                try:
-                    # Read existing data if file exists
-                    json_data = []
-                    if os.path.exists(JSON_OUTPUT_FILE):
-                        try:
-                            with open(JSON_OUTPUT_FILE, 'r') as f:
-                                json_data = json.load(f)
-                                if not isinstance(json_data, list):
-                                    json_data = [json_data]
-                        except (json.JSONDecodeError, ValueError):
-                            json_data = []
-                    
-                    # Append new data with timestamp
-                    json_data.append({
-                        "timestamp": data['timestamp'],
-                        "machine_id": MACHINE_ID,
-                        "topic": topic_full,
-                        "data": data
-                    })
-                    
-                    # Write back to file
-                    with open(JSON_OUTPUT_FILE, 'w') as f:
-                        json.dump(json_data, f, indent=2)
-                    
-                    print(f"💾 Saved to: {JSON_OUTPUT_FILE} ({len(json_data)} entries)")
-                except Exception as e:
-                    print(f"⚠️  Error saving JSON: {e}")
-            
-            print()
-        except Exception as e:
-            print(f"⚠️  Error publishing: {e}")
-            connected = False
-        
-        time.sleep(PUBLISH_INTERVAL)
-        
-except KeyboardInterrupt:
-    print("\n🛑 Stopping agent...")
-    client.loop_stop()
-    client.disconnect()
-    print("✅ Agent stopped")
-except Exception as e:
-    print(f"\n❌ Error: {e}")
-    client.loop_stop()
-    client.disconnect()
-    exit(1)
+    print("🚀 Mock PLC Agent started. Publishing data every {} seconds...".format(PUBLISH_INTERVAL))
+    print(f"🏭 Machine ID: {MACHINE_ID}")
+    print(f"📡 Topic: plc/{MACHINE_ID}/bottlefiller/" + ("#" if PUBLISH_SUBTOPICS else "data"))
+    print("Press Ctrl+C to stop\n")
+    throughput.start()
+
+    try:
+        while True:
+            # Check connection status before publishing
+            if not connected:
+                log.info("⏳ Waiting for connection...")
+                time.sleep(1)
+                continue
+
+            # Generate mock data
+            data = tags.generate_mock_data()
+
+            try:
+                # Publish full dataset with machine_id in topic
+                topic_full = f"plc/{MACHINE_ID}/bottlefiller/data"
+                payload = json.dumps(data, indent=2)
+                result = client.publish(topic_full, payload, qos=1, retain=False)
+
+                # Publish individual tag groups (for selective subscriptions)
+                if PUBLISH_SUBTOPICS:
+                    client.publish(f"plc/{MACHINE_ID}/bottlefiller/inputs", json.dumps(data["inputs"]), qos=1)
+                    client.publish(f"plc/{MACHINE_ID}/bottlefiller/outputs", json.dumps(data["outputs"]), qos=1)
+                    client.publish(f"plc/{MACHINE_ID}/bottlefiller/analog", json.dumps(data["analog"]), qos=1)
+                    client.publish(f"plc/{MACHINE_ID}/bottlefiller/status", json.dumps(data["status"]), qos=1)
+                    client.publish(f"plc/{MACHINE_ID}/bottlefiller/counters", json.dumps(data["counters"]), qos=1)
+                    client.publish(f"plc/{MACHINE_ID}/bottlefiller/alarms", json.dumps(data["alarms"]), qos=1)
+
+                throughput.add("messages")
+
+                # Sampled status with key metrics (every publish at LOG_LEVEL=DEBUG)
+                if sampler.enabled("published"):
+                    log.info("📤 [%s] Published to MQTT:\n"
+                             "   ⏰ Time: %s\n"
+                             "   📊 Production: %s bottles | %.1f bottles/min | %s rejected\n"
+                             "   🔧 Status: Running=%s | Filling=%s | Fault=%s\n"
+                             "   📈 Levels: Fill=%.1f%% | Temp=%.1f°C | Pressure=%.1f PSI\n"
+                             "   📡 Topic: %s",
+                             MACHINE_ID, data['timestamp'],
+                             data['counters']['BottlesFilled'], data['counters']['BottlesPerMinute'],
+                             data['counters']['BottlesRejected'],
+                             data['status']['SystemRunning'], data['status']['Filling'], data['status']['Fault'],
+                             data['analog']['FillLevel'], data['analog']['TankTemperature'],
+                             data['analog']['TankPressure'],
+                             topic_full)
+
+                # Print full JSON if enabled
+                if PRINT_JSON_DATA:
+                    print(f"\n📄 Full JSON Data:")
+                    print("=" * 60)
+                    print(payload)
+                    print("=" * 60)
+
+                # Save to JSON file if enabled
+                if SAVE_JSON_DATA:
+                    try:
+                        # Read existing data if file exists
+                        json_data = []
+                        if os.path.exists(JSON_OUTPUT_FILE):
+                            try:
+                                with open(JSON_OUTPUT_FILE, 'r') as f:
+                                    json_data = json.load(f)
+                                    if not isinstance(json_data, list):
+                                        json_data = [json_data]
+                            except (json.JSONDecodeError, ValueError):
+                                json_data = []
+
+                        # Append new data with timestamp
+                        json_data.append({
+                            "timestamp": data['timestamp'],
+                            "machine_id": MACHINE_ID,
+                            "topic": topic_full,
+                            "data": data
+                        })
+
+                        # Write back to file
+                        with open(JSON_OUTPUT_FILE, 'w') as f:
+                            json.dump(json_data, f, indent=2)
+
+                        print(f"💾 Saved to: {JSON_OUTPUT_FILE} ({len(json_data)} entries)")
+                    except Exception as e:
+                        print(f"⚠️  Error saving JSON: {e}")
+            except Exception as e:
+                throughput.add("errors")
+                log.warning("⚠️  Error publishing: %s", e)
+                connected = False
+
+            time.sleep(PUBLISH_INTERVAL)
+
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping agent...")
+        client.loop_stop()
+        client.disconnect()
+        print("✅ Agent stopped")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        client.loop_stop()
+        client.disconnect()
+        exit(1)
 
+if __name__ == "__main__":
+    main()
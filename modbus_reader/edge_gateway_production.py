@@ -7,6 +7,7 @@ Supports multiple machines via MACHINE_ID environment variable
 from pymodbus.client import ModbusTcpClient
 import paho.mqtt.client as mqtt
 import json
+import logging
 import time
 import sys
 import os
@@ -15,6 +16,8 @@ from datetime import datetime
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.log import Sampler, Throughput, get_logger
+from common.metrics import Registry, start_server
 
 # Production Configuration
 # These should be set via environment variables or config file
@@ -39,6 +42,22 @@ CLIENT_KEY_PATH = os.getenv("CLIENT_KEY_PATH", "mosquitto/config/certs/client.ke
 
 POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "1.0"))
 
+# Prometheus metrics on http://<host>:<port>/metrics (0 disables)
+METRICS_PORT = int(os.getenv("GATEWAY_METRICS_PORT", "9110"))
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+
+# Per-poll lines are sampled (LOG_SAMPLE_EVERY), with a periodic throughput summary
+log = get_logger("edge_gateway")
+sampler = Sampler(log)
+throughput = Throughput(log, f"Edge Gateway [{MACHINE_ID}]", counters=("messages", "errors"))
+
+metrics = Registry(service="edge_gateway", machine_id=MACHINE_ID)
+published = metrics.counter("edge_gateway_messages_published_total", "Payloads published to MQTT")
+poll_errors = metrics.counter("edge_gateway_errors_total", "Failed polls", ("stage",))
+read_latency = metrics.histogram("edge_gateway_modbus_read_seconds", "Modbus holding register read latency")
+mqtt_reconnects = metrics.counter("edge_gateway_mqtt_reconnects_total", "Unexpected MQTT disconnections")
+metrics.gauge("edge_gateway_mqtt_connected", "1 while connected to the MQTT broker").set_function(lambda: int(connected))
+
 # Modbus register addresses
 REG_BOTTLE_COUNT = 0
 REG_FILLER_SPEED_HIGH = 1
@@ -54,20 +73,21 @@ def on_connect(client, userdata, flags, rc):
     if rc == 0:
         connected = True
         if reconnect_count > 0:
-            print(f"✅ Reconnected to MQTT broker (reconnect #{reconnect_count})")
+            log.info("✅ Reconnected to MQTT broker (reconnect #%s)", reconnect_count)
             reconnect_count = 0
         else:
-            print(f"✅ Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
+            log.info("✅ Connected to MQTT broker at %s:%s", MQTT_BROKER, MQTT_PORT)
     else:
         connected = False
-        print(f"❌ Failed to connect to MQTT broker, return code {rc}")
+        log.error("❌ Failed to connect to MQTT broker, return code %s", rc)
 
 def on_disconnect(client, userdata, rc):
     global connected, reconnect_count
     connected = False
     if rc != 0:
         reconnect_count += 1
-        print(f"⚠️  Unexpected MQTT disconnection (rc={rc}). Reconnecting...")
+        mqtt_reconnects.inc()
+        log.warning("⚠️  Unexpected MQTT disconnection (rc=%s). Reconnecting...", rc)
 
 def on_publish(client, userdata, mid):
     # Suppress verbose publish messages
@@ -144,20 +164,31 @@ print(f"🏭 Machine ID: {MACHINE_ID}")
 print(f"📡 Publishing to MQTT topic: {MQTT_TOPIC}")
 print(f"⏱️  Polling interval: {POLL_INTERVAL} seconds")
 print("Press Ctrl+C to stop\n")
+throughput.start()
+if METRICS_PORT:
+    try:
+        start_server(metrics, METRICS_PORT, METRICS_HOST)
+        print(f"📈 Metrics: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    except OSError as e:
+        print(f"⚠️  Metrics endpoint on port {METRICS_PORT} unavailable: {e}")
 
 try:
     while True:
         if not connected:
-            print("⏳ Waiting for MQTT connection...")
+            log.info("⏳ Waiting for MQTT connection...")
             time.sleep(1)
             continue
 
         try:
             # Read Modbus holding registers
-            result = plc_client.read_holding_registers(REG_BOTTLE_COUNT, 4, unit=1)
+            with read_latency.time():
+                result = plc_client.read_holding_registers(REG_BOTTLE_COUNT, 4, unit=1)
             
             if result.isError():
-                print(f"⚠️  Modbus read error: {result}")
+                throughput.add("errors")
+                poll_errors.labels("modbus").inc()
+                if sampler.enabled("modbus_error", logging.WARNING):
+                    log.warning("⚠️  Modbus read error: %s", result)
                 time.sleep(POLL_INTERVAL)
                 continue
 
@@ -186,17 +217,22 @@ try:
             result = mqtt_client.publish(MQTT_TOPIC, payload, qos=1, retain=False)
             
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print(f"⏰ {data['timestamp']} | "
-                      f"[{MACHINE_ID}] | "
-                      f"Bottles: {bottle_count} | "
-                      f"Speed: {filler_speed:.2f} | "
-                      f"Running: {line_running} | "
-                      f"→ {MQTT_BROKER}")
+                throughput.add("messages")
+                published.inc()
+                if sampler.enabled("published"):
+                    log.info("⏰ %s | [%s] | Bottles: %s | Speed: %.2f | Running: %s | → %s",
+                             data['timestamp'], MACHINE_ID, bottle_count, filler_speed, line_running, MQTT_BROKER)
             else:
-                print(f"⚠️  MQTT publish error: {result.rc}")
+                throughput.add("errors")
+                poll_errors.labels("publish").inc()
+                if sampler.enabled("publish_error", logging.WARNING):
+                    log.warning("⚠️  MQTT publish error: %s", result.rc)
 
         except Exception as e:
-            print(f"⚠️  Error reading Modbus: {e}")
+            throughput.add("errors")
+            poll_errors.labels("modbus").inc()
+            if sampler.enabled("modbus_error", logging.WARNING):
+                log.warning("⚠️  Error reading Modbus: %s", e)
         
         time.sleep(POLL_INTERVAL)
 
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Create the downtime summary bucket written by downtime_summary/downtime_summary.py
+Optional retention: DOWNTIME_SUMMARY_RETENTION="730d" (default: keep forever)
+"""
+import os
+from influxdb_client import InfluxDBClient, BucketRetentionRules
+from influxdb_client.client.exceptions import InfluxDBError
+
+# Load .env file if it exists
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+INFLUXDB_URL = os.getenv("INFLUXDB_URL", "http://localhost:8086")
+INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN", "my-super-secret-auth-token")
+INFLUXDB_ORG = os.getenv("INFLUXDB_ORG", "myorg")
+BUCKET_NAME = os.getenv("DOWNTIME_SUMMARY_BUCKET", "downtime_summary")
+RETENTION = os.getenv("DOWNTIME_SUMMARY_RETENTION", "").strip()
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+print(f"🔗 Connecting to InfluxDB at {INFLUXDB_URL}...")
+try:
+    client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
+    buckets_api = client.buckets_api()
+
+    rules = []
+    if RETENTION:
+        rules.append(BucketRetentionRules(type="expire", every_seconds=int(RETENTION[:-1]) * UNITS[RETENTION[-1]]))
+
+    if buckets_api.find_bucket_by_name(BUCKET_NAME):
+        print(f"✅ Bucket '{BUCKET_NAME}' already exists")
+    else:
+        print(f"📦 Creating bucket '{BUCKET_NAME}' (retention: {RETENTION or 'forever'})...")
+        try:
+            buckets_api.create_bucket(bucket_name=BUCKET_NAME, retention_rules=rules, org=INFLUXDB_ORG)
+            print(f"✅ Bucket '{BUCKET_NAME}' created successfully")
+        except InfluxDBError as e:
+            if "already exists" in str(e).lower() or "duplicate" in str(e).lower():
+                print(f"✅ Bucket '{BUCKET_NAME}' already exists")
+            else:
+                print(f"❌ Error creating bucket: {e}")
+                raise
+
+    client.close()
+except Exception as e:
+    print(f"❌ Error: {e}")
+    exit(1)
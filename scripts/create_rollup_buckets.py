@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Create the rollup buckets written by the InfluxDB writer (ROLLUPS_ENABLED=true)
+One bucket per window: <ROLLUP_BUCKET_PREFIX>_1m, _5m, _1h
+Optional retention per window: ROLLUP_RETENTION="1m=30d,5m=365d" (default: keep forever)
+"""
+import os
+from influxdb_client import InfluxDBClient, BucketRetentionRules
+from influxdb_client.client.exceptions import InfluxDBError
+
+# Load .env file if it exists
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+INFLUXDB_URL = os.getenv("INFLUXDB_URL", "http://localhost:8086")
+INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN", "my-super-secret-auth-token")
+INFLUXDB_ORG = os.getenv("INFLUXDB_ORG", "myorg")
+BUCKET_PREFIX = os.getenv("ROLLUP_BUCKET_PREFIX", os.getenv("INFLUXDB_BUCKET", "plc_data_new"))
+WINDOWS = [w.strip() for w in os.getenv("ROLLUP_WINDOWS", "1m,5m,1h").split(",") if w.strip()]
+RETENTION = dict(item.split("=", 1) for item in os.getenv("ROLLUP_RETENTION", "").split(",") if "=" in item)
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+print(f"🔗 Connecting to InfluxDB at {INFLUXDB_URL}...")
+try:
+    client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
+    buckets_api = client.buckets_api()
+
+    for window in WINDOWS:
+        bucket_name = f"{BUCKET_PREFIX}_{window}"
+        retention = RETENTION.get(window, "").strip()
+        rules = []
+        if retention:
+            rules.append(BucketRetentionRules(type="expire", every_seconds=int(retention[:-1]) * UNITS[retention[-1]]))
+
+        if buckets_api.find_bucket_by_name(bucket_name):
+            print(f"✅ Bucket '{bucket_name}' already exists")
+            continue
+
+        print(f"📦 Creating bucket '{bucket_name}' (retention: {retention or 'forever'})...")
+        try:
+            buckets_api.create_bucket(bucket_name=bucket_name, retention_rules=rules, org=INFLUXDB_ORG)
+            print(f"✅ Bucket '{bucket_name}' created successfully")
+        except InfluxDBError as e:
+            if "already exists" in str(e).lower() or "duplicate" in str(e).lower():
+                print(f"✅ Bucket '{bucket_name}' already exists")
+            else:
+                print(f"❌ Error creating bucket: {e}")
+                raise
+
+    client.close()
+except Exception as e:
+    print(f"❌ Error: {e}")
+    exit(1)
@@ -0,0 +1,59 @@
+"""
+Rollup Tests - Late samples must not rewrite a rollup window that was already written
+
+Run: python -m pytest tests/test_rollups.py
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from influxdb_writer.rollups import RollupAggregator, parse_windows
+from influxdb_writer.schema import INT
+
+CONVERTER = SimpleNamespace(fields=(SimpleNamespace(name="BottleCount", type=INT),))
+SERIES = "plc_data,machine_id=machine-01,machine_type=bottlefiller"
+
+
+def aggregator():
+    written = []
+    rollups = RollupAggregator(parse_windows("1m,5m"), lambda label, record: written.append((label, record)),
+                               precision="s", grace=10)
+    return rollups, written
+
+
+def test_sample_after_expire_is_dropped():
+    rollups, written = aggregator()
+    for i in range(10):
+        rollups.add(CONVERTER, SERIES, (float(i),), 1699999860 + i * 6)
+    rollups.expire(now=1699999920 + 11)
+    assert written == [("1m", f"{SERIES} count=10i,BottleCount_last=9i,BottleCount_max=9i,BottleCount_mean=4.5,"
+                              f"BottleCount_min=0i 1699999920".encode())]
+
+    rollups.add(CONVERTER, SERIES, (99.0,), 1699999890)  # In the 1m window expire() already wrote
+    rollups.flush()
+    assert [label for label, _ in written] == ["1m", "5m"]
+    assert b"count=10i" in written[1][1]
+    assert rollups.late_samples == 1
+
+
+def test_sample_in_written_coarser_window_is_dropped():
+    rollups, written = aggregator()
+    rollups.add(CONVERTER, SERIES, (1.0,), 1699999800)
+    rollups.expire(now=1700000100 + 11)  # Closes the 1m window, then the 5m window
+    assert [label for label, _ in written] == ["1m", "5m"]
+
+    rollups.add(CONVERTER, SERIES, (2.0,), 1699999900)  # New 1m window, but inside the written 5m one
+    rollups.flush()
+    assert [label for label, _ in written] == ["1m", "5m"]
+    assert rollups.late_samples == 1
+
+
+def test_later_samples_still_aggregate():
+    rollups, written = aggregator()
+    rollups.add(CONVERTER, SERIES, (1.0,), 1699999800)
+    rollups.expire(now=1700000100 + 11)
+    rollups.add(CONVERTER, SERIES, (2.0,), 1700000100)
+    rollups.flush()
+    assert [label for label, _ in written] == ["1m", "5m", "1m", "5m"]
+    assert rollups.late_samples == 0
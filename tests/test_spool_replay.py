@@ -0,0 +1,78 @@
+"""
+Spool Replay Tests - A batch InfluxDB rejects for good must not wedge the spool
+
+Run: python -m pytest tests/test_spool_replay.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from influxdb_writer.batch_writer import BatchWriter, is_retryable
+from influxdb_writer.spool import Spool
+
+
+class ApiError(Exception):
+    """Stands in for influxdb_client's ApiException (an HTTP status, or none without a response)"""
+
+    def __init__(self, status=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def rejecting(bad, status=400):
+    """write_fn that fails every payload containing `bad`, records the others"""
+    written = []
+
+    def write(payload, precision):
+        if bad in payload:
+            raise ApiError(status)
+        written.append(payload)
+    return write, written
+
+
+def test_is_retryable():
+    assert is_retryable(ConnectionError("refused"))
+    assert is_retryable(TimeoutError())
+    assert is_retryable(ApiError(503))
+    assert is_retryable(ApiError(429))
+    assert not is_retryable(ApiError(400))
+    assert not is_retryable(ApiError(422))
+
+
+def test_rejected_batch_does_not_wedge_replay(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=64)
+    spool.append(["m f=1i 1"], "s")
+    spool.append(["m f=\"text\" 2"], "s")  # Field type conflict
+    spool.append(["m f=3i 3"], "s")
+    write, written = rejecting(b"text")
+
+    assert spool.replay(write, retryable=is_retryable) == 2
+    assert written == [b"m f=1i 1", b"m f=3i 3"]
+    assert spool.empty()
+    assert spool.rejected_points == 1
+
+
+def test_unavailable_keeps_segment(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(["m f=1i 1"], "s")
+    write, written = rejecting(b"m", status=503)
+
+    try:
+        spool.replay(write, retryable=is_retryable)
+    except ApiError:
+        pass
+    assert not spool.empty()
+    assert spool.rejected_points == 0
+
+
+def test_rejected_batch_is_failed_not_spooled(tmp_path):
+    spool = Spool(str(tmp_path))
+    write, written = rejecting(b"text")
+    writer = BatchWriter(lambda records, precision: write("\n".join(records).encode(), precision),
+                         spool=spool, precision="s")
+
+    writer._flush(["m f=\"text\" 1"])
+    assert writer.online
+    assert writer.failed == 1
+    assert writer.spooled == 0
+    assert spool.empty()